@@ -0,0 +1,254 @@
+'''
+Benchmarks of the sample-to-upload cycle of code.py, run on the emulator.
+
+    python bench/cycle.py --output results.json
+    python bench/cycle.py --baseline results.json
+
+Every stage is measured on its own (sensor reads, building a row, JSON encoding,
+minting a token, the Sheets round trip, Sheets reads, MQTT publishes and SD appends),
+and then the whole cycle, across batch sizes and network latency profiles. The
+table goes to stderr, and the results go to --output or stdout as JSON. With
+--baseline the run fails if any result regressed.
+'''
+import argparse
+import contextlib
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'emulator'))
+
+from emulation import Emulation
+import hostsim
+import harness
+
+# Round trip times in seconds of the network profiles
+LATENCY_PROFILES = {'local': 0.0, 'wifi': 0.02, 'congested': 0.1}
+BATCH_SIZES = [1, 10, 50, 200]
+
+
+def build_row(ts: int, latest: dict) -> list:
+    '''
+    Builds a reading row the way record_reading in code.py does.
+
+    :param ts: The time of the reading.
+    :param latest: The latest value of each sensor.
+    :return: The row.
+    '''
+    temperatures = latest['temperature']
+    row = [
+        ts,
+        f'=EPOCHTODATE({ts} - 28800)',
+        f'{temperatures[0]:.2f}',
+        f'{latest["depth"]:.2f}',
+        f'{latest["ph"]:.2f}'
+    ]
+    row.extend(f'{temperature:.2f}' for temperature in temperatures[1:])
+    return row
+
+
+def parse_profiles(text: str) -> dict:
+    '''
+    Parses latency profiles given as 'name=seconds,...'.
+
+    :param text: The profiles.
+    :return: A dictionary of the round trip time of each profile.
+    '''
+    profiles = {}
+    for profile in text.split(','):
+        name, seconds = profile.split('=')
+        profiles[name.strip()] = float(seconds)
+    return profiles
+
+
+def run(suite: harness.Suite, emulation: Emulation, profiles: dict, batch_sizes: list) -> None:
+    '''
+    Runs every benchmark.
+
+    :param suite: The Suite to measure with.
+    :param emulation: The running Emulation.
+    :param profiles: The network latency profiles.
+    :param batch_sizes: The numbers of rows per upload.
+    '''
+    import board
+    from sdcard import SDCard
+    from readingqueue import ReadingQueue
+    from recordlog import RecordLog
+    from phsensor import PhSensor
+    from waterdepthsensor import WaterDepthSensor
+    from temperaturesensor import TemperatureSensor
+    from wifimanager import WiFiManager
+    from googlesheetsmanager import GoogleSheetsManager
+    from mqtt import MqttClient
+    from sinks import MqttSink
+
+    settings = hostsim.settings
+    sd_card = SDCard(board.SPI(), board.SD_CS, '/sd')
+    ph_sensor = PhSensor(board.A5, sd_card, 'ph_calibration.json', settings['ADC_SAMPLES'], settings['ADC_FILTER'])
+    depth_sensor = WaterDepthSensor(
+        board.A3, sd_card, 'water_depth_calibration.json', settings['ADC_SAMPLES'], settings['ADC_FILTER']
+    )
+    temp_sensor = TemperatureSensor(board.A4, 12)
+    wifi = WiFiManager()
+    wifi.connect(settings['CIRCUITPY_WIFI_SSID'], settings['CIRCUITPY_WIFI_PASSWORD'])
+    gsm = GoogleSheetsManager(
+        wifi,
+        settings['GOOGLE_SERVICE_ACCOUNT_PRIVATE_KEY'],
+        settings['GOOGLE_SERVICE_ACCOUNT_EMAIL'],
+        settings['GOOGLE_SERVICE_ACCOUNT_KID']
+    )
+    sheets_id = settings['GOOGLE_SHEETS_ID']
+    tab_id = settings['GOOGLE_SHEETS_TAB_ID']
+
+    # Sensor reads
+    suite.measure('sensor.read_ph', ph_sensor.read_ph, 200, {'samples': settings['ADC_SAMPLES']})
+    suite.measure('sensor.read_depth', depth_sensor.read_depth, 200, {'samples': settings['ADC_SAMPLES']})
+    for bits in (9, 12):
+        for index in range(len(temp_sensor.sensors)):
+            temp_sensor.set_resolution(index, bits)
+        suite.measure('sensor.read_temperature', temp_sensor.read_temperatures, 5, {'bits': bits}, alloc_runs=1)
+
+    latest = {
+        'temperature': temp_sensor.read_temperatures(),
+        'depth': depth_sensor.read_depth(),
+        'ph': ph_sensor.read_ph()
+    }
+    ts = hostsim.clock.time()
+
+    # Payload building and JSON encoding
+    suite.measure('payload.build_row', lambda: build_row(ts, latest), 2000)
+    for batch in batch_sizes:
+        rows = [build_row(ts + i, latest) for i in range(batch)]
+        data = {'values': rows}
+        suite.measure('payload.json_encode', lambda: json.dumps(data), max(2000 // batch, 10), {'batch': batch})
+
+    # Token minting
+    suite.measure('token.create_access_token', gsm.create_access_token, 3, alloc_runs=1)
+
+    # Sheets round trip, on a kept-alive connection
+    for profile, latency in profiles.items():
+        hostsim.network.latency = latency
+        for batch in batch_sizes:
+            rows = [build_row(ts + i, latest) for i in range(batch)]
+            suite.measure(
+                'sheets.write_to_sheet',
+                lambda: gsm.write_to_sheet(sheets_id, tab_id, 'A1', rows, append=True),
+                20, {'batch': batch, 'latency': profile}
+            )
+    hostsim.network.latency = 0.0
+
+    # Reads of a growing table: the whole table, only the row appended since the
+    # last read, and a range served from the cache
+    from sheetcache import SheetCache
+    reads_tab = f'{tab_id}_reads'
+    gsm.append_rows(sheets_id, reads_tab, [build_row(ts + i, latest) for i in range(200)])
+    table = emulation.sheets.sheets[sheets_id][reads_tab]
+    cache = SheetCache(gsm, ttl=3600)
+
+    def read_appended():
+        # Appended straight to the fake sheet, so that only the read is measured
+        table.append(build_row(hostsim.clock.time(), latest))
+        rows = cache.read_appended(sheets_id, reads_tab, 'A:E')
+        if len(table) > 201 and len(rows) != 1:
+            raise RuntimeError(f'read_appended returned {len(rows)} rows instead of the 1 appended')
+
+    suite.measure('sheets.read_table', lambda: list(gsm.read_from_sheet(sheets_id, reads_tab, 'A:E')), 20)
+    suite.measure('sheets.read_appended', read_appended, 20)
+    suite.measure('sheets.read_cached', lambda: cache.read(sheets_id, reads_tab, 'A1:E10'), 200)
+
+    # MQTT publishes of the same rows, on a kept-alive connection
+    mqtt_sink = MqttSink(MqttClient(wifi, 'mqtt.local'), 'bench')
+    for profile, latency in profiles.items():
+        hostsim.network.latency = latency
+        for batch in batch_sizes:
+            rows = [build_row(ts + i, latest) for i in range(batch)]
+            suite.measure(
+                'mqtt.publish_rows', lambda: mqtt_sink.write(None, rows), 20, {'batch': batch, 'latency': profile}
+            )
+    hostsim.network.latency = 0.0
+    mqtt_sink.close()
+
+    # SD appends
+    row = build_row(ts, latest)
+    line = json.dumps(row) + '\n'
+    queue = ReadingQueue(sd_card, 'bench_queue.txt', 'bench_queue.cur')
+    record_log = RecordLog(sd_card, 'bench_samples_')
+    suite.measure('sd.append_file', lambda: sd_card.append_file('bench_append.txt', line), 500)
+    suite.measure('sd.queue_put', lambda: queue.put(row), 500)
+    suite.measure(
+        'sd.record_log_append',
+        lambda: record_log.append(hostsim.clock.time(), ph_sensor.last_counts, depth_sensor.last_counts, 21.5),
+        500
+    )
+
+    # The whole cycle: sample every sensor, log the sample, queue a row and upload
+    # the queue every batch cycles
+    for index in range(len(temp_sensor.sensors)):
+        temp_sensor.set_resolution(index, 9)
+    for profile, latency in profiles.items():
+        hostsim.network.latency = latency
+        for batch in batch_sizes:
+            cycle_queue = ReadingQueue(sd_card, 'bench_cycle.txt', 'bench_cycle.cur')
+            cycle_queue.clear()
+            count = [0]
+
+            def cycle():
+                latest['ph'] = ph_sensor.read_ph()
+                latest['depth'] = depth_sensor.read_depth()
+                latest['temperature'] = temp_sensor.read_temperatures()
+                now = hostsim.clock.time()
+                record_log.append(now, ph_sensor.last_counts, depth_sensor.last_counts, latest['temperature'][0])
+                cycle_queue.put(build_row(now, latest))
+                count[0] += 1
+                if count[0] % batch == 0:
+                    cycle_queue.drain(lambda rows: gsm.append_rows(sheets_id, tab_id, rows))
+
+            suite.measure(
+                'cycle.full', cycle, max(batch, 20), {'batch': batch, 'latency': profile},
+                alloc_runs=batch, min_iterations=batch
+            )
+    hostsim.network.latency = 0.0
+    wifi.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the sample-to-upload cycle on the emulator.')
+    parser.add_argument('--output', help='file to write the results to as JSON, stdout by default')
+    parser.add_argument('--baseline', help='results to compare with; exits with 1 if anything regressed')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative regression, 0.2 by default')
+    parser.add_argument('--only', help='run only the benchmarks whose names start with this')
+    parser.add_argument('--quick', action='store_true', help='run a tenth of the iterations')
+    parser.add_argument('--profiles', default=','.join(f'{name}={seconds}' for name, seconds in LATENCY_PROFILES.items()),
+                        help='network latency profiles as name=seconds,...')
+    parser.add_argument('--batch-sizes', default=','.join(map(str, BATCH_SIZES)),
+                        help='rows per upload, comma separated')
+    args = parser.parse_args()
+
+    emulation = Emulation()
+    suite = harness.Suite([emulation.sheets, emulation.mqtt], args.only, args.quick)
+    print(harness.header(), file=sys.stderr)
+    try:
+        # The library's own messages go to stderr with the table, keeping stdout for the results
+        with contextlib.redirect_stdout(sys.stderr):
+            run(suite, emulation, parse_profiles(args.profiles), [int(size) for size in args.batch_sizes.split(',')])
+    finally:
+        emulation.close()
+
+    report = suite.report()
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        regressions = harness.compare(harness.load(args.baseline), report, args.threshold)
+        for name, metric, old, new in regressions:
+            print(f'REGRESSION {name} {metric}: {old} -> {new}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+'''
+Timing, allocation and traffic measurement for the benchmarks, and comparison
+of results against a saved baseline.
+'''
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# time.perf_counter is not replaced by the emulator, so it measures host time
+_clock = time.perf_counter
+
+
+def _percentile(values: list, fraction: float) -> float:
+    '''
+    Gets a percentile of sorted values by the nearest rank.
+
+    :param values: The values in ascending order.
+    :param fraction: The percentile as a fraction, e.g. 0.95.
+    :return: The value at the percentile.
+    '''
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+class Suite:
+    '''
+    A class to run benchmarks and collect their results.
+
+    Each benchmark is timed over a number of iterations, then run a few more
+    times under tracemalloc to measure the heap it allocates per iteration on
+    average, since tracing slows it down too much to time at the same time. The bytes the board sends
+    to the fake servers are counted for every benchmark.
+    '''
+
+    def __init__(self, servers: list = None, only: str = None, quick: bool = False, log=sys.stderr):
+        '''
+        Initializes the Suite class.
+
+        :param servers: Optional fake servers, e.g. FakeSheetsServer and FakeMqttBroker, whose
+                        received bytes are counted.
+        :param only: Optional prefix; benchmarks with other names are skipped.
+        :param quick: Whether to run a tenth of the iterations, at least one.
+        :param log: The stream the results are printed to as they finish.
+        '''
+        self.servers = servers or []
+        self.only = only
+        self.quick = quick
+        self.log = log
+        self.results = []
+
+    def measure(
+        self,
+        name: str,
+        function,
+        iterations: int,
+        params: dict = None,
+        alloc_runs: int = 3,
+        min_iterations: int = 1
+    ) -> dict:
+        '''
+        Measures a benchmark, after one warm-up call.
+
+        :param name: The name of the benchmark, e.g. 'sensor.read_ph'.
+        :param function: A function taking no arguments that runs one iteration.
+        :param iterations: The number of timed iterations.
+        :param params: Optional parameters of this run, e.g. {'batch': 10}.
+        :param alloc_runs: The number of iterations run under tracemalloc.
+        :param min_iterations: The fewest timed iterations and runs under tracemalloc, also in
+                               quick mode, e.g. a whole batch for a benchmark that uploads once a batch.
+        :return: The result, or None if the benchmark was skipped.
+        '''
+        if self.only and not name.startswith(self.only):
+            return None
+        if self.quick:
+            iterations = max(iterations // 10, min_iterations, 1)
+            alloc_runs = max(min(alloc_runs, 1), min_iterations)
+        function()
+
+        sent = self._received()
+        times = []
+        for _ in range(iterations):
+            start = _clock()
+            function()
+            times.append((_clock() - start) * 1000)
+        sent = (self._received() - sent) / iterations
+
+        peaks = []
+        retained = []
+        tracemalloc.start()
+        for _ in range(alloc_runs):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            function()
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+        tracemalloc.stop()
+
+        times.sort()
+        mean = sum(times) / len(times)
+        result = {
+            'name': name,
+            'params': params or {},
+            'iterations': iterations,
+            'mean_ms': round(mean, 4),
+            'median_ms': round(_percentile(times, 0.5), 4),
+            'p95_ms': round(_percentile(times, 0.95), 4),
+            'min_ms': round(times[0], 4),
+            'max_ms': round(times[-1], 4),
+            'per_second': round(1000 / mean, 2) if mean else None,
+            'bytes_sent': round(sent),
+            'alloc_peak_bytes': sum(peaks) // len(peaks),
+            'alloc_retained_bytes': sum(retained) // len(retained)
+        }
+        self.results.append(result)
+        if self.log:
+            print(format_row(result), file=self.log, flush=True)
+        return result
+
+    def _received(self) -> int:
+        '''
+        Gets the bytes received by the fake servers so far.
+
+        :return: The number of bytes.
+        '''
+        return sum(server.stats['bytes_in'] for server in self.servers)
+
+    def report(self) -> dict:
+        '''
+        Gets the results with a description of the machine and the commit they were measured on.
+
+        :return: A dictionary with 'meta' and 'results'.
+        '''
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'meta': {
+                'commit': commit,
+                'time': int(time.time()),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'platform': platform.platform(),
+                'quick': self.quick
+            },
+            'results': self.results
+        }
+
+
+def key(result: dict) -> str:
+    '''
+    Identifies a result by its name and parameters, e.g. 'sheets.write_to_sheet[batch=10,latency=wifi]'.
+
+    :param result: A result from Suite.measure.
+    :return: The key.
+    '''
+    params = ','.join(f'{name}={value}' for name, value in sorted(result['params'].items()))
+    return f'{result["name"]}[{params}]' if params else result['name']
+
+
+def format_row(result: dict) -> str:
+    '''
+    Formats a result as a line of the results table.
+
+    :param result: A result from Suite.measure.
+    :return: The line.
+    '''
+    return (
+        f'{key(result):<60}{result["median_ms"]:>12.3f}{result["p95_ms"]:>12.3f}'
+        f'{result["bytes_sent"]:>10}{result["alloc_peak_bytes"]:>12}'
+    )
+
+
+def header() -> str:
+    '''
+    Gets the heading of the results table.
+
+    :return: The heading line.
+    '''
+    return f'{"benchmark":<60}{"median ms":>12}{"p95 ms":>12}{"sent B":>10}{"peak B":>12}'
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.2, floor_ms: float = 0.05) -> list:
+    '''
+    Finds the results that got worse than in a baseline.
+
+    A result regresses if its median time grew by more than the threshold and by
+    more than floor_ms, or if it sends or allocates more bytes than the threshold
+    allows.
+
+    :param baseline: A report from Suite.report, e.g. loaded from a saved file.
+    :param current: The report to check.
+    :param threshold: The allowed relative increase, e.g. 0.2 for 20%.
+    :param floor_ms: The smallest time increase in milliseconds that counts.
+    :return: A list of (key, metric, baseline_value, current_value) tuples.
+    '''
+    previous = {key(result): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        if (result['median_ms'] > old['median_ms'] * (1 + threshold)
+                and result['median_ms'] - old['median_ms'] > floor_ms):
+            regressions.append((key(result), 'median_ms', old['median_ms'], result['median_ms']))
+        for metric in ('bytes_sent', 'alloc_peak_bytes'):
+            if result[metric] > old[metric] * (1 + threshold) and result[metric] - old[metric] > 64:
+                regressions.append((key(result), metric, old[metric], result[metric]))
+    return regressions
+
+
+def load(path: str) -> dict:
+    '''
+    Loads a saved report.
+
+    :param path: The path of the JSON file.
+    :return: The report.
+    '''
+    with open(path) as file:
+        return json.load(file)
@@ -4,62 +4,530 @@
 
 import os
 import time
-import board
-from wifimanager import WiFiManager
-from timesetter import TimeSetter
-from googlesheetsmanager import GoogleSheetsManager
-from sdcard import SDCard
-from waterdepthsensor import WaterDepthSensor
-from temperaturesensor import TemperatureSensor
-from phsensor import PhSensor
+from bootprofiler import BootProfiler
+
+# Record the time and heap taken by each import and constructor during boot
+profiler = BootProfiler()
+with profiler.step('import board, alarm, asyncio'):
+    import alarm
+    import asyncio
+    import board
+with profiler.step('import sdcard'):
+    from sdcard import SDCard
+with profiler.step('import readingqueue, recordlog, rollup'):
+    from readingqueue import ReadingQueue
+    from recordlog import RecordLog, FLAG_PH, FLAG_DEPTH, FLAG_TEMPERATURE
+    from rollup import Rollup
+with profiler.step('import reportfilter'):
+    from reportfilter import ReportFilter, parse_limits
+with profiler.step('import alarmmonitor'):
+    from alarmmonitor import AlarmMonitor
+with profiler.step('import sleepstate, tokencache'):
+    from tokencache import TokenCache
+    from sleepstate import SleepState, SleepTokenCache
+with profiler.step('import phsensor'):
+    from phsensor import PhSensor
+with profiler.step('import waterdepthsensor'):
+    from waterdepthsensor import WaterDepthSensor
+with profiler.step('import temperaturesensor'):
+    from temperaturesensor import TemperatureSensor
+with profiler.step('import wifimanager'):
+    from wifimanager import WiFiManager
+with profiler.step('import timesetter'):
+    from timesetter import TimeSetter
+with profiler.step('import googlesheetsmanager'):
+    from googlesheetsmanager import GoogleSheetsManager
+with profiler.step('import sinks'):
+    from sinks import SheetsSink, MqttSink, HubSink, FileSink, SinkGroup
+with profiler.step('import telemetry'):
+    from telemetry import Telemetry
+with profiler.step('import scheduler'):
+    from scheduler import Scheduler
+with profiler.step('import calibration'):
+    from calibration import ADC_VOLTS, ADC_COUNTS
+with profiler.step('import readinghistory'):
+    from readinghistory import ReadingHistory
+with profiler.step('import localserver'):
+    from localserver import LocalServer
+
+# Deep sleep between cycles instead of staying awake with the radio on
+deep_sleep = int(os.getenv('DEEP_SLEEP', 0))
+sleep_state = SleepState()
+# State kept in sleep memory when waking from deep sleep, empty after a cold boot
+warm = sleep_state.load() if deep_sleep and alarm.wake_alarm else {}
+
+def save_recent_runs(stage):
+    # Keep the stage runs that led up to the latest stage to start failing on the card,
+    # one "timestamp stage ms" line each, with -1 for a failed run
+    lines = [f'{time.time()} {stage} failed\n']
+    lines.extend(f'{ts} {name} {elapsed_ms}\n' for ts, name, elapsed_ms in telemetry.recent())
+    sd_card.write_file("recent_runs.txt", ''.join(lines))
+
+# Counters and stage timings, summarized to the diagnostics tab
+telemetry = Telemetry(on_failure=save_recent_runs)
+if 'telemetry' in warm:
+    telemetry.restore(warm['telemetry'])
 
 # Initialize the SD card
-sd_card = SDCard(board.SPI(), board.SD_CS, "/sd")
+with profiler.step('SDCard()'):
+    sd_card = SDCard(
+        board.SPI(), board.SD_CS, "/sd", telemetry, max_age=int(os.getenv('SD_FLUSH_AGE', 60))
+    )
+
+# Initialize the store-and-forward queue of readings waiting to be uploaded
+cursors = warm.get('cursors', {})
+queue = ReadingQueue(sd_card, "queue.txt", "queue.cur", cursors.get('queue'))
+
+# Initialize the binary log of every sample, with raw ADC counts for recalibration
+with profiler.step('RecordLog()'):
+    record_log = RecordLog(
+        sd_card,
+        "samples_",
+        int(os.getenv('LOG_SEGMENT_SIZE', 32768)),
+        int(os.getenv('LOG_MAX_BYTES', 16777216)),
+        int(os.getenv('LOG_COMPACT_BUCKET', 3600)),
+        telemetry=telemetry
+    )
+
+# Oversampling of the analog sensors
+adc_samples = int(os.getenv('ADC_SAMPLES', 16))
+adc_filter = os.getenv('ADC_FILTER', 'median')
+
+# Reference values used when a sensor has to be calibrated, e.g. "4,7,10"
+ph_references = [float(value) for value in os.getenv('PH_CALIBRATION_POINTS', '4,7,10').split(',')]
+depth_references = [float(value) for value in os.getenv('DEPTH_CALIBRATION_POINTS', '1,6,12').split(',')]
 
 # Initialize the pH sensor
-ph_sensor = PhSensor(board.A5, sd_card, "ph_calibration.json")
+with profiler.step('PhSensor()'):
+    ph_sensor = PhSensor(
+        board.A5, sd_card, "ph_calibration.json", adc_samples, adc_filter,
+        warm.get('ph_calibration'), ph_references
+    )
 # Initialize the water depth sensor
-water_depth_sensor = WaterDepthSensor(board.A3, sd_card, "water_depth_calibration.json")
-# Initailize the temperature sensor
-temp_sensor = TemperatureSensor(board.A4)
+with profiler.step('WaterDepthSensor()'):
+    water_depth_sensor = WaterDepthSensor(
+        board.A3, sd_card, "water_depth_calibration.json", adc_samples, adc_filter,
+        warm.get('depth_calibration'), depth_references
+    )
+# Resolution of every temperature probe, or of each probe in bus scan order, e.g. "12,9,9"
+temp_resolutions = [int(bits) for bits in str(os.getenv('TEMP_RESOLUTION', 12)).split(',')]
+# Initailize the temperature sensors
+with profiler.step('TemperatureSensor()'):
+    temp_sensor = TemperatureSensor(
+        board.A4, temp_resolutions[0] if len(temp_resolutions) == 1 else temp_resolutions
+    )
 
 # Connect to WiFi
-wifi = WiFiManager()
-print('Waiting for WiFi connection...')
-wifi.connect(
-    os.getenv('CIRCUITPY_WIFI_SSID'),
-    os.getenv('CIRCUITPY_WIFI_PASSWORD')
-)
-time.sleep(1)
-
-# Set the system time
-time_setter = TimeSetter(wifi, os.getenv('TZ_OFFSET'))
-time_setter.set_time()
-
-# Create an instance of the GoogleSheetsManager class
-gsm = GoogleSheetsManager(
-    wifi,
-    os.getenv('GOOGLE_SERVICE_ACCOUNT_PRIVATE_KEY'),
-    os.getenv('GOOGLE_SERVICE_ACCOUNT_EMAIL'),
-    os.getenv('GOOGLE_SERVICE_ACCOUNT_KID')
-)
-# Set the Google Sheets ID, Tab, and Cells
+wifi_ssid = os.getenv('CIRCUITPY_WIFI_SSID')
+wifi_password = os.getenv('CIRCUITPY_WIFI_PASSWORD')
+with profiler.step('WiFiManager()'):
+    wifi = WiFiManager(telemetry=telemetry)
+with profiler.step('TimeSetter()'):
+    time_setter = TimeSetter(wifi, os.getenv('TZ_OFFSET'))
+if warm:
+    # The clock was set before sleeping, so WiFi is only needed once an upload is due
+    time_setter.restore_time(warm['wake_at'])
+    time_setter.last_sync = warm.get('synced')
+else:
+    print('Waiting for WiFi connection...')
+    with profiler.step('WiFiManager.connect()'):
+        wifi.connect(wifi_ssid, wifi_password)
+    time.sleep(1)
+
+    # Set the system time
+    with profiler.step('TimeSetter.set_time()'):
+        time_setter.set_time()
+
+# Where the rows are written, e.g. "sheets,mqtt,file"
+sink_names = [name.strip() for name in os.getenv('SINKS', 'sheets').split(',') if name.strip()]
+
+# Create an instance of the GoogleSheetsManager class, unless the rows go elsewhere,
+# e.g. to a hub, so that no access token is ever created
+gsm = None
+if 'sheets' in sink_names:
+    token_cache = TokenCache(sd_card, "token.json")
+    with profiler.step('GoogleSheetsManager()'):
+        gsm = GoogleSheetsManager(
+            wifi,
+            os.getenv('GOOGLE_SERVICE_ACCOUNT_PRIVATE_KEY'),
+            os.getenv('GOOGLE_SERVICE_ACCOUNT_EMAIL'),
+            os.getenv('GOOGLE_SERVICE_ACCOUNT_KID'),
+            SleepTokenCache(warm, token_cache) if deep_sleep else token_cache,
+            telemetry
+        )
+# Set the Google Sheets ID and Tab
 sheets_id = os.getenv('GOOGLE_SHEETS_ID')
 tab_id = os.getenv('GOOGLE_SHEETS_TAB_ID')
-cells = 'A1:D1'
 
-while True:
+# The port a hub receives the rows of other monitors on, and leaves send them to
+hub_port = int(os.getenv('HUB_PORT', 5005))
+
+sink_list = []
+if 'sheets' in sink_names:
+    sink_list.append(SheetsSink(gsm, sheets_id, tab_id))
+# Seconds an idle connection to the broker is kept open, pinged at half of it between
+# uploads, or 0 to keep it open without pings
+mqtt_keepalive = int(os.getenv('MQTT_KEEPALIVE', 600))
+if 'mqtt' in sink_names:
+    from mqtt import MqttClient
+    sink_list.append(MqttSink(
+        MqttClient(
+            wifi,
+            os.getenv('MQTT_HOST'),
+            int(os.getenv('MQTT_PORT', 1883)),
+            os.getenv('MQTT_CLIENT_ID', 'hydroponic-monitor'),
+            os.getenv('MQTT_USERNAME'),
+            os.getenv('MQTT_PASSWORD'),
+            mqtt_keepalive,
+            bool(int(os.getenv('MQTT_TLS', 0)))
+        ),
+        os.getenv('MQTT_TOPIC', 'hydroponics')
+    ))
+if 'hub' in sink_names:
+    from hub import HubClient
+    sink_list.append(HubSink(
+        HubClient(wifi, os.getenv('HUB_HOST'), hub_port, os.getenv('NODE_ID') or tab_id or 'monitor')
+    ))
+if 'file' in sink_names:
+    sink_list.append(FileSink(
+        sd_card,
+        segment_size=int(os.getenv('LOG_SEGMENT_SIZE', 32768)),
+        max_bytes=int(os.getenv('FILE_SINK_MAX_BYTES', 4194304)),
+        telemetry=telemetry
+    ))
+required_sinks = os.getenv('SINKS_REQUIRED')
+sinks = SinkGroup(
+    sink_list,
+    None if required_sinks is None else [name.strip() for name in required_sinks.split(',')],
+    telemetry
+)
+# Only the file sink works without WiFi
+sinks_need_wifi = any(sink.name != 'file' for sink in sink_list)
+
+# Schedule in seconds
+sample_interval = int(os.getenv('SAMPLE_INTERVAL', 30))
+record_interval = int(os.getenv('RECORD_INTERVAL', 900))
+upload_interval = int(os.getenv('UPLOAD_INTERVAL', 900))
+time_sync_interval = int(os.getenv('TIME_SYNC_INTERVAL', 21600))
+telemetry_interval = int(os.getenv('TELEMETRY_INTERVAL', 3600))
+
+# Rollup tiers of temperature, depth and pH, e.g. "5m=300,1h=3600,1d=86400".
+# Finished buckets are queued for upload to the tab named "<tab>_<tier>".
+rollup_tiers = []
+for tier in os.getenv('ROLLUP_TIERS', '5m=300,1h=3600,1d=86400').split(','):
+    if tier:
+        name, seconds = tier.split('=')
+        rollup_tiers.append((name.strip(), int(seconds)))
+rollup = Rollup(rollup_tiers, 3)
+rollup.restore(warm.get('rollup', {}))
+rollup_queues = {
+    name: ReadingQueue(sd_card, f"rollup_{name}.txt", f"rollup_{name}.cur", cursors.get(name))
+    for name, _ in rollup_tiers
+}
+# Readings are only sent when a channel moves past its deadband, when nothing was sent
+# for the heartbeat interval, or right away when a channel moves past its excursion limit
+report_channels = ['temperature', 'depth', 'ph']
+report_deadbands = os.getenv('REPORT_DEADBAND', 'temperature=0.2,depth=0.25,ph=0.05')
+report_filter = None
+if report_deadbands:
+    report_filter = ReportFilter(
+        parse_limits(report_deadbands, report_channels),
+        int(os.getenv('REPORT_HEARTBEAT', 3600)),
+        parse_limits(os.getenv('REPORT_EXCURSION', 'temperature=2,depth=1,ph=0.5'), report_channels)
+    )
+    if warm.get('report'):
+        report_filter.restore(warm['report'])
+
+# Every sample is checked against alarm limits, and raised or cleared alarms are
+# uploaded right away to the tab "<tab>_alarms"
+alarm_monitor = AlarmMonitor(
+    report_channels,
+    int(os.getenv('ALARM_WINDOW', 20)),
+    parse_limits(os.getenv('ALARM_LOW', 'depth=2,ph=5'), report_channels),
+    parse_limits(os.getenv('ALARM_HIGH', 'temperature=30,ph=7.5'), report_channels),
+    parse_limits(os.getenv('ALARM_RATE', 'depth=0.5,ph=0.2'), report_channels),
+    float(os.getenv('ALARM_ZSCORE', 6)),
+    parse_limits(os.getenv('ALARM_NOISE', 'temperature=0.1,depth=0.05,ph=0.02'), report_channels)
+)
+if warm.get('alarms'):
+    alarm_monitor.restore(warm['alarms'])
+alarms_queue = ReadingQueue(sd_card, "alarms.txt", "alarms.cur", cursors.get('alarms'))
+
+# The low and high alarm limits can be changed in the tab "<tab>_setpoints", one row of
+# channel, low and high below a header, the last row of a channel winning. Every
+# setpoints_ttl seconds only the rows added since the last read are read from the sheet.
+setpoints_ttl = int(os.getenv('SETPOINTS_TTL', 300))
+sheet_cache = None
+setpoints = {}
+if gsm and setpoints_ttl:
+    from sheetcache import SheetCache
+    sheet_cache = SheetCache(gsm, setpoints_ttl, telemetry=telemetry)
+    if warm.get('setpoints'):
+        sheet_cache.restore(warm['setpoints']['tables'])
+        setpoints = warm['setpoints']['limits']
+        for channel, (low, high) in setpoints.items():
+            alarm_monitor.set_limits(channel, low, high)
+
+diagnostics_queue = ReadingQueue(sd_card, "diagnostics.txt", "diagnostics.cur", cursors.get('diagnostics'))
+# Queues uploaded to their own tab, named "<tab>_<name>"
+tab_queues = dict(rollup_queues)
+tab_queues['diagnostics'] = diagnostics_queue
+tab_queues['alarms'] = alarms_queue
+
+# A hub receives the rows of leaf monitors, which are uploaded with its own to the
+# tabs "<tab>_nodes" and "<tab>_nodes_<name>", with the name of the monitor after the date
+hub_listen = int(os.getenv('HUB_LISTEN', 0)) and not deep_sleep
+
+def node_queue(name):
+    if name not in tab_queues:
+        tab_queues[name] = ReadingQueue(sd_card, f"{name}.txt", f"{name}.cur")
+    return tab_queues[name]
+
+if hub_listen:
+    # Rows received before a restart are still waiting to be uploaded
+    for file_name in sd_card.list_files('', 'nodes'):
+        if file_name.endswith('.txt'):
+            node_queue(file_name[:-len('.txt')])
+
+# Latest value of each sensor, updated by the sampling tasks
+latest = {'temperature': None, 'depth': None, 'ph': None}
+
+# Recent samples kept in memory for the local HTTP server, which runs while the device stays awake
+local_http_port = int(os.getenv('LOCAL_HTTP_PORT', 80))
+history = ReadingHistory(int(os.getenv('HISTORY_SIZE', 240)), len(report_channels))
+
+def logged_readings(start, end):
+    # Samples older than the history, converted from the raw counts in the record log
+    for ts, ph_counts, depth_counts, temperature, flags in record_log.query(start, end):
+        yield [
+            ts,
+            temperature if flags & FLAG_TEMPERATURE else None,
+            water_depth_sensor.calibration.convert(depth_counts * ADC_VOLTS / ADC_COUNTS) if flags & FLAG_DEPTH else None,
+            ph_sensor.calibration.convert(ph_counts * ADC_VOLTS / ADC_COUNTS) if flags & FLAG_PH else None
+        ]
+
+def ensure_wifi():
+    if not wifi.is_connected():
+        wifi.reconnect(wifi_ssid, wifi_password)
+    return wifi.is_connected()
+
+def receive_rows(node, tab, rows):
+    node_tab_queue = node_queue('nodes' if tab is None else f'nodes_{tab}')
+    for row in rows:
+        node_tab_queue.put(row[:2] + [node] + row[2:])
+
+async def sample_ph():
+    latest['ph'] = ph_sensor.read_ph()
+
+async def sample_depth():
+    latest['depth'] = water_depth_sensor.read_depth()
+
+async def sample_temperature():
+    latest['temperature'] = await temp_sensor.read_temperatures_async()
+
+async def log_sample():
     ts = time.time()
-    try:
-        data = [[
+    if not profiler.marks:
+        profiler.mark('first sample logged')
+        report = profiler.report()
+        print(report)
+        if not warm:
+            sd_card.write_file("boot_profile.txt", report + '\n')
+    temperatures = latest['temperature']
+    temperature = temperatures[0] if temperatures else None
+    record_log.append(ts, ph_sensor.last_counts, water_depth_sensor.last_counts, temperature)
+    values = [temperature, latest['depth'], latest['ph']]
+    history.add(ts, values)
+    urgent = False
+    if report_filter and record_interval and None not in values:
+        # Send a significant excursion now rather than at the next reading and upload
+        if report_filter.check(ts, values, excursions_only=True):
+            telemetry.count('readings_excursion')
+            queue.put(reading_row(ts))
+            urgent = True
+    for channel, kind, raised, value, detail in alarm_monitor.update(ts, values):
+        print('Alarm', kind, channel, 'raised' if raised else 'cleared', value)
+        telemetry.count('alarms_raised' if raised else 'alarms_cleared')
+        alarms_queue.put([
             ts,
             f'=EPOCHTODATE({ts} - 28800)',
-            f'{temp_sensor.read_temperature():.2f}',
-            f'{water_depth_sensor.read_depth():.2f}',
-            f'{ph_sensor.read_ph():.2f}'
-        ]]
-        gsm.write_to_sheet(sheets_id, tab_id, cells, data, append=True)
-    except:
-        pass
-    # Update every 15 minutes
-    time.sleep(900)
+            channel,
+            kind,
+            'raised' if raised else 'cleared',
+            f'{value:.2f}',
+            '' if detail is None else f'{detail:.2f}'
+        ])
+        urgent = True
+    for name, bucket in rollup.add(ts, values):
+        start, count = bucket[0], bucket[1]
+        row = [start, f'=EPOCHTODATE({start} - 28800)', count]
+        row.extend('' if value is None else f'{value:.2f}' for value in bucket[2:])
+        rollup_queues[name].put(row)
+    if urgent:
+        await upload_readings()
+
+def reading_row(ts):
+    temperatures = latest['temperature']
+    row = [
+        ts,
+        f'=EPOCHTODATE({ts} - 28800)',
+        f'{temperatures[0]:.2f}',
+        f'{latest["depth"]:.2f}',
+        f'{latest["ph"]:.2f}'
+    ]
+    # Any additional temperature probes go after the original columns
+    row.extend(f'{temperature:.2f}' for temperature in temperatures[1:])
+    return row
+
+async def record_reading():
+    if None in latest.values():
+        return
+    ts = time.time()
+    if report_filter:
+        reason = report_filter.check(ts, [latest['temperature'][0], latest['depth'], latest['ph']])
+        if not reason:
+            telemetry.count('readings_suppressed')
+            return
+        telemetry.count(f'readings_{reason}')
+    queue.put(reading_row(ts))
+
+async def upload_readings():
+    # Send everything that is waiting once the network is available, the alarms first
+    uploaded = time.time()
+    pending = [('alarms', alarms_queue), (None, queue)]
+    pending.extend((name, tab_queue) for name, tab_queue in tab_queues.items() if name != 'alarms')
+    pending = [(name, tab_queue) for name, tab_queue in pending if tab_queue.pending()]
+    if pending:
+        if sinks_need_wifi and not ensure_wifi():
+            return
+        # A tab that fails, e.g. one missing from the sheet, does not hold up the others
+        failed = []
+        for name, tab_queue in pending:
+            try:
+                sent = sinks.drain(tab_queue, name)
+            except Exception as e:
+                print(f'Uploading {name or "readings"} failed:', e)
+                telemetry.count('upload_failures')
+                failed.append(name or 'readings')
+                continue
+            telemetry.count('rows_uploaded', sent)
+            if name is None:
+                print('Uploaded', sent, 'readings', wifi.stats())
+        if failed:
+            raise Exception(f'Failed to upload {", ".join(failed)}')
+    # Everything logged before the upload has been sent, so those samples can be compacted
+    record_log.compact(uploaded)
+
+async def apply_setpoints():
+    if not ensure_wifi():
+        return
+    for row in sheet_cache.read_appended(sheets_id, f'{tab_id}_setpoints', 'A:C', first_row=2):
+        if row and row[0] in report_channels:
+            low, high = (row[1:] + ['', ''])[:2]
+            setpoints[row[0]] = [float(low) if low else None, float(high) if high else None]
+            alarm_monitor.set_limits(row[0], *setpoints[row[0]])
+
+async def maintain_wifi():
+    ensure_wifi()
+
+async def maintain_token():
+    # Renew the access token while idle so it stays valid past the next upload
+    gsm.refresh_access_token(margin=upload_interval + 300)
+
+async def maintain_time():
+    if ensure_wifi() and not time_setter.set_time():
+        telemetry.count('time_sync_failures')
+
+async def flush_sd():
+    # Write the buffered samples, then sync appended data once it is old enough,
+    # even for files that are no longer appended to
+    record_log.flush()
+    sd_card.flush(sd_card.max_age)
+
+async def report_telemetry():
+    # Queue a summary of the last period for the diagnostics tab and start a new one
+    diagnostics_queue.put(telemetry.row(time.time()))
+    telemetry.reset()
+
+async def keep_sinks_alive():
+    sinks.keep_alive()
+
+scheduler = Scheduler(telemetry)
+scheduler.every(sample_interval, sample_ph)
+scheduler.every(sample_interval, sample_depth)
+scheduler.every(sample_interval, sample_temperature)
+if sheet_cache:
+    scheduler.every(setpoints_ttl, apply_setpoints, delay=1)
+scheduler.every(sample_interval, log_sample, delay=2)
+if record_interval:
+    scheduler.every(record_interval, record_reading, delay=5)
+scheduler.every(upload_interval, upload_readings, delay=10)
+if not deep_sleep:
+    scheduler.every(60, maintain_wifi, delay=60)
+if gsm:
+    scheduler.every(300, maintain_token, delay=15)
+if 'mqtt' in sink_names and mqtt_keepalive and not deep_sleep:
+    scheduler.every(mqtt_keepalive / 2, keep_sinks_alive, delay=mqtt_keepalive / 2)
+scheduler.every(time_sync_interval, maintain_time, delay=time_sync_interval)
+if sd_card.max_age and not deep_sleep:
+    scheduler.every(sd_card.max_age, flush_sd, delay=sd_card.max_age)
+if telemetry_interval:
+    scheduler.every(telemetry_interval, report_telemetry, delay=telemetry_interval)
+
+if deep_sleep:
+    # Run whatever is due in this wake, then sleep until the next job is due
+    last_runs = warm.get('jobs', {})
+    if time_setter.last_sync and 'maintain_time' not in last_runs:
+        last_runs['maintain_time'] = time_setter.last_sync
+    asyncio.run(scheduler.run_due(last_runs))
+    record_log.flush()
+
+    sleep_seconds = max(scheduler.next_due(last_runs), 1)
+    cursors = {name: tab_queue.state() for name, tab_queue in tab_queues.items()}
+    cursors['queue'] = queue.state()
+    warm.update({
+        'wake_at': int(time.time() + sleep_seconds),
+        'synced': time_setter.last_sync,
+        'jobs': last_runs,
+        'cursors': cursors,
+        'rollup': rollup.state(),
+        'telemetry': telemetry.state(),
+        'report': report_filter.state() if report_filter else None,
+        'alarms': alarm_monitor.state(),
+        'setpoints': {'tables': sheet_cache.state(), 'limits': setpoints} if sheet_cache else None,
+        'ph_calibration': ph_sensor.calibration_data,
+        'depth_calibration': water_depth_sensor.calibration_data
+    })
+    # Drop what can be rebuilt, least useful first, until the state fits
+    for optional in (None, 'telemetry', 'report', 'alarms'):
+        if optional:
+            warm.pop(optional, None)
+        try:
+            sleep_state.save(warm)
+            break
+        except ValueError as e:
+            print('Failed to save sleep state:', e)
+    else:
+        # The state of the previous wake would bring back stale cursors and job times
+        sleep_state.clear()
+    sinks.close()
+    # Nothing buffered survives deep sleep
+    sd_card.close()
+    if wifi.is_connected():
+        wifi.disconnect()
+    time_alarm = alarm.time.TimeAlarm(monotonic_time=time.monotonic() + sleep_seconds)
+    alarm.exit_and_deep_sleep_until_alarms(time_alarm)
+else:
+    if local_http_port:
+        local_server = LocalServer(
+            wifi, history, report_channels, logged_readings, local_http_port, telemetry=telemetry
+        )
+        scheduler.background(local_server.serve, 'local_server')
+    if hub_listen:
+        from hub import HubServer
+        hub_server = HubServer(
+            wifi, receive_rows, hub_port, tuple(rollup_queues) + ('diagnostics', 'alarms'),
+            flush=upload_readings, telemetry=telemetry
+        )
+        scheduler.background(hub_server.serve, 'hub_server')
+    scheduler.run()
@@ -0,0 +1,211 @@
+'''
+Sets up the simulated board, the fake cloud services and the settings, and
+runs the real code.py on them.
+'''
+import json
+import os
+import runpy
+import signal
+import sys
+import tempfile
+import time
+import tracemalloc
+
+EMULATOR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(EMULATOR)
+
+# The stand-in modules take the place of the CircuitPython ones, and lib/ is on
+# the path as on the board
+for path in (os.path.join(ROOT, 'lib'), EMULATOR, os.path.join(EMULATOR, 'modules')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import hostsim
+import fakecloud
+
+# CircuitPython's hashlib has no md5 or sha3, so on the board adafruit_hashlib
+# falls back to its pure Python hashes, which also accept strings. Hiding the
+# host hashlib while it is imported makes it do the same here.
+_hashlib = sys.modules.pop('hashlib', None)
+sys.modules['hashlib'] = None
+try:
+    import adafruit_hashlib
+finally:
+    sys.modules['hashlib'] = _hashlib
+    if _hashlib is None:
+        del sys.modules['hashlib']
+
+# Modules that stay loaded across a simulated deep sleep. Everything imported
+# by code.py after these is unloaded, like the VM reset on the board.
+import asyncio
+import ssl
+
+
+class Emulation:
+    '''
+    A simulated board with a pH probe on A5, a water depth sensor on A3, DS18B20
+    probes on a OneWire bus on A4 and an SD card, on a network with a fake Sheets
+    API, NTP server and MQTT broker.
+
+    The sensors follow slow sine waves around the given values. Replace the
+    waveforms in hostsim.device to script anything else, e.g.
+    hostsim.device.analog['A5'].waveform = lambda t: hostsim.ph_volts(hostsim.steps(...)(t)).
+    '''
+
+    def __init__(
+        self,
+        settings_file: str = None,
+        sd_directory: str = None,
+        work_directory: str = None,
+        ph: float = 6.2,
+        depth: float = 8.0,
+        temperature: float = 21.0,
+        probes: int = 2,
+        noise: float = 0.002
+    ):
+        '''
+        Initializes the Emulation class, starting the fake servers.
+
+        :param settings_file: Optional settings.toml, emulator/settings.toml by default.
+        :param sd_directory: Optional host directory for the SD card, a new temporary one by default.
+        :param work_directory: Optional directory for the TLS key and certificate, kept between
+                               runs so the key is only generated once.
+        :param ph: The mean pH of the solution.
+        :param depth: The mean water depth in inches.
+        :param temperature: The mean water temperature in Celsius.
+        :param probes: The number of temperature probes on the bus.
+        :param noise: The standard deviation of the analog noise in volts.
+        '''
+        self.work_directory = work_directory or os.path.join(tempfile.gettempdir(), 'hydroponic-emulator')
+        self.sd_directory = sd_directory or tempfile.mkdtemp(prefix='sd-')
+        self.credentials = fakecloud.make_credentials(self.work_directory)
+
+        hostsim.settings.clear()
+        hostsim.settings.update(hostsim.load_settings(settings_file or os.path.join(EMULATOR, 'settings.toml')))
+        hostsim.settings['GOOGLE_SERVICE_ACCOUNT_PRIVATE_KEY'] = self.credentials['private_key']
+        hostsim.network.ssid = hostsim.settings.get('CIRCUITPY_WIFI_SSID')
+        hostsim.network.password = hostsim.settings.get('CIRCUITPY_WIFI_PASSWORD')
+        # The board trusts the certificate of the fake Sheets API like a real one
+        os.environ['SSL_CERT_FILE'] = self.credentials['cert_file']
+        hostsim.install()
+
+        device = hostsim.device
+        device.analog['A5'] = hostsim.AnalogChannel(
+            lambda t: hostsim.ph_volts(ph + 0.1 * hostsim.sine(0, 1, 3600)(t)), noise
+        )
+        device.analog['A3'] = hostsim.AnalogChannel(
+            lambda t: hostsim.depth_volts(depth + 0.25 * hostsim.sine(0, 1, 86400)(t)), noise
+        )
+        device.onewire['A4'] = [
+            hostsim.SimProbe(hostsim.sine(temperature + 0.5 * index, 1.5, 86400), index + 1)
+            for index in range(probes)
+        ]
+        hostsim.storage.directory = self.sd_directory
+        self.seed_calibration()
+
+        self.sheets = fakecloud.FakeSheetsServer(self.credentials)
+        # The alarm limits read from the sheet when SETPOINTS_TTL is set
+        tab = hostsim.settings.get('GOOGLE_SHEETS_TAB_ID')
+        self.sheets.sheets[hostsim.settings.get('GOOGLE_SHEETS_ID')] = {
+            f'{tab}_setpoints': [['channel', 'low', 'high'], ['depth', '4', ''], ['ph', '5.5', '7']]
+        }
+        self.ntp = fakecloud.FakeNtpServer()
+        self.mqtt = fakecloud.FakeMqttBroker()
+        self.sheets.start()
+        self.ntp.start()
+        self.mqtt.start()
+
+    def seed_calibration(self) -> None:
+        '''
+        Writes calibration files that match the simulated sensors to the SD card, unless
+        they already exist, so that code.py does not stop to ask for a calibration.
+        '''
+        files = {
+            'ph_calibration.json': (hostsim.ph_volts, 'PH_CALIBRATION_POINTS', '4,7,10'),
+            'water_depth_calibration.json': (hostsim.depth_volts, 'DEPTH_CALIBRATION_POINTS', '1,6,12')
+        }
+        os.makedirs(self.sd_directory, exist_ok=True)
+        for name, (volts, key, default) in files.items():
+            path = os.path.join(self.sd_directory, name)
+            if os.path.exists(path):
+                continue
+            references = [float(value) for value in hostsim.settings.get(key, default).split(',')]
+            with hostsim._real_open(path, 'w') as file:
+                json.dump({'points': [[volts(value), value] for value in references]}, file)
+
+    def run(self, duration: float = None, sleep_scale: float = 1.0, trace_heap: bool = False) -> None:
+        '''
+        Runs code.py from a cold boot, booting it again after every deep sleep.
+
+        :param duration: Optional time in seconds to run for, forever if None. With DEEP_SLEEP
+                         this is simulated time, which includes skipped sleep.
+        :param sleep_scale: The part of each deep sleep that is actually waited for, the rest
+                            is skipped by moving the clock forward. 0 skips sleep entirely.
+        :param trace_heap: Whether to trace allocations with tracemalloc so that gc.mem_free
+                           reports the heap used by the program.
+        '''
+        if trace_heap:
+            tracemalloc.start()
+        hostsim.clock.reset_rtc()
+        hostsim.device.wake_alarm = None
+        deadline = None if duration is None else hostsim.clock.monotonic() + duration
+        baseline = set(sys.modules)
+        code = os.path.join(ROOT, 'code.py')
+
+        def stop(signum, frame):
+            raise hostsim.Stop()
+        if duration is not None and not hostsim.settings.get('DEEP_SLEEP'):
+            signal.signal(signal.SIGALRM, stop)
+            signal.setitimer(signal.ITIMER_REAL, duration)
+
+        try:
+            while True:
+                try:
+                    runpy.run_path(code, run_name='__main__')
+                    return
+                except hostsim.DeepSleep as sleep:
+                    seconds = sleep.seconds()
+                    wake_alarm = sleep.alarms[0] if sleep.alarms else None
+                # Unload everything code.py imported, like the reset on waking from deep sleep
+                for name in set(sys.modules) - baseline:
+                    del sys.modules[name]
+                if deadline is not None and hostsim.clock.monotonic() + seconds >= deadline:
+                    return
+                print(f'--- deep sleep for {seconds:.1f} s ---')
+                if sleep_scale:
+                    time.sleep(seconds * sleep_scale)
+                hostsim.clock.advance(seconds * (1 - sleep_scale))
+                hostsim.device.wake_alarm = wake_alarm
+        except (hostsim.Stop, KeyboardInterrupt):
+            pass
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    def summary(self) -> dict:
+        '''
+        Gets the rows in each fake sheet, the messages of each MQTT topic and the
+        statistics of the fake servers, the network and the SD card.
+
+        :return: A dictionary of the results.
+        '''
+        return {
+            'rows': {
+                f'{spreadsheet_id}/{tab}': len(rows)
+                for spreadsheet_id, tabs in self.sheets.sheets.items()
+                for tab, rows in tabs.items()
+            },
+            'messages': {topic: len(messages) for topic, messages in self.mqtt.messages.items()},
+            'sheets': dict(self.sheets.stats),
+            'ntp': dict(self.ntp.stats),
+            'mqtt': dict(self.mqtt.stats),
+            'network': dict(hostsim.network.stats),
+            'sd': dict(hostsim.storage.stats)
+        }
+
+    def close(self) -> None:
+        '''
+        Stops the fake servers.
+        '''
+        self.sheets.stop()
+        self.ntp.stop()
+        self.mqtt.stop()
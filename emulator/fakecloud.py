@@ -0,0 +1,788 @@
+'''
+Fake Google Sheets, NTP and MQTT servers for the emulator.
+
+The Sheets server speaks HTTPS with keep-alive on a local port, checks the
+signature and lifetime of the self-signed JWT the board sends, and keeps the
+sheets in memory. Both servers can be slowed down or made to fail on demand,
+and count what they see.
+'''
+import base64
+import hashlib
+import http.server
+import json
+import os
+import random
+import re
+import select
+import shutil
+import socket
+import socketserver
+import ssl
+import struct
+import subprocess
+import threading
+import time
+from urllib.parse import unquote, urlsplit
+
+import hostsim
+
+# Seconds between the NTP era (1900) and the Unix epoch
+NTP_TO_UNIX_EPOCH = 2208988800
+
+# DER prefix of a SHA-256 DigestInfo in a PKCS#1 v1.5 signature
+_SHA256_PREFIX = bytes.fromhex('3031300d060960864801650304020105000420')
+
+SHEETS_HOST = 'sheets.googleapis.com'
+NTP_HOST = 'pool.ntp.org'
+MQTT_HOST = 'mqtt.local'
+
+
+def make_credentials(directory: str) -> dict:
+    '''
+    Creates an RSA key and a self-signed certificate for the fake Sheets API with
+    openssl, or reuses the ones already in the directory.
+
+    :param directory: The directory for key.pem and cert.pem.
+    :return: A dictionary with the 'cert_file' and 'key_file' paths, the service
+             account 'private_key' as the "n, e, d, p, q" string the board expects,
+             and the 'public_key' as an (n, e) tuple.
+    :raises RuntimeError: If openssl is not installed.
+    '''
+    openssl = shutil.which('openssl')
+    if openssl is None:
+        raise RuntimeError('The emulator needs openssl to create its TLS certificate')
+    os.makedirs(directory, exist_ok=True)
+    key_file = os.path.join(directory, 'key.pem')
+    cert_file = os.path.join(directory, 'cert.pem')
+    if not (os.path.exists(key_file) and os.path.exists(cert_file)):
+        subprocess.run([
+            openssl, 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '30',
+            '-keyout', key_file, '-out', cert_file, '-subj', f'/CN={SHEETS_HOST}',
+            '-addext', f'subjectAltName=DNS:{SHEETS_HOST},DNS:localhost'
+        ], check=True, capture_output=True)
+    text = subprocess.run(
+        [openssl, 'rsa', '-in', key_file, '-noout', '-text'],
+        check=True, capture_output=True, text=True
+    ).stdout
+    numbers = {}
+    for name, value in re.findall(r'^(\w+):\s*\n((?:\s+[0-9a-f:]+\n)+)', text, re.MULTILINE):
+        numbers[name] = int(re.sub(r'[\s:]', '', value), 16)
+    exponent = int(re.search(r'publicExponent: (\d+)', text).group(1))
+    n, d, p, q = (numbers[name] for name in ('modulus', 'privateExponent', 'prime1', 'prime2'))
+    return {
+        'cert_file': cert_file,
+        'key_file': key_file,
+        'private_key': f'{n}, {exponent}, {d}, {p}, {q}',
+        'public_key': (n, exponent)
+    }
+
+
+def _b64decode(data: str) -> bytes:
+    '''
+    Decodes unpadded base64url, as used in a JWT.
+
+    :param data: The encoded string.
+    :return: The decoded bytes.
+    '''
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _column_number(letters: str) -> int:
+    '''
+    Converts column letters to a 0-based column number, e.g. 'A' is 0 and 'AA' is 26.
+
+    :param letters: The column letters.
+    :return: The column number.
+    '''
+    number = 0
+    for letter in letters.upper():
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number - 1
+
+
+def _column_letters(number: int) -> str:
+    '''
+    Converts a 0-based column number to column letters.
+
+    :param number: The column number.
+    :return: The column letters.
+    '''
+    letters = ''
+    number += 1
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def _parse_range(range_name: str) -> tuple:
+    '''
+    Parses an A1 range like 'Sheet1!A2:E10', 'Sheet1!A:E' or 'Sheet1'.
+
+    :param range_name: The range.
+    :return: A (tab, first_row, first_column, last_row, last_column) tuple with
+             0-based numbers, None for an open end.
+    :raises ValueError: If the range cannot be parsed.
+    '''
+    tab, _, cells = range_name.partition('!')
+    tab = tab.strip("'")
+    if not cells:
+        return tab, 0, 0, None, None
+    ends = []
+    for cell in cells.split(':'):
+        match = re.fullmatch(r'([A-Za-z]*)(\d*)', cell)
+        if not match or not cell:
+            raise ValueError(f'Unable to parse range: {range_name}')
+        column, row = match.groups()
+        ends.append((int(row) - 1 if row else None, _column_number(column) if column else None))
+    first_row, first_column = ends[0]
+    last_row, last_column = ends[-1] if len(ends) > 1 else ends[0]
+    return tab, first_row or 0, first_column or 0, last_row, last_column
+
+
+class _SheetsHandler(http.server.BaseHTTPRequestHandler):
+    '''
+    Handles the requests on one connection to the fake Sheets API.
+    '''
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self) -> None:
+        super().setup()
+        self.request.do_handshake()
+        self.server.fake.stats['connections'] += 1
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.fake.verbose:
+            super().log_message(format, *args)
+
+    def handle_one_request(self) -> None:
+        # A dropped link ends the connection without an answer
+        if not hostsim.network.link_up:
+            self.close_connection = True
+            return
+        super().handle_one_request()
+
+    def do_GET(self) -> None:
+        self.server.fake.handle(self, 'GET')
+
+    def do_POST(self) -> None:
+        self.server.fake.handle(self, 'POST')
+
+    def do_PUT(self) -> None:
+        self.server.fake.handle(self, 'PUT')
+
+    def read_body(self) -> bytes:
+        '''
+        Reads the request body, sent with a Content-Length or chunked.
+
+        :return: The body.
+        '''
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if not size:
+                    self.rfile.readline()
+                    return bytes(body)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def reply(self, status: int, body: dict) -> None:
+        '''
+        Sends a JSON response.
+
+        :param status: The HTTP status.
+        :param body: The response body.
+        '''
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.fake.stats['bytes_out'] += len(data)
+
+
+class _TLSServer(http.server.ThreadingHTTPServer):
+    '''
+    An HTTP server that wraps each accepted connection in TLS. The handshake runs
+    in the connection's thread so a slow client does not hold up the others.
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple, context: ssl.SSLContext, fake: 'FakeSheetsServer'):
+        super().__init__(address, _SheetsHandler)
+        self.context = context
+        self.fake = fake
+
+    def get_request(self) -> tuple:
+        sock, address = self.socket.accept()
+        # Headers and body are written separately, which Nagle's algorithm would delay
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self.context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False), address
+
+    def handle_error(self, request, client_address) -> None:
+        if self.fake.verbose:
+            super().handle_error(request, client_address)
+
+
+class FakeSheetsServer:
+    '''
+    A fake of the Google Sheets API values endpoints: append, update, batchUpdate
+    and get.
+
+    Requests must carry a JWT signed with the service account key, for the Sheets
+    audience, that has not expired by world time. Tabs are created on first use
+    unless auto_create is False.
+
+    Failures can be injected with failure_rate (random 503 responses), fail_next
+    (the next requests get an error status) and drop_next (the next requests are
+    dropped without a response). Every response waits for delay seconds plus the
+    network round trip.
+    '''
+
+    def __init__(self, credentials: dict, port: int = 0):
+        '''
+        Initializes the FakeSheetsServer class.
+
+        :param credentials: The dictionary returned by make_credentials.
+        :param port: Optional port to listen on, any free port if 0.
+        '''
+        self.public_key = credentials['public_key']
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(credentials['cert_file'], credentials['key_file'])
+        self.server = _TLSServer(('127.0.0.1', port), context, self)
+        self.address = self.server.server_address
+        self.thread = None
+        self.sheets = {}
+        self.auto_create = True
+        self.delay = 0.0
+        self.failure_rate = 0.0
+        self.verbose = False
+        self._fail_statuses = []
+        self._drops = 0
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        '''
+        Clears the counters.
+        '''
+        self.stats = {
+            'connections': 0, 'requests': 0, 'errors': 0, 'dropped': 0,
+            'rows_written': 0, 'reads': 0, 'bytes_in': 0, 'bytes_out': 0
+        }
+
+    def start(self) -> None:
+        '''
+        Starts serving in a background thread and routes sheets.googleapis.com:443 to it.
+        '''
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        hostsim.network.route(SHEETS_HOST, 443, self.address)
+
+    def stop(self) -> None:
+        '''
+        Stops serving.
+        '''
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fail_next(self, count: int = 1, status: int = 503) -> None:
+        '''
+        Makes the next requests fail.
+
+        :param count: The number of requests to fail.
+        :param status: The HTTP status to fail them with.
+        '''
+        self._fail_statuses.extend([status] * count)
+
+    def drop_next(self, count: int = 1) -> None:
+        '''
+        Makes the server close the connection instead of answering the next requests.
+
+        :param count: The number of requests to drop.
+        '''
+        self._drops += count
+
+    def rows(self, spreadsheet_id: str, tab: str) -> list:
+        '''
+        Gets the rows of a tab.
+
+        :param spreadsheet_id: The ID of the spreadsheet.
+        :param tab: The name of the tab.
+        :return: The rows, an empty list if the tab does not exist.
+        '''
+        return self.sheets.get(spreadsheet_id, {}).get(tab, [])
+
+    def _authorize(self, header: str) -> str:
+        '''
+        Checks the bearer token of a request.
+
+        :param header: The Authorization header.
+        :return: None if the token is valid, otherwise the reason it is not.
+        '''
+        if not header.startswith('Bearer '):
+            return 'Request is missing required authentication credential.'
+        try:
+            header_b64, payload_b64, signature_b64 = header[7:].split('.')
+            payload = json.loads(_b64decode(payload_b64))
+            n, e = self.public_key
+            size = (n.bit_length() + 7) // 8
+            signature = int.from_bytes(_b64decode(signature_b64), 'big')
+            digest = _SHA256_PREFIX + hashlib.sha256(f'{header_b64}.{payload_b64}'.encode()).digest()
+            expected = b'\x00\x01' + b'\xff' * (size - 3 - len(digest)) + b'\x00' + digest
+            if pow(signature, e, n).to_bytes(size, 'big') != expected:
+                return 'Invalid JWT Signature.'
+        except (ValueError, TypeError):
+            return 'Invalid JWT.'
+        now = hostsim.clock.world_time()
+        if payload.get('aud') != f'https://{SHEETS_HOST}/':
+            return 'Invalid JWT audience.'
+        if payload.get('exp', 0) < now or payload.get('iat', 0) > now + 60:
+            return 'Invalid JWT: Token must be a short-lived token and in a reasonable timeframe.'
+        return None
+
+    def handle(self, request: _SheetsHandler, method: str) -> None:
+        '''
+        Answers one request.
+
+        :param request: The request handler.
+        :param method: The HTTP method.
+        '''
+        self.stats['requests'] += 1
+        body = request.read_body() if method != 'GET' else b''
+        # The request line, the headers and the blank line after them, then the body
+        self.stats['bytes_in'] += len(request.requestline) + 4 + len(body) + sum(
+            len(name) + len(value) + 4 for name, value in request.headers.items()
+        )
+        hostsim.network.delay()
+        if self.delay:
+            time.sleep(self.delay)
+
+        with self.lock:
+            if self._drops:
+                self._drops -= 1
+                self.stats['dropped'] += 1
+                request.close_connection = True
+                return
+            status = self._fail_statuses.pop(0) if self._fail_statuses else None
+        if status is None and self.failure_rate and random.random() < self.failure_rate:
+            status = 503
+        if status is not None:
+            return self._error(request, status, 'The service is currently unavailable.')
+
+        reason = self._authorize(request.headers.get('Authorization', ''))
+        if reason:
+            return self._error(request, 401, reason)
+
+        path = unquote(urlsplit(request.path).path)
+        match = re.fullmatch(r'/v4/spreadsheets/([^/]+)/values(?::(\w+)|/(.+))', path)
+        if not match:
+            return self._error(request, 404, 'Requested entity was not found.')
+        spreadsheet_id, call, range_name = match.groups()
+        try:
+            data = json.loads(body) if body else {}
+            with self.lock:
+                if call == 'batchUpdate' and method == 'POST':
+                    result = self._batch_update(spreadsheet_id, data)
+                elif range_name and range_name.endswith(':append') and method == 'POST':
+                    result = self._append(spreadsheet_id, range_name[:-7], data)
+                elif range_name and method == 'PUT':
+                    result = self._update(spreadsheet_id, range_name, data.get('values', []))
+                elif range_name and method == 'GET':
+                    self.stats['reads'] += 1
+                    result = self._get(spreadsheet_id, range_name)
+                else:
+                    return self._error(request, 404, 'Requested entity was not found.')
+        except (ValueError, KeyError) as e:
+            return self._error(request, 400, str(e))
+        request.reply(200, result)
+
+    def _error(self, request: _SheetsHandler, status: int, message: str) -> None:
+        '''
+        Sends an error in the format of the Google APIs.
+
+        :param request: The request handler.
+        :param status: The HTTP status.
+        :param message: The error message.
+        '''
+        self.stats['errors'] += 1
+        names = {400: 'INVALID_ARGUMENT', 401: 'UNAUTHENTICATED', 404: 'NOT_FOUND', 429: 'RESOURCE_EXHAUSTED'}
+        request.reply(status, {'error': {
+            'code': status, 'message': message, 'status': names.get(status, 'UNAVAILABLE')
+        }})
+
+    def _tab(self, spreadsheet_id: str, tab: str) -> list:
+        '''
+        Gets the rows of a tab for writing.
+
+        :param spreadsheet_id: The ID of the spreadsheet.
+        :param tab: The name of the tab.
+        :return: The rows of the tab.
+        :raises ValueError: If the tab does not exist and auto_create is False.
+        '''
+        tabs = self.sheets.setdefault(spreadsheet_id, {})
+        if tab not in tabs:
+            if not self.auto_create:
+                raise ValueError(f'Unable to parse range: {tab}')
+            tabs[tab] = []
+        return tabs[tab]
+
+    def _write(self, spreadsheet_id: str, range_name: str, values: list) -> dict:
+        '''
+        Writes values at the top left cell of a range.
+
+        :param spreadsheet_id: The ID of the spreadsheet.
+        :param range_name: The range in A1 notation.
+        :param values: The rows to write.
+        :return: The UpdateValuesResponse.
+        '''
+        tab, first_row, first_column, _, _ = _parse_range(range_name)
+        rows = self._tab(spreadsheet_id, tab)
+        width = 0
+        for offset, values_row in enumerate(values):
+            while len(rows) <= first_row + offset:
+                rows.append([])
+            row = rows[first_row + offset]
+            while len(row) < first_column + len(values_row):
+                row.append('')
+            row[first_column:first_column + len(values_row)] = values_row
+            width = max(width, len(values_row))
+        self.stats['rows_written'] += len(values)
+        last = f'{_column_letters(first_column + max(width, 1) - 1)}{first_row + max(len(values), 1)}'
+        return {
+            'spreadsheetId': spreadsheet_id,
+            'updatedRange': f'{tab}!{_column_letters(first_column)}{first_row + 1}:{last}',
+            'updatedRows': len(values),
+            'updatedColumns': width,
+            'updatedCells': sum(len(row) for row in values)
+        }
+
+    def _append(self, spreadsheet_id: str, range_name: str, data: dict) -> dict:
+        '''
+        Appends rows after the last row of the table in a range.
+
+        :param spreadsheet_id: The ID of the spreadsheet.
+        :param range_name: The range in A1 notation.
+        :param data: The ValueRange of the request.
+        :return: The AppendValuesResponse.
+        '''
+        tab, _, first_column, _, _ = _parse_range(range_name)
+        rows = self._tab(spreadsheet_id, tab)
+        end = len(rows)
+        while end and not any(cell != '' for cell in rows[end - 1]):
+            end -= 1
+        updates = self._write(spreadsheet_id, f'{tab}!{_column_letters(first_column)}{end + 1}', data['values'])
+        return {'spreadsheetId': spreadsheet_id, 'tableRange': f'{tab}!A1', 'updates': updates}
+
+    def _update(self, spreadsheet_id: str, range_name: str, values: list) -> dict:
+        '''
+        Writes rows to a range.
+
+        :param spreadsheet_id: The ID of the spreadsheet.
+        :param range_name: The range in A1 notation.
+        :param values: The rows to write.
+        :return: The UpdateValuesResponse.
+        '''
+        return self._write(spreadsheet_id, range_name, values)
+
+    def _batch_update(self, spreadsheet_id: str, data: dict) -> dict:
+        '''
+        Writes rows to several ranges.
+
+        :param spreadsheet_id: The ID of the spreadsheet.
+        :param data: The BatchUpdateValuesRequest.
+        :return: The BatchUpdateValuesResponse.
+        '''
+        responses = [self._write(spreadsheet_id, value_range['range'], value_range['values'])
+                     for value_range in data['data']]
+        return {
+            'spreadsheetId': spreadsheet_id,
+            'totalUpdatedRows': sum(response['updatedRows'] for response in responses),
+            'totalUpdatedCells': sum(response['updatedCells'] for response in responses),
+            'responses': responses
+        }
+
+    def _get(self, spreadsheet_id: str, range_name: str) -> dict:
+        '''
+        Reads a range. Values are returned as strings and trailing empty rows are left out.
+
+        :param spreadsheet_id: The ID of the spreadsheet.
+        :param range_name: The range in A1 notation.
+        :return: The ValueRange.
+        '''
+        tab, first_row, first_column, last_row, last_column = _parse_range(range_name)
+        if tab not in self.sheets.get(spreadsheet_id, {}):
+            raise ValueError(f'Unable to parse range: {range_name}')
+        rows = self.sheets[spreadsheet_id][tab]
+        end = len(rows) if last_row is None else min(last_row + 1, len(rows))
+        values = []
+        for row in rows[first_row:end]:
+            cells = row[first_column:None if last_column is None else last_column + 1]
+            values.append(['' if cell is None else str(cell) for cell in cells])
+        while values and not any(values[-1]):
+            values.pop()
+        result = {'range': range_name, 'majorDimension': 'ROWS'}
+        if values:
+            result['values'] = values
+        return result
+
+
+class FakeNtpServer:
+    '''
+    A fake NTP server answering with world time plus an optional offset.
+
+    Failures can be injected with failure_rate (requests are silently dropped),
+    and every answer waits for delay seconds.
+    '''
+
+    def __init__(self, port: int = 0):
+        '''
+        Initializes the FakeNtpServer class.
+
+        :param port: Optional UDP port to listen on, any free port if 0.
+        '''
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('127.0.0.1', port))
+        self.socket.settimeout(0.2)
+        self.address = self.socket.getsockname()
+        self.offset = 0.0
+        self.delay = 0.0
+        self.failure_rate = 0.0
+        self.running = False
+        self.thread = None
+        self.stats = {'requests': 0, 'dropped': 0}
+
+    def start(self) -> None:
+        '''
+        Starts serving in a background thread and routes pool.ntp.org:123 to it.
+        '''
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+        hostsim.network.route(NTP_HOST, 123, self.address)
+
+    def stop(self) -> None:
+        '''
+        Stops serving.
+        '''
+        self.running = False
+        self.thread.join()
+        self.socket.close()
+
+    def _serve(self) -> None:
+        '''
+        Answers requests until stopped.
+        '''
+        while self.running:
+            try:
+                packet, address = self.socket.recvfrom(512)
+            except (TimeoutError, OSError):
+                continue
+            self.stats['requests'] += 1
+            if len(packet) < 48 or not hostsim.network.link_up or (
+                self.failure_rate and random.random() < self.failure_rate
+            ):
+                self.stats['dropped'] += 1
+                continue
+            if self.delay:
+                time.sleep(self.delay)
+            now = hostsim.clock.world_time() + self.offset + NTP_TO_UNIX_EPOCH
+            seconds = int(now)
+            fraction = int((now - seconds) * 2 ** 32)
+            # Leap indicator 0, version 4, server mode, stratum 1, poll 2^6 seconds
+            reply = struct.pack(
+                '!BBbbII4sIIIIIIII', 0x24, 1, 6, -20, 0, 0, b'GPS\x00',
+                seconds, fraction, *struct.unpack_from('!II', packet, 40), seconds, fraction, seconds, fraction
+            )
+            self.socket.sendto(reply, address)
+
+
+class _MqttHandler(socketserver.BaseRequestHandler):
+    '''
+    Handles one MQTT connection for the FakeMqttBroker.
+    '''
+
+    def setup(self) -> None:
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.broker = self.server.broker
+        with self.broker.lock:
+            self.broker.stats['connections'] += 1
+
+    def receive(self, size: int) -> bytes:
+        '''
+        Receives exactly size bytes.
+
+        :param size: The number of bytes.
+        :return: The bytes, or None if the connection closed.
+        '''
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def receive_packet(self) -> tuple:
+        '''
+        Receives a packet.
+
+        :return: A tuple of the first byte and the rest of the packet, or None if the connection closed.
+        '''
+        first = self.receive(1)
+        if first is None:
+            return None
+        length = 0
+        shift = 0
+        while True:
+            byte = self.receive(1)
+            if byte is None:
+                return None
+            length |= (byte[0] & 0x7F) << shift
+            shift += 7
+            if not byte[0] & 0x80:
+                break
+        body = self.receive(length) if length else b''
+        if body is None:
+            return None
+        with self.broker.lock:
+            self.broker.stats['bytes_in'] += 2 + length
+        return first[0], body
+
+    def handle(self) -> None:
+        broker = self.broker
+        connected = False
+        while True:
+            if connected and keepalive:
+                # The broker drops a connection idle for one and a half keep-alive intervals
+                self.request.settimeout(keepalive * 1.5)
+            try:
+                packet = self.receive_packet()
+            except (TimeoutError, OSError):
+                return
+            if packet is None or not hostsim.network.link_up:
+                return
+            packet_type, body = packet
+            kind = packet_type & 0xF0
+            if kind == 0x10:
+                name_length = struct.unpack_from('!H', body)[0]
+                level, flags, keepalive = struct.unpack_from('!BBH', body, 2 + name_length)
+                fields = []
+                offset = 6 + name_length
+                while offset < len(body):
+                    field_length = struct.unpack_from('!H', body, offset)[0]
+                    fields.append(body[offset + 2:offset + 2 + field_length].decode())
+                    offset += 2 + field_length
+                code = 0
+                if body[2:2 + name_length] != b'MQTT' or level != 4:
+                    code = 1
+                elif broker.credentials and tuple(fields[1:3]) != broker.credentials:
+                    code = 5
+                hostsim.network.delay()
+                self.request.sendall(bytes((0x20, 2, 0, code)))
+                if code:
+                    return
+                connected = True
+                broker.client_ids.append(fields[0])
+            elif not connected:
+                return
+            elif kind == 0x30:
+                qos = (packet_type >> 1) & 0x03
+                topic_length = struct.unpack_from('!H', body)[0]
+                topic = body[2:2 + topic_length].decode()
+                offset = 2 + topic_length
+                packet_id = None
+                if qos:
+                    packet_id = struct.unpack_from('!H', body, offset)[0]
+                    offset += 2
+                with broker.lock:
+                    broker.stats['publishes'] += 1
+                    if broker._drops or (broker.failure_rate and random.random() < broker.failure_rate):
+                        broker._drops = max(broker._drops - 1, 0)
+                        broker.stats['dropped'] += 1
+                        return
+                    broker.messages.setdefault(topic, []).append(body[offset:].decode())
+                if broker.delay:
+                    time.sleep(broker.delay)
+                if qos:
+                    # Acknowledgements of a pipelined batch share one network round trip
+                    if not select.select([self.request], [], [], 0)[0]:
+                        hostsim.network.delay()
+                    self.request.sendall(struct.pack('!BBH', 0x40, 2, packet_id))
+            elif kind == 0xC0:
+                self.request.sendall(bytes((0xD0, 0)))
+            elif kind == 0xE0:
+                return
+
+
+class _MqttServer(socketserver.ThreadingTCPServer):
+    '''
+    A TCP server with a thread per MQTT connection.
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple, broker: 'FakeMqttBroker'):
+        super().__init__(address, _MqttHandler)
+        self.broker = broker
+
+
+class FakeMqttBroker:
+    '''
+    A fake MQTT 3.1.1 broker that keeps every published message in memory by topic.
+
+    It accepts CONNECT, PUBLISH with QoS 0 or 1, PINGREQ and DISCONNECT, and
+    refuses connections without the right user name and password if credentials
+    are set. Failures can be injected with failure_rate and drop_next, which drop
+    the connection on a publish without acknowledging it.
+    '''
+
+    def __init__(self, port: int = 0, credentials: tuple = None):
+        '''
+        Initializes the FakeMqttBroker class.
+
+        :param port: Optional port to listen on, any free port if 0.
+        :param credentials: Optional (username, password) tuple that clients must send.
+        '''
+        self.server = _MqttServer(('127.0.0.1', port), self)
+        self.address = self.server.server_address
+        self.credentials = credentials
+        self.thread = None
+        self.messages = {}
+        self.client_ids = []
+        self.delay = 0.0
+        self.failure_rate = 0.0
+        self._drops = 0
+        self.lock = threading.Lock()
+        self.stats = {'connections': 0, 'publishes': 0, 'dropped': 0, 'bytes_in': 0}
+
+    def start(self) -> None:
+        '''
+        Starts serving in a background thread and routes mqtt.local:1883 to it.
+        '''
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        hostsim.network.route(MQTT_HOST, 1883, self.address)
+
+    def stop(self) -> None:
+        '''
+        Stops serving.
+        '''
+        self.server.shutdown()
+        self.server.server_close()
+
+    def drop_next(self, count: int = 1) -> None:
+        '''
+        Makes the next publishes drop their connection without an acknowledgement.
+
+        :param count: The number of publishes to drop.
+        '''
+        with self.lock:
+            self._drops += count
@@ -0,0 +1,777 @@
+'''
+State of the simulated board, shared by the stand-in CircuitPython modules in
+emulator/modules and by the fake cloud services in fakecloud.py.
+
+The stand-ins only model the hardware: the clock, the analog inputs, the
+OneWire bus, the SD card, the WiFi radio and the network routes. The real
+network libraries (adafruit_requests, adafruit_connection_manager,
+adafruit_ntp, adafruit_jwt) run on top of them unchanged.
+'''
+import builtins
+import calendar
+import errno
+import gc
+import math
+import os
+import random
+import socket
+import ssl
+import time
+import tracemalloc
+
+# The host functions the simulation replaces, kept for the simulation itself
+_real_time = time.time
+_real_monotonic = time.monotonic
+_real_monotonic_ns = time.monotonic_ns
+_real_gmtime = time.gmtime
+_real_open = builtins.open
+_real_getenv = os.getenv
+_real_os = {name: getattr(os, name) for name in ('stat', 'listdir', 'remove', 'rename', 'mkdir', 'rmdir', 'statvfs')}
+
+# Time the RTC reports after a cold boot until it is set, 2000-01-01
+RTC_EPOCH = 946684800
+
+# Full scale of the simulated ADC in volts
+ADC_VOLTS = 3.3
+
+
+class DeepSleep(BaseException):
+    '''
+    Raised by alarm.exit_and_deep_sleep_until_alarms to end the program, the way the
+    board resets when it enters deep sleep. Runners catch it and boot code.py again.
+    '''
+
+    def __init__(self, alarms: tuple):
+        '''
+        Initializes the DeepSleep exception.
+
+        :param alarms: The alarms that wake the board.
+        '''
+        super().__init__('deep sleep')
+        self.alarms = alarms
+
+    def seconds(self) -> float:
+        '''
+        Gets the time until the first alarm goes off.
+
+        :return: The time in seconds, 0 if an alarm is already due.
+        '''
+        delays = []
+        for wake in self.alarms:
+            if getattr(wake, 'monotonic_time', None) is not None:
+                delays.append(wake.monotonic_time - clock.monotonic())
+            elif getattr(wake, 'epoch_time', None) is not None:
+                delays.append(wake.epoch_time - clock.time())
+        return max(min(delays), 0) if delays else 0
+
+
+class Stop(BaseException):
+    '''
+    Raised to stop a running emulation, e.g. when its duration is over.
+    '''
+
+
+class Clock:
+    '''
+    The simulated clock.
+
+    World time is the host time plus any sleep that was skipped with advance, and
+    is what the fake NTP and Sheets servers see. The board's time.time() is world
+    time plus the offset of its RTC, which starts at 2000-01-01 after a cold boot
+    like the real board and follows whatever rtc.RTC().datetime is set to.
+    '''
+
+    def __init__(self):
+        '''
+        Initializes the Clock class.
+        '''
+        self.warp = 0.0
+        self.rtc_offset = 0.0
+
+    def world_time(self) -> float:
+        '''
+        Gets the real time outside the board.
+
+        :return: The time in seconds since the epoch.
+        '''
+        return _real_time() + self.warp
+
+    def time(self) -> int:
+        '''
+        Gets the time of the board's RTC, in whole seconds like CircuitPython.
+
+        :return: The time in seconds since the epoch.
+        '''
+        return int(self.world_time() + self.rtc_offset)
+
+    def monotonic(self) -> float:
+        '''
+        Gets the board's monotonic time.
+
+        :return: The time in seconds.
+        '''
+        return _real_monotonic() + self.warp
+
+    def monotonic_ns(self) -> int:
+        '''
+        Gets the board's monotonic time in nanoseconds.
+
+        :return: The time in nanoseconds.
+        '''
+        return _real_monotonic_ns() + int(self.warp * 1000000000)
+
+    def set_time(self, timestamp: float) -> None:
+        '''
+        Sets the board's RTC.
+
+        :param timestamp: The new time in seconds since the epoch.
+        '''
+        self.rtc_offset = timestamp - self.world_time()
+
+    def reset_rtc(self) -> None:
+        '''
+        Resets the board's RTC to 2000-01-01, as after a power loss.
+        '''
+        self.set_time(RTC_EPOCH)
+
+    def advance(self, seconds: float) -> None:
+        '''
+        Moves world time and the board's clocks forward without waiting.
+
+        :param seconds: The time to skip in seconds.
+        '''
+        self.warp += seconds
+
+    def localtime(self, secs: float = None) -> 'time.struct_time':
+        '''
+        Converts a time to a struct_time. CircuitPython has no time zones, so this is UTC.
+
+        :param secs: Optional time in seconds since the epoch, the board's time if None.
+        :return: The time as a struct_time.
+        '''
+        return _real_gmtime(self.time() if secs is None else secs)
+
+
+# Scripted waveforms for the analog inputs and temperature probes. Each returns a
+# function of the simulated time in seconds since the simulation started.
+
+def constant(value: float):
+    '''
+    A waveform that never changes.
+
+    :param value: The value.
+    :return: The waveform.
+    '''
+    return lambda t: value
+
+
+def sine(mean: float, amplitude: float, period: float, phase: float = 0):
+    '''
+    A sine wave, e.g. a daily temperature cycle.
+
+    :param mean: The mean value.
+    :param amplitude: The amplitude of the wave.
+    :param period: The period in seconds.
+    :param phase: Optional phase in seconds.
+    :return: The waveform.
+    '''
+    return lambda t: mean + amplitude * math.sin(2 * math.pi * (t + phase) / period)
+
+
+def ramp(start: float, end: float, duration: float):
+    '''
+    A linear ramp that holds its end value once finished.
+
+    :param start: The value at time 0.
+    :param end: The value at the end of the ramp.
+    :param duration: The length of the ramp in seconds.
+    :return: The waveform.
+    '''
+    return lambda t: start + (end - start) * min(max(t / duration, 0), 1)
+
+
+def steps(points: list):
+    '''
+    A waveform that jumps to each value at its time and holds it, e.g. to script
+    an excursion.
+
+    :param points: A list of (time, value) tuples in ascending order of time.
+    :return: The waveform.
+    '''
+    def waveform(t):
+        value = points[0][1]
+        for start, step_value in points:
+            if t < start:
+                break
+            value = step_value
+        return value
+    return waveform
+
+
+def sequence(values: list, repeat: bool = True):
+    '''
+    A waveform that returns the next of a fixed list of values on every read,
+    regardless of the time.
+
+    :param values: The values to return in order.
+    :param repeat: Whether to start over after the last value, otherwise it is held.
+    :return: The waveform.
+    '''
+    position = [0]
+
+    def waveform(t):
+        index = position[0]
+        position[0] = index + 1
+        if repeat:
+            return values[index % len(values)]
+        return values[min(index, len(values) - 1)]
+    return waveform
+
+
+def ph_volts(ph: float) -> float:
+    '''
+    The output of the simulated analog pH probe, 0.18 V per pH unit around 1.5 V at pH 7.
+
+    :param ph: The pH of the solution.
+    :return: The probe voltage.
+    '''
+    return 1.5 + (7.0 - ph) * 0.18
+
+
+def depth_volts(depth: float) -> float:
+    '''
+    The output of the simulated water depth sensor, 0.2 V per inch above 0.3 V.
+
+    :param depth: The water depth in inches.
+    :return: The sensor voltage.
+    '''
+    return 0.3 + depth * 0.2
+
+
+class AnalogChannel:
+    '''
+    A simulated analog input.
+    '''
+
+    def __init__(self, waveform, noise: float = 0.0, bits: int = 12):
+        '''
+        Initializes the AnalogChannel class.
+
+        :param waveform: A function of the simulated time in seconds returning the input voltage.
+        :param noise: Optional standard deviation of Gaussian noise in volts.
+        :param bits: The resolution of the ADC. Values are scaled to 16 bits like CircuitPython.
+        '''
+        self.waveform = waveform
+        self.noise = noise
+        self.bits = bits
+        self.reads = 0
+
+    def value(self) -> int:
+        '''
+        Reads the input like analogio.AnalogIn.value.
+
+        :return: The reading in counts from 0 to 65535.
+        '''
+        self.reads += 1
+        volts = self.waveform(device.elapsed())
+        if self.noise:
+            volts += random.gauss(0, self.noise)
+        raw = int(volts / ADC_VOLTS * (1 << self.bits))
+        raw = min(max(raw, 0), (1 << self.bits) - 1)
+        return raw << (16 - self.bits)
+
+
+def crc8(data: bytes) -> int:
+    '''
+    Computes the Dallas/Maxim CRC-8 used on the OneWire bus.
+
+    :param data: The bytes to check.
+    :return: The CRC.
+    '''
+    crc = 0
+    for byte in data:
+        for _ in range(8):
+            mix = (crc ^ byte) & 0x01
+            crc >>= 1
+            if mix:
+                crc ^= 0x8C
+            byte >>= 1
+    return crc
+
+
+class SimProbe:
+    '''
+    A simulated DS18B20 temperature probe on a OneWire bus.
+
+    A conversion takes as long as on the real part at the current resolution.
+    Reading the scratchpad before it finishes returns the previous result, or
+    85.0 C after power on, as the real part does.
+    '''
+
+    # Conversion time in seconds at each resolution in bits
+    CONVERSION_TIME = {9: 0.09375, 10: 0.1875, 11: 0.375, 12: 0.750}
+
+    def __init__(self, waveform, serial: int = 1):
+        '''
+        Initializes the SimProbe class.
+
+        :param waveform: A function of the simulated time in seconds returning the temperature in Celsius.
+        :param serial: The serial number in the probe's ROM code.
+        '''
+        self.waveform = waveform
+        rom = bytes([0x28]) + serial.to_bytes(6, 'little')
+        self.rom = rom + bytes([crc8(rom)])
+        self.resolution = 12
+        self.alarm_high = 0x4B
+        self.alarm_low = 0x46
+        self.raw = 0x0550
+        self.pending = None
+        self.ready_at = 0.0
+        self.conversions = 0
+
+    def start_conversion(self) -> None:
+        '''
+        Starts a temperature conversion (Convert T, 0x44).
+        '''
+        self.conversions += 1
+        self.pending = self.waveform(device.elapsed())
+        self.ready_at = clock.monotonic() + self.CONVERSION_TIME[self.resolution]
+
+    def busy(self) -> bool:
+        '''
+        Checks if a conversion is in progress.
+
+        :return: True while converting.
+        '''
+        return self.pending is not None and clock.monotonic() < self.ready_at
+
+    def scratchpad(self) -> bytes:
+        '''
+        Reads the scratchpad (Read Scratchpad, 0xBE).
+
+        :return: The 9 scratchpad bytes including the CRC.
+        '''
+        if self.pending is not None and not self.busy():
+            # Bits below the resolution read as zero
+            mask = ~((1 << (12 - self.resolution)) - 1)
+            self.raw = int(round(self.pending * 16)) & mask & 0xFFFF
+            self.pending = None
+        config = ((self.resolution - 9) << 5) | 0x1F
+        data = bytes([
+            self.raw & 0xFF, self.raw >> 8, self.alarm_high, self.alarm_low, config, 0xFF, 0x0C, 0x10
+        ])
+        return data + bytes([crc8(data)])
+
+    def write_scratchpad(self, data: bytes) -> None:
+        '''
+        Writes the alarm and configuration registers (Write Scratchpad, 0x4E).
+
+        :param data: The TH, TL and configuration bytes.
+        '''
+        self.alarm_high, self.alarm_low, config = data[:3]
+        self.resolution = ((config >> 5) & 0x03) + 9
+
+
+class Device:
+    '''
+    The simulated peripherals of the board, keyed by pin name.
+    '''
+
+    def __init__(self):
+        '''
+        Initializes the Device class.
+        '''
+        self.analog = {}
+        self.onewire = {}
+        self.sleep_memory = bytearray(8192)
+        self.wake_alarm = None
+        self.start = _real_monotonic()
+        self.heap_size = 2 * 1024 * 1024
+
+    def elapsed(self) -> float:
+        '''
+        Gets the simulated time since the simulation started, the time used by waveforms.
+
+        :return: The time in seconds.
+        '''
+        return clock.monotonic() - self.start
+
+    def mem_free(self) -> int:
+        '''
+        Estimates the free heap for gc.mem_free. Allocations are only seen while
+        tracemalloc is tracing, otherwise the whole heap is reported free.
+
+        :return: The free heap in bytes.
+        '''
+        used = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        return max(self.heap_size - used, 0)
+
+
+class SimFile:
+    '''
+    A file on the simulated SD card, counting operations and adding the card's delays.
+    '''
+
+    def __init__(self, file, card: 'SDStorage'):
+        '''
+        Initializes the SimFile class.
+
+        :param file: The host file object.
+        :param card: The SDStorage the file is on.
+        '''
+        self.file = file
+        self.card = card
+
+    def read(self, *args):
+        '''Reads like the host file, counting the bytes.'''
+        data = self.file.read(*args)
+        self.card.count('reads', len(data))
+        return data
+
+    def readinto(self, buffer):
+        '''Reads into a buffer like the host file, counting the bytes.'''
+        size = self.file.readinto(buffer)
+        self.card.count('reads', size or 0)
+        return size
+
+    def readline(self, *args):
+        '''Reads a line like the host file, counting the bytes.'''
+        data = self.file.readline(*args)
+        self.card.count('reads', len(data))
+        return data
+
+    def write(self, data):
+        '''Writes like the host file, counting the bytes and waiting for the card.'''
+        self.card.count('writes', len(data))
+        return self.file.write(data)
+
+    def flush(self):
+        '''Flushes the host file, counting the flush.'''
+        self.card.count('flushes', 0)
+        return self.file.flush()
+
+    def close(self):
+        '''Closes the host file.'''
+        return self.file.close()
+
+    def __iter__(self):
+        for line in self.file:
+            self.card.count('reads', len(line))
+            yield line
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class SDStorage:
+    '''
+    The simulated SD card: a host directory mounted into the board's file system.
+
+    While a card is mounted, open and the os file functions map paths under the
+    mount point to the directory. Every operation is counted, and optional
+    delays model the time the card takes to open a file and to write a block.
+    '''
+
+    BLOCK_SIZE = 512
+
+    def __init__(self):
+        '''
+        Initializes the SDStorage class.
+        '''
+        self.directory = None
+        self.mounts = {}
+        self.open_delay = 0.0
+        self.block_delay = 0.0
+        self.stats = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        '''
+        Clears the operation counters.
+        '''
+        self.stats = {
+            'opens': 0, 'reads': 0, 'read_bytes': 0, 'writes': 0, 'write_bytes': 0,
+            'flushes': 0, 'stats': 0, 'removes': 0, 'listdirs': 0
+        }
+
+    def count(self, operation: str, size: int) -> None:
+        '''
+        Counts an operation and waits for the card if a delay is set.
+
+        :param operation: 'reads', 'writes' or 'flushes'.
+        :param size: The number of bytes read or written.
+        '''
+        self.stats[operation] += 1
+        if operation == 'reads':
+            self.stats['read_bytes'] += size
+        elif operation == 'writes':
+            self.stats['write_bytes'] += size
+            if self.block_delay:
+                time.sleep(self.block_delay * (size // self.BLOCK_SIZE + 1))
+
+    def mount(self, mount_point: str, directory: str) -> None:
+        '''
+        Mounts a host directory at a path of the board's file system.
+
+        :param mount_point: The path on the board, e.g. '/sd'.
+        :param directory: The host directory.
+        '''
+        os.makedirs(directory, exist_ok=True)
+        self.mounts[mount_point.rstrip('/')] = directory
+
+    def umount(self, mount_point: str) -> None:
+        '''
+        Unmounts a path of the board's file system.
+
+        :param mount_point: The path on the board.
+        '''
+        self.mounts.pop(mount_point.rstrip('/'), None)
+
+    def translate(self, path):
+        '''
+        Maps a path on the board to the host.
+
+        :param path: The path on the board.
+        :return: The host path, or None if the path is not on a mounted card.
+        '''
+        if not isinstance(path, str):
+            return None
+        for mount_point, directory in self.mounts.items():
+            if path == mount_point or path.startswith(mount_point + '/'):
+                return directory + path[len(mount_point):]
+        return None
+
+    def open(self, file, mode='r', *args, **kwargs):
+        '''
+        Opens a file, on the card if the path is under a mount point. Replaces builtins.open.
+        '''
+        host_path = self.translate(file)
+        if host_path is None:
+            return _real_open(file, mode, *args, **kwargs)
+        self.stats['opens'] += 1
+        if self.open_delay:
+            time.sleep(self.open_delay)
+        return SimFile(_real_open(host_path, mode, *args, **kwargs), self)
+
+    def _wrap(self, name: str, counter: str = None):
+        '''
+        Wraps an os function so that paths under a mount point map to the host.
+
+        :param name: The name of the os function.
+        :param counter: Optional name of the counter of calls on the card.
+        :return: The wrapped function.
+        '''
+        function = _real_os[name]
+
+        def wrapper(path, *args, **kwargs):
+            host_path = self.translate(path)
+            if host_path is None:
+                return function(path, *args, **kwargs)
+            if counter:
+                self.stats[counter] += 1
+            if args and isinstance(args[0], str):
+                # rename maps both paths
+                args = (self.translate(args[0]) or args[0],) + args[1:]
+            return function(host_path, *args, **kwargs)
+        return wrapper
+
+    def install(self) -> None:
+        '''
+        Routes open and the os file functions through the mounts.
+        '''
+        builtins.open = self.open
+        os.stat = self._wrap('stat', 'stats')
+        os.listdir = self._wrap('listdir', 'listdirs')
+        os.remove = self._wrap('remove', 'removes')
+        os.rename = self._wrap('rename')
+        os.mkdir = self._wrap('mkdir')
+        os.rmdir = self._wrap('rmdir')
+        os.statvfs = self._wrap('statvfs')
+
+
+class Network:
+    '''
+    The simulated WiFi network.
+
+    Host names are resolved to virtual addresses, and connections to a virtual
+    address and port are routed to a server on the host, e.g. a fake Sheets API
+    on a local port for sheets.googleapis.com:443. Names without a route do not
+    resolve, so the emulation never reaches the internet. Every connection and
+    datagram waits for the round trip latency, and nothing gets through while
+    the link is down.
+    '''
+
+    def __init__(self):
+        '''
+        Initializes the Network class.
+        '''
+        self.link_up = True
+        self.ssid = None
+        self.password = None
+        self.join_delay = 0.0
+        self.latency = 0.0
+        self.hosts = {'localhost': '127.0.0.1'}
+        self.routes = {}
+        self.stats = {'joins': 0, 'lookups': 0, 'connects': 0, 'tls_connects': 0, 'datagrams': 0}
+
+    def route(self, host: str, port: int, address: tuple) -> None:
+        '''
+        Routes connections to a host name and port to an address on the host.
+
+        :param host: The host name the board connects to.
+        :param port: The port the board connects to.
+        :param address: The (ip, port) tuple of the server on the host.
+        '''
+        if host not in self.hosts:
+            self.hosts[host] = f'10.0.0.{len(self.hosts) + 1}'
+        self.routes[(self.hosts[host], port)] = address
+
+    def join(self, ssid: str, password: str) -> None:
+        '''
+        Joins the network, like wifi.radio.connect.
+
+        :param ssid: The SSID.
+        :param password: The password.
+        :raises ConnectionError: If the link is down or the credentials are wrong.
+        '''
+        self.stats['joins'] += 1
+        if self.join_delay:
+            time.sleep(self.join_delay)
+        if not self.link_up or (self.ssid is not None and ssid != self.ssid):
+            raise ConnectionError('No network with that ssid')
+        if self.password is not None and password != self.password:
+            raise ConnectionError('Authentication failure')
+
+    def resolve(self, host: str) -> str:
+        '''
+        Resolves a host name to its virtual address.
+
+        :param host: The host name or address.
+        :return: The address.
+        :raises socket.gaierror: If the name has no route or the link is down.
+        '''
+        self.stats['lookups'] += 1
+        if not self.link_up:
+            raise socket.gaierror(-3, 'Temporary failure in name resolution')
+        if host in self.hosts:
+            return self.hosts[host]
+        if host in self.hosts.values():
+            return host
+        raise socket.gaierror(-2, 'Name or service not known')
+
+    def lookup(self, address: tuple) -> tuple:
+        '''
+        Maps an address the board connects to to the address on the host.
+
+        :param address: The (host, port) tuple the board uses.
+        :return: The (ip, port) tuple on the host.
+        :raises OSError: If the link is down or there is no route.
+        '''
+        host, port = address[:2]
+        if not self.link_up:
+            raise OSError(errno.ENETUNREACH, 'Network is unreachable')
+        ip = self.resolve(host)
+        if (ip, port) in self.routes:
+            return self.routes[(ip, port)]
+        if ip == '127.0.0.1':
+            return (ip, port)
+        raise OSError(errno.EHOSTUNREACH, 'No route to host')
+
+    def delay(self, round_trips: float = 1) -> None:
+        '''
+        Waits for the network latency.
+
+        :param round_trips: The number of round trips to wait for.
+        '''
+        if self.latency:
+            time.sleep(self.latency * round_trips)
+
+
+class RoutedSocket(socket.socket):
+    '''
+    A host socket that connects and sends datagrams through the simulated network.
+    '''
+
+    def connect(self, address):
+        target = network.lookup(address)
+        network.stats['connects'] += 1
+        network.delay()
+        return super().connect(target)
+
+    def sendto(self, data, *args):
+        address = args[-1]
+        target = network.lookup(address)
+        network.stats['datagrams'] += 1
+        network.delay()
+        return super().sendto(data, *args[:-1], target)
+
+
+class RoutedSSLSocket(ssl.SSLSocket):
+    '''
+    A host TLS socket that connects through the simulated network. The certificate
+    is still checked against the host name the board asked for.
+    '''
+
+    def connect(self, address):
+        target = network.lookup(address)
+        network.stats['connects'] += 1
+        network.stats['tls_connects'] += 1
+        # One round trip for TCP and two for the TLS handshake
+        network.delay(3)
+        return super().connect(target)
+
+
+def load_settings(path: str) -> dict:
+    '''
+    Reads a CircuitPython settings.toml file.
+
+    :param path: The path of the file.
+    :return: A dictionary of the settings with their TOML types.
+    '''
+    import tomllib
+    with _real_open(path, 'rb') as file:
+        return tomllib.load(file)
+
+
+def getenv(key: str, default=None):
+    '''
+    Reads a setting like CircuitPython's os.getenv, with the type it has in settings.toml.
+
+    :param key: The name of the setting.
+    :param default: The value returned if the setting is missing.
+    :return: The value of the setting.
+    '''
+    if key in settings:
+        return settings[key]
+    return _real_getenv(key, default)
+
+
+def install() -> None:
+    '''
+    Replaces the parts of the host Python that behave differently on the board:
+    the clock, os.getenv, gc.mem_free, file access under the SD card mount point
+    and where TLS sockets connect. Call once before importing code.py or lib/.
+    '''
+    time.time = clock.time
+    time.monotonic = clock.monotonic
+    time.monotonic_ns = clock.monotonic_ns
+    time.localtime = clock.localtime
+    time.mktime = lambda t: calendar.timegm(tuple(t))
+    os.getenv = getenv
+    gc.mem_free = device.mem_free
+    gc.mem_alloc = lambda: device.heap_size - device.mem_free()
+    storage.install()
+    ssl.SSLContext.sslsocket_class = RoutedSSLSocket
+
+
+clock = Clock()
+device = Device()
+storage = SDStorage()
+network = Network()
+settings = {}
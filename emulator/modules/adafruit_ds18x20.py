@@ -0,0 +1,98 @@
+'''
+Stand-in for the adafruit_ds18x20 driver. It talks to the probe over the
+stand-in OneWire bus with the same commands as the real driver, so the
+simulated conversion delays apply.
+'''
+import struct
+import time
+from adafruit_onewire.device import OneWireDevice
+
+_CONVERT = b'\x44'
+_RD_SCRATCH = b'\xBE'
+_WR_SCRATCH = b'\x4E'
+_CONVERSION_DELAY = {9: 0.09375, 10: 0.1875, 11: 0.375, 12: 0.750}
+_RESOLUTION = {9: 0x1F, 10: 0x3F, 11: 0x5F, 12: 0x7F}
+
+
+class DS18X20:
+    '''
+    A DS18B20 or DS18S20 temperature probe.
+    '''
+
+    def __init__(self, bus, address):
+        '''
+        Initializes the DS18X20 class.
+
+        :param bus: The OneWireBus.
+        :param address: The OneWireAddress of the probe.
+        :raises ValueError: If the address is not of a DS18X20.
+        '''
+        if address.family_code not in (0x10, 0x28):
+            raise ValueError('Incorrect family code in device address.')
+        self._address = address
+        self._device = OneWireDevice(bus, address)
+        self._buf = bytearray(9)
+        self._conv_delay = _CONVERSION_DELAY[12]
+        self._resolution = None
+
+    @property
+    def temperature(self) -> float:
+        '''
+        Converts and reads the temperature in Celsius, waiting for the conversion.
+        '''
+        time.sleep(self.start_temperature_read())
+        return self.read_temperature()
+
+    @property
+    def resolution(self) -> int:
+        '''
+        The resolution in bits, 9 to 12.
+        '''
+        if self._resolution is None:
+            self._resolution = ((self._read_scratch()[4] >> 5) & 0x03) + 9
+        return self._resolution
+
+    @resolution.setter
+    def resolution(self, bits: int) -> None:
+        if bits not in _RESOLUTION:
+            raise ValueError('Incorrect resolution. Must be 9, 10, 11, or 12.')
+        self._buf[0] = 0
+        self._buf[1] = 0
+        self._buf[2] = _RESOLUTION[bits]
+        with self._device as dev:
+            dev.write(_WR_SCRATCH)
+            dev.write(self._buf, end=3)
+        self._resolution = bits
+        self._conv_delay = _CONVERSION_DELAY[bits]
+
+    def start_temperature_read(self) -> float:
+        '''
+        Starts a conversion and returns immediately.
+
+        :return: The time in seconds until the conversion is complete.
+        '''
+        with self._device as dev:
+            dev.write(_CONVERT)
+        return self._conv_delay
+
+    def read_temperature(self) -> float:
+        '''
+        Reads the result of the last conversion without waiting for it.
+
+        :return: The temperature in Celsius.
+        '''
+        buf = self._read_scratch()
+        if self._address.family_code == 0x10:
+            return struct.unpack('<h', buf[:2])[0] / 2
+        return struct.unpack('<h', buf[:2])[0] / 16
+
+    def _read_scratch(self) -> bytearray:
+        '''
+        Reads the scratchpad of the probe.
+
+        :return: The 9 scratchpad bytes.
+        '''
+        with self._device as dev:
+            dev.write(_RD_SCRATCH)
+            dev.readinto(self._buf)
+        return self._buf
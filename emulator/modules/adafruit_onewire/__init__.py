@@ -0,0 +1,3 @@
+'''
+Stand-in for the adafruit_onewire library, see bus.py and device.py.
+'''
@@ -0,0 +1,165 @@
+'''
+Stand-in for adafruit_onewire.bus. The bus decodes the ROM and function
+commands written to it and passes them to the simulated probes in
+hostsim.device.onewire for its pin.
+'''
+import hostsim
+
+_SEARCH_ROM = 0xF0
+_MATCH_ROM = 0x55
+_SKIP_ROM = 0xCC
+_CONVERT_T = 0x44
+_READ_SCRATCHPAD = 0xBE
+_WRITE_SCRATCHPAD = 0x4E
+
+
+class OneWireError(Exception):
+    '''
+    A OneWire bus error, e.g. no devices answered a required reset.
+    '''
+
+
+class OneWireAddress:
+    '''
+    The ROM code of a device on the bus.
+    '''
+
+    def __init__(self, rom: bytes):
+        '''
+        Initializes the OneWireAddress class.
+
+        :param rom: The 8 byte ROM code.
+        '''
+        self._rom = bytearray(rom)
+
+    @property
+    def rom(self) -> bytearray:
+        '''The 8 byte ROM code.'''
+        return self._rom
+
+    @property
+    def serial_number(self) -> bytearray:
+        '''The 6 byte serial number.'''
+        return self._rom[1:7]
+
+    @property
+    def family_code(self) -> int:
+        '''The family code, 0x28 for a DS18B20.'''
+        return self._rom[0]
+
+    @property
+    def crc(self) -> int:
+        '''The CRC of the ROM code.'''
+        return self._rom[7]
+
+
+class OneWireBus:
+    '''
+    A OneWire bus on a pin.
+    '''
+
+    def __init__(self, pin):
+        '''
+        Initializes the OneWireBus class.
+
+        :param pin: The board.Pin of the bus.
+        '''
+        self.pin = pin
+        self.devices = hostsim.device.onewire.get(pin.name, [])
+        self.selected = []
+        self.command = None
+        self.pending = bytearray()
+        self.output = bytearray()
+        self.maximum_devices = 10
+
+    def reset(self, required: bool = False) -> bool:
+        '''
+        Resets the bus, ending the current command.
+
+        :param required: Whether to raise if no device is present.
+        :return: True if no device is present.
+        :raises OneWireError: If required and no device is present.
+        '''
+        if required and not self.devices:
+            raise OneWireError('No presence pulse found')
+        self.selected = []
+        self.command = None
+        self.pending = bytearray()
+        self.output = bytearray()
+        return not self.devices
+
+    def write(self, buf, *, start: int = 0, end: int = None) -> None:
+        '''
+        Writes bytes to the bus.
+
+        :param buf: The bytes to write.
+        :param start: Optional start of the bytes to write.
+        :param end: Optional end of the bytes to write.
+        '''
+        for byte in bytes(buf[start:end]):
+            self._write_byte(byte)
+
+    def _write_byte(self, byte: int) -> None:
+        '''
+        Handles one byte written to the bus.
+
+        :param byte: The byte.
+        '''
+        if self.command is None:
+            if byte == _SKIP_ROM:
+                self.selected = list(self.devices)
+                self.command = 'function'
+            elif byte == _MATCH_ROM:
+                self.command = 'match'
+        elif self.command == 'match':
+            self.pending.append(byte)
+            if len(self.pending) == 8:
+                rom = bytes(self.pending)
+                self.selected = [device for device in self.devices if device.rom == rom]
+                self.pending = bytearray()
+                self.command = 'function'
+        elif self.command == 'function':
+            if byte == _CONVERT_T:
+                for device in self.selected:
+                    device.start_conversion()
+            elif byte == _READ_SCRATCHPAD and len(self.selected) == 1:
+                self.output = bytearray(self.selected[0].scratchpad())
+            elif byte == _WRITE_SCRATCHPAD:
+                self.command = 'scratchpad'
+        elif self.command == 'scratchpad':
+            self.pending.append(byte)
+            if len(self.pending) == 3:
+                for device in self.selected:
+                    device.write_scratchpad(self.pending)
+                self.pending = bytearray()
+                self.command = 'function'
+
+    def readinto(self, buf, *, start: int = 0, end: int = None) -> None:
+        '''
+        Reads bytes from the bus. Nothing driving the bus reads as 0xFF.
+
+        :param buf: The buffer to read into.
+        :param start: Optional start of the buffer.
+        :param end: Optional end of the buffer.
+        '''
+        end = len(buf) if end is None else end
+        for i in range(start, end):
+            buf[i] = self.output.pop(0) if self.output else 0xFF
+
+    def scan(self) -> list:
+        '''
+        Finds the devices on the bus.
+
+        :return: A list of the OneWireAddress of each device.
+        '''
+        return [OneWireAddress(device.rom) for device in self.devices[:self.maximum_devices]]
+
+    @staticmethod
+    def crc8(data: bytearray) -> int:
+        '''
+        Computes the CRC-8 used on the bus.
+
+        :param data: The bytes to check.
+        :return: The CRC.
+        '''
+        return hostsim.crc8(data)
@@ -0,0 +1,45 @@
+'''
+Stand-in for adafruit_onewire.device.
+'''
+_MATCH_ROM = b'\x55'
+
+
+class OneWireDevice:
+    '''
+    A device on a OneWire bus, selected by its address while used as a context manager.
+    '''
+
+    def __init__(self, bus, address):
+        '''
+        Initializes the OneWireDevice class.
+
+        :param bus: The OneWireBus.
+        :param address: The OneWireAddress of the device.
+        '''
+        self._bus = bus
+        self._rom = address.rom
+
+    def __enter__(self):
+        self._bus.reset()
+        self._bus.write(_MATCH_ROM)
+        self._bus.write(self._rom)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def readinto(self, buf, *, start: int = 0, end: int = None) -> None:
+        '''
+        Reads bytes from the device.
+
+        :param buf: The buffer to read into.
+        '''
+        self._bus.readinto(buf, start=start, end=end)
+
+    def write(self, buf, *, start: int = 0, end: int = None) -> None:
+        '''
+        Writes bytes to the device.
+
+        :param buf: The bytes to write.
+        '''
+        self._bus.write(buf, start=start, end=end)
@@ -0,0 +1,26 @@
+'''
+Stand-in for the adafruit_sdcard driver. The card is the host directory in
+hostsim.storage.directory.
+'''
+import hostsim
+
+
+class SDCard:
+    '''
+    An SD card on an SPI bus.
+    '''
+
+    def __init__(self, spi, cs, baudrate: int = 1320000):
+        '''
+        Initializes the SDCard class.
+
+        :param spi: The SPI bus.
+        :param cs: The chip select pin.
+        :param baudrate: Has no effect.
+        :raises OSError: If no card is inserted, i.e. there is no directory.
+        '''
+        if hostsim.storage.directory is None:
+            raise OSError('no SD card')
+        self.spi = spi
+        self.cs = cs
+        self.directory = hostsim.storage.directory
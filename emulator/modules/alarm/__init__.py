@@ -0,0 +1,35 @@
+'''
+Stand-in for the CircuitPython alarm module. Deep sleep ends the program by
+raising hostsim.DeepSleep, and the runner boots code.py again with
+wake_alarm set, keeping sleep_memory.
+'''
+import time as _time
+import hostsim
+from alarm import time
+
+sleep_memory = hostsim.device.sleep_memory
+
+# The alarm that woke the board, None after a cold boot
+wake_alarm = hostsim.device.wake_alarm
+
+
+def exit_and_deep_sleep_until_alarms(*alarms, preserve_dios=()) -> None:
+    '''
+    Enters deep sleep until an alarm goes off. Never returns.
+
+    :param alarms: The alarms that wake the board.
+    :raises hostsim.DeepSleep: Always.
+    '''
+    raise hostsim.DeepSleep(alarms)
+
+
+def light_sleep_until_alarms(*alarms):
+    '''
+    Sleeps until the first alarm goes off.
+
+    :param alarms: The alarms that wake the board.
+    :return: The alarm that went off.
+    '''
+    sleep = hostsim.DeepSleep(alarms)
+    _time.sleep(sleep.seconds())
+    return alarms[0] if alarms else None
@@ -0,0 +1,22 @@
+'''
+Stand-in for the CircuitPython alarm.time module.
+'''
+
+
+class TimeAlarm:
+    '''
+    An alarm that goes off at a time.
+    '''
+
+    def __init__(self, *, monotonic_time: float = None, epoch_time: int = None):
+        '''
+        Initializes the TimeAlarm class.
+
+        :param monotonic_time: The time.monotonic() at which the alarm goes off.
+        :param epoch_time: The time.time() at which the alarm goes off.
+        :raises ValueError: If neither or both times are given.
+        '''
+        if (monotonic_time is None) == (epoch_time is None):
+            raise ValueError('Supply exactly one of monotonic_time or epoch_time')
+        self.monotonic_time = monotonic_time
+        self.epoch_time = epoch_time
@@ -0,0 +1,43 @@
+'''
+Stand-in for the CircuitPython analogio module, reading the simulated analog
+inputs set up in hostsim.device.analog.
+'''
+import hostsim
+
+
+class AnalogIn:
+    '''
+    An analog input pin.
+    '''
+
+    def __init__(self, pin):
+        '''
+        Initializes the AnalogIn class.
+
+        :param pin: The board.Pin to read.
+        :raises ValueError: If the pin has no simulated input.
+        '''
+        if pin.name not in hostsim.device.analog:
+            raise ValueError(f'{pin.name} has no simulated analog input')
+        self.pin = pin
+        self.channel = hostsim.device.analog[pin.name]
+        self.reference_voltage = hostsim.ADC_VOLTS
+
+    @property
+    def value(self) -> int:
+        '''
+        The input in counts from 0 to 65535.
+        '''
+        return self.channel.value()
+
+    def deinit(self) -> None:
+        '''
+        Releases the pin.
+        '''
+        self.channel = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.deinit()
@@ -0,0 +1,70 @@
+'''
+Stand-in for the CircuitPython board module: the pin names of the board.
+'''
+
+
+class Pin:
+    '''
+    A pin of the simulated board, identified by its name.
+    '''
+
+    def __init__(self, name: str):
+        '''
+        Initializes the Pin class.
+
+        :param name: The name of the pin, e.g. 'A5'.
+        '''
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f'board.{self.name}'
+
+
+A0 = Pin('A0')
+A1 = Pin('A1')
+A2 = Pin('A2')
+A3 = Pin('A3')
+A4 = Pin('A4')
+A5 = Pin('A5')
+D5 = Pin('D5')
+D6 = Pin('D6')
+D9 = Pin('D9')
+D10 = Pin('D10')
+D11 = Pin('D11')
+D12 = Pin('D12')
+D13 = Pin('D13')
+SCK = Pin('SCK')
+MOSI = Pin('MOSI')
+MISO = Pin('MISO')
+SCL = Pin('SCL')
+SDA = Pin('SDA')
+TX = Pin('TX')
+RX = Pin('RX')
+SD_CS = Pin('SD_CS')
+LED = Pin('LED')
+NEOPIXEL = Pin('NEOPIXEL')
+
+_spi = None
+
+
+def SPI():
+    '''
+    Gets the board's default SPI bus.
+
+    :return: The busio.SPI on SCK, MOSI and MISO.
+    '''
+    global _spi
+    if _spi is None:
+        import busio
+        _spi = busio.SPI(SCK, MOSI, MISO)
+    return _spi
+
+
+def I2C():
+    '''
+    Gets the board's default I2C bus.
+
+    :return: The busio.I2C on SCL and SDA.
+    '''
+    import busio
+    return busio.I2C(SCL, SDA)
@@ -0,0 +1,94 @@
+'''
+Stand-in for the CircuitPython busio module. The buses only remember their
+pins; the devices on them are simulated by their own stand-ins.
+'''
+
+
+class SPI:
+    '''
+    An SPI bus.
+    '''
+
+    def __init__(self, clock, MOSI=None, MISO=None):
+        '''
+        Initializes the SPI class.
+
+        :param clock: The clock pin.
+        :param MOSI: The MOSI pin.
+        :param MISO: The MISO pin.
+        '''
+        self.clock = clock
+        self.MOSI = MOSI
+        self.MISO = MISO
+        self.locked = False
+
+    def try_lock(self) -> bool:
+        '''
+        Locks the bus.
+
+        :return: True if the bus was locked.
+        '''
+        if self.locked:
+            return False
+        self.locked = True
+        return True
+
+    def unlock(self) -> None:
+        '''
+        Unlocks the bus.
+        '''
+        self.locked = False
+
+    def configure(self, baudrate: int = 100000, polarity: int = 0, phase: int = 0, bits: int = 8) -> None:
+        '''
+        Configures the bus. Has no effect.
+        '''
+
+    def deinit(self) -> None:
+        '''
+        Releases the bus.
+        '''
+
+
+class I2C:
+    '''
+    An I2C bus with no devices on it.
+    '''
+
+    def __init__(self, scl, sda, frequency: int = 100000):
+        '''
+        Initializes the I2C class.
+
+        :param scl: The clock pin.
+        :param sda: The data pin.
+        :param frequency: The clock frequency in Hz.
+        '''
+        self.scl = scl
+        self.sda = sda
+        self.frequency = frequency
+
+    def try_lock(self) -> bool:
+        '''
+        Locks the bus.
+
+        :return: Always True.
+        '''
+        return True
+
+    def unlock(self) -> None:
+        '''
+        Unlocks the bus.
+        '''
+
+    def scan(self) -> list:
+        '''
+        Scans the bus.
+
+        :return: An empty list.
+        '''
+        return []
+
+    def deinit(self) -> None:
+        '''
+        Releases the bus.
+        '''
@@ -0,0 +1,68 @@
+'''
+Stand-in for the CircuitPython digitalio module. Pins hold their state but are
+not connected to anything.
+'''
+
+
+class Direction:
+    INPUT = 'input'
+    OUTPUT = 'output'
+
+
+class Pull:
+    UP = 'up'
+    DOWN = 'down'
+
+
+class DriveMode:
+    PUSH_PULL = 'push_pull'
+    OPEN_DRAIN = 'open_drain'
+
+
+class DigitalInOut:
+    '''
+    A digital pin.
+    '''
+
+    def __init__(self, pin):
+        '''
+        Initializes the DigitalInOut class.
+
+        :param pin: The board.Pin to use.
+        '''
+        self.pin = pin
+        self.direction = Direction.INPUT
+        self.pull = None
+        self.drive_mode = DriveMode.PUSH_PULL
+        self.value = False
+
+    def switch_to_output(self, value: bool = False, drive_mode: str = DriveMode.PUSH_PULL) -> None:
+        '''
+        Makes the pin an output.
+
+        :param value: The initial value.
+        :param drive_mode: The drive mode.
+        '''
+        self.direction = Direction.OUTPUT
+        self.value = value
+        self.drive_mode = drive_mode
+
+    def switch_to_input(self, pull: str = None) -> None:
+        '''
+        Makes the pin an input.
+
+        :param pull: Optional pull up or down.
+        '''
+        self.direction = Direction.INPUT
+        self.pull = pull
+
+    def deinit(self) -> None:
+        '''
+        Releases the pin.
+        '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.deinit()
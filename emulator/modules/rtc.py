@@ -0,0 +1,32 @@
+'''
+Stand-in for the CircuitPython rtc module. Setting the RTC sets the board's
+clock in hostsim.clock, which time.time() follows.
+'''
+import calendar
+import time
+import hostsim
+
+
+class RTC:
+    '''
+    The real-time clock of the board.
+    '''
+
+    calibration = 0
+
+    @property
+    def datetime(self) -> time.struct_time:
+        '''
+        The current time as a struct_time.
+        '''
+        return hostsim.clock.localtime()
+
+    @datetime.setter
+    def datetime(self, value: time.struct_time) -> None:
+        hostsim.clock.set_time(calendar.timegm(tuple(value)))
+
+
+def set_time_source(rtc) -> None:
+    '''
+    Sets the source of time.time(). Has no effect.
+    '''
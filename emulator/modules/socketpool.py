@@ -0,0 +1,59 @@
+'''
+Stand-in for the CircuitPython socketpool module. Sockets are host sockets
+that resolve names and connect through the routes in hostsim.network.
+'''
+import socket as _socket
+import hostsim
+
+
+class SocketPool:
+    '''
+    The sockets of a radio.
+    '''
+
+    AF_INET = _socket.AF_INET
+    AF_INET6 = _socket.AF_INET6
+    SOCK_STREAM = _socket.SOCK_STREAM
+    SOCK_DGRAM = _socket.SOCK_DGRAM
+    SOCK_RAW = _socket.SOCK_RAW
+    IPPROTO_IP = _socket.IPPROTO_IP
+    IPPROTO_TCP = _socket.IPPROTO_TCP
+    IPPROTO_UDP = _socket.IPPROTO_UDP
+    SOL_SOCKET = _socket.SOL_SOCKET
+    SO_REUSEADDR = _socket.SO_REUSEADDR
+    TCP_NODELAY = _socket.TCP_NODELAY
+    EAI_NONAME = _socket.EAI_NONAME
+
+    gaierror = _socket.gaierror
+    timeout = TimeoutError
+
+    def __init__(self, radio):
+        '''
+        Initializes the SocketPool class.
+
+        :param radio: The wifi.radio the sockets use.
+        '''
+        self.radio = radio
+
+    def socket(self, family: int = AF_INET, type: int = SOCK_STREAM, proto: int = IPPROTO_IP):
+        '''
+        Creates a socket.
+
+        :param family: The address family.
+        :param type: The socket type.
+        :param proto: The protocol.
+        :return: The new socket.
+        '''
+        return hostsim.RoutedSocket(family, type, proto)
+
+    def getaddrinfo(self, host: str, port: int, family: int = 0, type: int = 0, proto: int = 0, flags: int = 0) -> list:
+        '''
+        Resolves a host name.
+
+        :param host: The host name.
+        :param port: The port.
+        :return: A list with one (family, type, proto, canonname, (address, port)) tuple.
+        :raises gaierror: If the name does not resolve.
+        '''
+        address = hostsim.network.resolve(host)
+        return [(self.AF_INET, type or self.SOCK_STREAM, proto, '', (address, port))]
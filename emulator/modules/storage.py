@@ -0,0 +1,46 @@
+'''
+Stand-in for the CircuitPython storage module, mounting the simulated SD card
+into the board's file system.
+'''
+import hostsim
+
+
+class VfsFat:
+    '''
+    A FAT file system on a block device.
+    '''
+
+    def __init__(self, block_device):
+        '''
+        Initializes the VfsFat class.
+
+        :param block_device: The block device, e.g. an adafruit_sdcard.SDCard.
+        '''
+        self.block_device = block_device
+        self.label = 'SDCARD'
+
+
+def mount(filesystem: VfsFat, mount_path: str, *, readonly: bool = False) -> None:
+    '''
+    Mounts a file system.
+
+    :param filesystem: The file system to mount.
+    :param mount_path: The path to mount it at, e.g. '/sd'.
+    :param readonly: Has no effect.
+    '''
+    hostsim.storage.mount(mount_path, filesystem.block_device.directory)
+
+
+def umount(mount_path: str) -> None:
+    '''
+    Unmounts a file system.
+
+    :param mount_path: The path it is mounted at.
+    '''
+    hostsim.storage.umount(mount_path)
+
+
+def remount(mount_path: str, readonly: bool = False, *, disable_concurrent_write_protection: bool = False) -> None:
+    '''
+    Remounts a file system. Has no effect.
+    '''
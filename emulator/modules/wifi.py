@@ -0,0 +1,54 @@
+'''
+Stand-in for the CircuitPython wifi module, joining the simulated network in
+hostsim.network.
+'''
+import hostsim
+
+
+class Radio:
+    '''
+    The WiFi radio of the board.
+    '''
+
+    def __init__(self):
+        '''
+        Initializes the Radio class.
+        '''
+        self.enabled = True
+        self.hostname = 'cpy-emulator'
+        self._joined = False
+
+    def connect(self, ssid: str, password: str = '', *, channel: int = 0, bssid=None, timeout: float = None) -> None:
+        '''
+        Joins a network.
+
+        :param ssid: The SSID.
+        :param password: The password.
+        :raises ConnectionError: If the network cannot be joined.
+        '''
+        self._joined = False
+        hostsim.network.join(ssid, password)
+        self._joined = True
+
+    def disconnect(self) -> None:
+        '''
+        Leaves the network.
+        '''
+        self._joined = False
+
+    @property
+    def connected(self) -> bool:
+        '''
+        Whether the board is on the network. Goes False when the simulated link drops.
+        '''
+        return self._joined and hostsim.network.link_up
+
+    @property
+    def ipv4_address(self):
+        '''
+        The address of the board, None when not connected.
+        '''
+        return '10.0.0.100' if self.connected else None
+
+
+radio = Radio()
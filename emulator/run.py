@@ -0,0 +1,58 @@
+'''
+Runs the firmware on the host against the simulated board and fake cloud services.
+
+    python emulator/run.py --duration 120
+
+The SD card is a temporary directory unless --sd is given, and everything the
+board uploads ends up in the fake Sheets API and MQTT broker, summarized when
+the run ends.
+'''
+import argparse
+import json
+
+from emulation import Emulation
+import hostsim
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run code.py on the simulated board.')
+    parser.add_argument('--settings', help='settings.toml to use, emulator/settings.toml by default')
+    parser.add_argument('--sd', help='host directory for the SD card, kept between runs')
+    parser.add_argument('--duration', type=float, help='seconds to run for, forever by default')
+    parser.add_argument('--sleep-scale', type=float, default=1.0,
+                        help='part of each deep sleep to wait for, 0 to skip sleep entirely')
+    parser.add_argument('--latency', type=float, default=0.0, help='network round trip time in seconds')
+    parser.add_argument('--sheets-delay', type=float, default=0.0, help='Sheets API response time in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='fraction of Sheets, NTP and MQTT requests that fail')
+    parser.add_argument('--ph', type=float, default=6.2, help='mean pH of the solution')
+    parser.add_argument('--depth', type=float, default=8.0, help='mean water depth in inches')
+    parser.add_argument('--temperature', type=float, default=21.0, help='mean water temperature in Celsius')
+    parser.add_argument('--probes', type=int, default=2, help='number of temperature probes')
+    parser.add_argument('--noise', type=float, default=0.002, help='analog noise in volts')
+    parser.add_argument('--trace-heap', action='store_true', help='report heap use with tracemalloc')
+    parser.add_argument('--dump', help='file to write the fake sheets to as JSON')
+    args = parser.parse_args()
+
+    emulation = Emulation(
+        args.settings, args.sd, ph=args.ph, depth=args.depth, temperature=args.temperature,
+        probes=args.probes, noise=args.noise
+    )
+    hostsim.network.latency = args.latency
+    emulation.sheets.delay = args.sheets_delay
+    emulation.sheets.failure_rate = args.failure_rate
+    emulation.ntp.failure_rate = args.failure_rate
+    emulation.mqtt.failure_rate = args.failure_rate
+    print('SD card:', emulation.sd_directory)
+    try:
+        emulation.run(args.duration, args.sleep_scale, args.trace_heap)
+    finally:
+        print(json.dumps(emulation.summary(), indent=2))
+        if args.dump:
+            with open(args.dump, 'w') as file:
+                json.dump(emulation.sheets.sheets, file, indent=2)
+        emulation.close()
+
+
+if __name__ == '__main__':
+    main()
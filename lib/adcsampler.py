@@ -0,0 +1,150 @@
+from array import array
+import analogio
+
+class AdcSampler:
+    '''
+    A class to oversample an analog input and reduce the burst to one filtered value.
+
+    Samples are taken into a preallocated array and reduced with integer math only,
+    so a reading costs the same time every call and does not allocate a new buffer.
+    The supported filters are:
+
+    - 'mean': the average of the burst.
+    - 'median': the middle value of the burst, which rejects single spikes.
+    - 'trimmed': the average of the burst without the `trim` lowest and highest samples.
+    - 'ema': an exponential moving average of the burst means across readings,
+      weighted 1 / 2 ** ema_shift towards the newest burst.
+    '''
+
+    FILTERS = ('mean', 'median', 'trimmed', 'ema')
+
+    def __init__(
+        self,
+        pin: analogio.AnalogIn,
+        samples: int = 16,
+        method: str = 'mean',
+        trim: int = 2,
+        ema_shift: int = 3
+    ):
+        '''
+        Initializes the AdcSampler class.
+
+        :param pin: The analog input to sample.
+        :param samples: The number of samples to take per reading.
+        :param method: The filter used to reduce the samples, one of FILTERS.
+        :param trim: The number of samples dropped from each end by the 'trimmed' filter.
+        :param ema_shift: The smoothing of the 'ema' filter as a power of two.
+        :raises ValueError: If the filter or its parameters are not valid.
+        '''
+        if method not in self.FILTERS:
+            raise ValueError(f'Unsupported filter {method}')
+        if samples < 1:
+            raise ValueError('At least one sample is required')
+        if method == 'trimmed' and samples <= 2 * trim:
+            raise ValueError('Not enough samples to trim')
+        self.pin = pin
+        self.method = method
+        self.trim = trim
+        self.ema_shift = ema_shift
+        self.buffer = array('H', [0] * samples)
+        self.ema_state = None
+
+    def burst(self) -> array:
+        '''
+        Fills the sample buffer with consecutive readings of the analog input.
+
+        :return: The sample buffer.
+        '''
+        buffer = self.buffer
+        pin = self.pin
+        for i in range(len(buffer)):
+            buffer[i] = pin.value
+        return buffer
+
+    def read(self) -> int:
+        '''
+        Takes a burst of samples and reduces it with the configured filter.
+
+        :return: The filtered value in raw ADC counts (0-65535).
+        '''
+        self.burst()
+        if self.method == 'median':
+            return self.median()
+        if self.method == 'trimmed':
+            return self.trimmed_mean()
+        if self.method == 'ema':
+            return self.update_ema(self.mean())
+        return self.mean()
+
+    def reset(self) -> None:
+        '''
+        Forgets the moving average, e.g. after the sensor has been moved to a new solution.
+        '''
+        self.ema_state = None
+
+    def mean(self) -> int:
+        '''
+        Calculates the rounded mean of the sample buffer.
+
+        :return: The mean in raw ADC counts.
+        '''
+        count = len(self.buffer)
+        return (sum(self.buffer) + count // 2) // count
+
+    def median(self) -> int:
+        '''
+        Calculates the median of the sample buffer, sorting the buffer in place.
+
+        :return: The median in raw ADC counts.
+        '''
+        self._sort()
+        buffer = self.buffer
+        middle = len(buffer) // 2
+        if len(buffer) % 2:
+            return buffer[middle]
+        return (buffer[middle - 1] + buffer[middle] + 1) // 2
+
+    def trimmed_mean(self) -> int:
+        '''
+        Calculates the mean of the sample buffer without its lowest and highest samples,
+        sorting the buffer in place.
+
+        :return: The trimmed mean in raw ADC counts.
+        '''
+        self._sort()
+        buffer = self.buffer
+        total = 0
+        for i in range(self.trim, len(buffer) - self.trim):
+            total += buffer[i]
+        count = len(buffer) - 2 * self.trim
+        return (total + count // 2) // count
+
+    def update_ema(self, value: int) -> int:
+        '''
+        Feeds a value into the exponential moving average.
+
+        The average is kept scaled up by 2 ** ema_shift so it keeps its fractional
+        part without using floats.
+
+        :param value: The newest value in raw ADC counts.
+        :return: The moving average in raw ADC counts.
+        '''
+        if self.ema_state is None:
+            self.ema_state = value << self.ema_shift
+        else:
+            self.ema_state += value - (self.ema_state >> self.ema_shift)
+        return self.ema_state >> self.ema_shift
+
+    def _sort(self) -> None:
+        '''
+        Sorts the sample buffer in place with an insertion sort, which is fast for
+        the small, nearly sorted bursts taken from a slowly changing signal.
+        '''
+        buffer = self.buffer
+        for i in range(1, len(buffer)):
+            value = buffer[i]
+            j = i - 1
+            while j >= 0 and buffer[j] > value:
+                buffer[j + 1] = buffer[j]
+                j -= 1
+            buffer[j + 1] = value
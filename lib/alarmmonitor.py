@@ -0,0 +1,158 @@
+from rollingstats import RollingStats
+
+# The alarms of a channel, in the order they are checked
+KINDS = ('low', 'high', 'rate', 'zscore')
+
+class AlarmMonitor:
+    '''
+    A class to check every sample for conditions that need attention right away,
+    e.g. a drained reservoir or a pH crash, rather than when someone next opens
+    the sheet.
+
+    Each channel keeps RollingStats of its recent samples and can have four alarms:
+
+        low      the value is below a limit
+        high     the value is above a limit
+        rate     the value changed faster than a limit per minute across the window
+        zscore   the value is further from the window's mean than a number of
+                 standard deviations
+
+    The rate and z-score of a sample are measured against the window before the
+    sample is added to it. An alarm is raised by the first sample that meets its
+    condition, and cleared once clear_samples samples in a row did not, so a
+    value hovering at a limit does not raise it over and over.
+    '''
+
+    def __init__(
+        self,
+        channels: list,
+        window: int = 20,
+        low: list = None,
+        high: list = None,
+        rate: list = None,
+        zscore: float = 0,
+        noise: list = None,
+        clear_samples: int = 3
+    ):
+        '''
+        Initializes the AlarmMonitor class.
+
+        :param channels: The name of each channel, e.g. ['temperature', 'depth', 'ph'].
+        :param window: The number of recent samples of each channel the rate and z-score are measured over.
+        :param low: Optional lowest normal value of each channel, or None for a channel without one.
+        :param high: Optional highest normal value of each channel, or None for a channel without one.
+        :param rate: Optional fastest normal change per minute of each channel, or None for a channel without one.
+        :param zscore: The number of standard deviations from the mean that raises an alarm, 0 for none.
+        :param noise: Optional smallest standard deviation of each channel used for z-scores, so that
+                      a channel that was perfectly steady does not alarm on the smallest change.
+        :param clear_samples: The number of samples in a row without its condition that clear an alarm.
+        '''
+        self.channels = channels
+        none = [None] * len(channels)
+        self.low = low or none
+        self.high = high or none
+        self.rate = rate or none
+        self.zscore = zscore
+        self.noise = noise or none
+        self.clear_samples = clear_samples
+        self.stats = [RollingStats(window) for _ in channels]
+        # The number of samples in a row without its condition of each raised alarm,
+        # by "<channel>_<kind>"
+        self.active = {}
+
+    def _conditions(self, index: int, timestamp: int, value: float) -> list:
+        '''
+        Checks the conditions of the alarms of a channel.
+
+        :param index: The index of the channel.
+        :param timestamp: The time of the sample in seconds since the epoch.
+        :param value: The value of the sample.
+        :return: A list of (kind, detail) tuples of the conditions that are met.
+        '''
+        met = []
+        low = self.low[index]
+        if low is not None and value < low:
+            met.append(('low', low))
+        high = self.high[index]
+        if high is not None and value > high:
+            met.append(('high', high))
+        stats = self.stats[index]
+        rate = self.rate[index]
+        oldest = stats.oldest()
+        if rate is not None and oldest is not None and timestamp > oldest[0]:
+            per_minute = (value - oldest[1]) * 60 / (timestamp - oldest[0])
+            if abs(per_minute) > rate:
+                met.append(('rate', per_minute))
+        if self.zscore and stats.count() == stats.size:
+            spread = max(stats.std(), self.noise[index] or 0)
+            if spread > 0:
+                score = (value - stats.mean) / spread
+                if abs(score) > self.zscore:
+                    met.append(('zscore', score))
+        return met
+
+    def set_limits(self, channel: str, low: float = None, high: float = None) -> None:
+        '''
+        Changes the low and high limits of a channel, e.g. to setpoints read from the sheet.
+        A raised alarm is cleared by the samples that follow, like any other.
+
+        :param channel: The name of the channel.
+        :param low: The lowest normal value, or None for no limit.
+        :param high: The highest normal value, or None for no limit.
+        '''
+        index = self.channels.index(channel)
+        # Copied, since the lists may be shared with the caller or with each other
+        self.low = list(self.low)
+        self.high = list(self.high)
+        self.low[index] = low
+        self.high[index] = high
+
+    def update(self, timestamp: int, values: list) -> list:
+        '''
+        Checks a sample of every channel and adds it to the statistics.
+
+        :param timestamp: The time of the sample in seconds since the epoch.
+        :param values: The value of each channel, None for a channel that was not read.
+        :return: A list of (channel, kind, raised, value, detail) tuples of the alarms raised or
+                 cleared by the sample, with raised False when an alarm is cleared. The detail is
+                 the limit for low and high, the change per minute for rate, the z-score for
+                 zscore, and None when an alarm is cleared.
+        '''
+        events = []
+        for index, value in enumerate(values):
+            if value is None:
+                continue
+            channel = self.channels[index]
+            met = self._conditions(index, timestamp, value)
+            for kind, detail in met:
+                key = f'{channel}_{kind}'
+                if key not in self.active:
+                    events.append((channel, kind, True, value, detail))
+                self.active[key] = 0
+            for kind in KINDS:
+                key = f'{channel}_{kind}'
+                if key in self.active and not any(kind == met_kind for met_kind, _ in met):
+                    self.active[key] += 1
+                    if self.active[key] >= self.clear_samples:
+                        del self.active[key]
+                        events.append((channel, kind, False, value, None))
+            self.stats[index].add(timestamp, value)
+        return events
+
+    def state(self) -> dict:
+        '''
+        Gets the recent samples and raised alarms, e.g. to keep them through deep sleep.
+
+        :return: A dictionary of the samples of each channel and the raised alarms.
+        '''
+        return {'stats': [stats.state() for stats in self.stats], 'active': self.active}
+
+    def restore(self, state: dict) -> None:
+        '''
+        Continues from samples and alarms saved with state.
+
+        :param state: A dictionary returned by state.
+        '''
+        for stats, samples in zip(self.stats, state['stats']):
+            stats.restore(samples)
+        self.active = dict(state['active'])
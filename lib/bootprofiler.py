@@ -0,0 +1,77 @@
+import gc
+import time
+
+class _Step:
+    '''
+    A context manager that measures one step of the boot sequence.
+    '''
+
+    def __init__(self, profiler: 'BootProfiler', label: str):
+        '''
+        Initializes the _Step class.
+
+        :param profiler: The BootProfiler to record the step in.
+        :param label: The name of the step.
+        '''
+        self.profiler = profiler
+        self.label = label
+        self.start = 0
+        self.mem_start = 0
+
+    def __enter__(self) -> '_Step':
+        # Collect first so the heap measurement only sees this step's allocations
+        gc.collect()
+        self.mem_start = gc.mem_free()
+        self.start = time.monotonic_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        elapsed_ms = (time.monotonic_ns() - self.start) // 1000000
+        gc.collect()
+        self.profiler.steps.append((self.label, elapsed_ms, self.mem_start - gc.mem_free()))
+
+
+class BootProfiler:
+    '''
+    A class to record how long each import and constructor takes during boot and
+    how much heap it keeps.
+    '''
+
+    def __init__(self):
+        '''
+        Initializes the BootProfiler class.
+        '''
+        self.start = time.monotonic_ns()
+        self.steps = []
+        self.marks = []
+
+    def step(self, label: str) -> _Step:
+        '''
+        Measures a step of the boot sequence, used as `with profiler.step('label'):`.
+
+        :param label: The name of the step.
+        :return: A context manager that records the step when it exits.
+        '''
+        return _Step(self, label)
+
+    def mark(self, label: str) -> None:
+        '''
+        Records the time since boot at which a milestone was reached.
+
+        :param label: The name of the milestone.
+        '''
+        self.marks.append((label, (time.monotonic_ns() - self.start) // 1000000))
+
+    def report(self) -> str:
+        '''
+        Formats the recorded steps and milestones, slowest step first.
+
+        :return: The report as a string with one line per step or milestone.
+        '''
+        lines = [f'{"step":<36}{"ms":>8}{"heap":>10}']
+        for label, elapsed_ms, heap in sorted(self.steps, key=lambda step: -step[1]):
+            lines.append(f'{label:<36}{elapsed_ms:>8}{heap:>10}')
+        for label, elapsed_ms in self.marks:
+            lines.append(f'{label:<36}{elapsed_ms:>8}')
+        lines.append(f'{"free heap":<36}{"":>8}{gc.mem_free():>10}')
+        return '\n'.join(lines)
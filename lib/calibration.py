@@ -0,0 +1,111 @@
+from array import array
+
+# Full scale of the ADC in volts and in counts
+ADC_VOLTS = 3.3
+ADC_COUNTS = 65536
+
+class Calibration:
+    '''
+    A piecewise linear calibration from sensor voltage to a measured value.
+
+    The slope and intercept of every segment are computed once, and a reading
+    finds its segment with a binary search over the sorted breakpoints, so a
+    conversion costs O(log n) for n calibration points. A voltage equal to a
+    breakpoint uses the lower segment, and voltages outside the calibrated
+    range extrapolate the first or last segment.
+    '''
+
+    def __init__(self, breaks: list, slopes: list, intercepts: list):
+        '''
+        Initializes the Calibration class.
+
+        :param breaks: The voltages between segments in ascending order.
+        :param slopes: The slope of each segment, one more than there are breaks.
+        :param intercepts: The intercept of each segment, one more than there are breaks.
+        :raises ValueError: If the table sizes do not match.
+        '''
+        if len(slopes) != len(breaks) + 1 or len(intercepts) != len(slopes):
+            raise ValueError('Calibration needs one more segment than breakpoints')
+        self.breaks = list(breaks)
+        self.slopes = list(slopes)
+        self.intercepts = list(intercepts)
+        # The same table in raw ADC counts, for converting without a voltage step
+        self.count_breaks = [voltage * ADC_COUNTS / ADC_VOLTS for voltage in self.breaks]
+        self.count_slopes = [slope * ADC_VOLTS / ADC_COUNTS for slope in self.slopes]
+
+    @classmethod
+    def from_points(cls, points: list) -> 'Calibration':
+        '''
+        Builds a calibration through any number of reference points.
+
+        :param points: A list of at least two (voltage, value) pairs in any order.
+        :return: A new Calibration instance.
+        :raises ValueError: If there are fewer than two points or two share a voltage.
+        '''
+        points = sorted(points)
+        if len(points) < 2:
+            raise ValueError('Calibration needs at least two points')
+        slopes = []
+        intercepts = []
+        for (voltage_a, value_a), (voltage_b, value_b) in zip(points, points[1:]):
+            if voltage_a == voltage_b:
+                raise ValueError(f'Two calibration points at {voltage_a:.3f} V')
+            slope = (value_b - value_a) / (voltage_b - voltage_a)
+            slopes.append(slope)
+            intercepts.append(value_b - slope * voltage_b)
+        return cls([voltage for voltage, _ in points[1:-1]], slopes, intercepts)
+
+    def segment(self, voltage: float) -> int:
+        '''
+        Finds the segment that applies to a voltage.
+
+        :param voltage: The sensor voltage.
+        :return: The index of the segment.
+        '''
+        breaks = self.breaks
+        low = 0
+        high = len(breaks)
+        while low < high:
+            middle = (low + high) >> 1
+            if breaks[middle] < voltage:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def convert(self, voltage: float) -> float:
+        '''
+        Converts a sensor voltage to the calibrated value.
+
+        :param voltage: The sensor voltage.
+        :return: The calibrated value.
+        '''
+        index = self.segment(voltage)
+        return self.slopes[index] * voltage + self.intercepts[index]
+
+    def convert_counts(self, counts, out: array = None) -> array:
+        '''
+        Converts a whole sequence of raw ADC counts to calibrated values.
+
+        :param counts: A sequence of raw ADC counts, e.g. an array('H').
+        :param out: Optional array('f') of the same length to write the values to.
+        :return: An array('f') of the calibrated values.
+        '''
+        if out is None:
+            out = array('f', [0.0] * len(counts))
+        breaks = self.count_breaks
+        slopes = self.count_slopes
+        intercepts = self.intercepts
+        segments = len(breaks)
+        for i in range(len(counts)):
+            count = counts[i]
+            low = 0
+            high = segments
+            while low < high:
+                middle = (low + high) >> 1
+                if breaks[middle] < count:
+                    low = middle + 1
+                else:
+                    high = middle
+            out[i] = slopes[low] * count + intercepts[low]
+        return out
@@ -1,7 +1,9 @@
 import json
 import time
-from adafruit_jwt import JWT
 from wifimanager import WiFiManager
+from tokencache import TokenCache
+from telemetry import Telemetry
+from jsonstream import RowStream, iter_values
 
 class GoogleSheetsManager:
     '''
@@ -9,7 +11,18 @@ class GoogleSheetsManager:
     writing to a Google Sheet, and reading from a Google Sheet.
     '''
 
-    def __init__(self, wifi: WiFiManager, private_key: str, client_email: str, kid: str):
+    # Lifetime of a newly created access token in seconds
+    TOKEN_LIFETIME = 3600
+
+    def __init__(
+        self,
+        wifi: WiFiManager,
+        private_key: str,
+        client_email: str,
+        kid: str,
+        token_cache: TokenCache = None,
+        telemetry: Telemetry = None
+    ):
         '''
         Initializes the GoogleSheetsManager class.
 
@@ -17,13 +30,64 @@ class GoogleSheetsManager:
         :param private_key: The private key for the service account.
         :param client_email: The client email for the service account.
         :param kid: The key ID for the service account.
+        :param token_cache: Optional TokenCache used to reuse the access token across restarts.
+        :param telemetry: Optional Telemetry to time token minting in.
         '''
         self.wifi = wifi
         self.private_key = tuple(map(int, private_key.split(', ')))
         self.client_email = client_email
         self.kid = kid
+        self.token_cache = token_cache
+        self.telemetry = telemetry
         self.access_token = None
         self.exp = None
+        if token_cache:
+            self.set_access_token(*token_cache.load())
+
+    def set_access_token(self, access_token: str, exp: int) -> bool:
+        '''
+        Uses a previously created access token, e.g. one saved before a restart.
+
+        The token is ignored if it has expired, or if its expiry is further away than
+        a new token would be, which means the clock has not been set.
+
+        :param access_token: The access token.
+        :param exp: The expiry time of the access token in seconds since the epoch.
+        :return: True if the token was accepted, False otherwise.
+        '''
+        if not access_token or not exp:
+            return False
+        remaining = exp - int(time.time())
+        if remaining <= 0 or remaining > self.TOKEN_LIFETIME:
+            return False
+        self.access_token = access_token
+        self.exp = exp
+        return True
+
+    def token_expires_in(self) -> int:
+        '''
+        Gets the number of seconds until the current access token expires.
+
+        :return: The remaining lifetime in seconds, or 0 if there is no token.
+        '''
+        if not self.access_token:
+            return 0
+        return max(self.exp - int(time.time()), 0)
+
+    def refresh_access_token(self, margin: int = 600) -> bool:
+        '''
+        Creates a new access token if the current one expires within the margin.
+
+        Call this at an idle moment, e.g. right after an upload, so that the
+        write path does not have to stop and sign a token.
+
+        :param margin: The minimum remaining lifetime in seconds to keep the current token.
+        :return: True if a new token was created, False otherwise.
+        '''
+        if self.token_expires_in() > margin:
+            return False
+        self.create_access_token()
+        return True
 
     def create_access_token(self) -> str:
         '''
@@ -32,7 +96,7 @@ class GoogleSheetsManager:
         :return: The access token as a string.
         '''
         iat = int(time.time())
-        exp = iat + 3600
+        exp = iat + self.TOKEN_LIFETIME
         payload = {
             'iss': self.client_email,
             'sub': self.client_email,
@@ -42,24 +106,48 @@ class GoogleSheetsManager:
         }
         additional_headers = {'kid': self.kid}
 
+        start = self.telemetry.start() if self.telemetry else 0
+        # The JWT and RSA stack is large, so it is only imported when a token is minted
+        from adafruit_jwt import JWT
         jwt_token = JWT.generate(
             payload,
             self.private_key,
             headers=additional_headers,
             algo='RS256'
         )
+        if self.telemetry:
+            self.telemetry.stop('token', start)
 
         self.access_token = jwt_token
         self.exp = exp
+        if self.token_cache:
+            try:
+                self.token_cache.save(jwt_token, exp)
+            except OSError as e:
+                print('Failed to save access token:', e)
         return self.access_token
 
+    def get_headers(self) -> dict:
+        '''
+        Gets the request headers for the Google Sheets API, creating a new access
+        token first if the current one is missing or expired.
+
+        :return: The request headers as a dictionary.
+        '''
+        if not self.token_expires_in():
+            self.create_access_token()
+        return {
+            'Authorization': f'Bearer {self.access_token}',
+            'Content-Type': 'application/json'
+        }
+
     def write_to_sheet(
             self,
             spreadsheet_id: str,
             sheet_name: str,
             range_name: str,
             values: list,
-            append: False
+            append: bool = False
     ) -> None:
         '''
         Writes data to a Google Sheet.
@@ -70,25 +158,17 @@ class GoogleSheetsManager:
         :param values: The data to write to the sheet.
         :param append: A boolean value indicating whether to append the data to the end of the range.
         '''
-        if not self.access_token or int(time.time()) >= self.exp:
-            self.create_access_token()
+        headers = self.get_headers()
         if append:
             url = f'https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values/{sheet_name}!{range_name}:append?valueInputOption=USER_ENTERED'
         else:
             url = f'https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values/{sheet_name}!{range_name}?valueInputOption=USER_ENTERED'
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
-        }
-        data = {
-            'range': f'{sheet_name}!{range_name}',
-            'majorDimension': 'ROWS',
-            'values': values
-        }
+        # The rows are encoded as they are sent rather than all at once
+        data = RowStream({'range': f'{sheet_name}!{range_name}', 'majorDimension': 'ROWS'}, values)
 
         response = self.wifi.post(url, data=data, headers=headers)
 
-        if not response:
+        if not response or 'error' in json.loads(response):
             raise Exception('Failed to write to sheet')
         else:
             return response
@@ -98,27 +178,40 @@ class GoogleSheetsManager:
         spreadsheet_id: str,
         sheet_name: str,
         range_name: str
-    ) -> list:
+    ):
         '''
-        Reads data from a Google Sheet.
+        Reads data from a Google Sheet, parsing the rows as the response arrives so
+        that only one row is in memory at a time.
 
         :param spreadsheet_id: The ID of the Google Sheet.
         :param sheet_name: The name of the sheet in the Google Sheet.
         :param range_name: The range in the sheet to read data from.
-        :return: The data read from the sheet as a list.
+        :return: A generator of the rows read from the sheet, each a list of cell values.
+                 Read it to the end, or close it, before the next request.
+        :raises Exception: While iterating, if the request fails.
         '''
-        if not self.access_token or int(time.time()) >= self.exp:
-            self.create_access_token()
-
         url = f'https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values/{sheet_name}!{range_name}'
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
-        }
+        headers = self.get_headers()
 
-        response = self.wifi.get(url, headers=headers)
+        try:
+            yield from iter_values(self.wifi.stream('GET', url, headers=headers))
+        except Exception as e:
+            raise Exception(f'Failed to read from sheet: {e}')
 
-        if response:
-            return json.loads(response).get('values', [])
-        else:
-            raise Exception('Failed to read from sheet')
+    def append_rows(self, spreadsheet_id: str, sheet_name: str, rows: list) -> str:
+        '''
+        Appends any number of rows to the end of the table in a sheet with a single request.
+
+        :param spreadsheet_id: The ID of the Google Sheet.
+        :param sheet_name: The name of the sheet in the Google Sheet.
+        :param rows: The rows to append, each a list of cell values.
+        :return: The response text from the Google Sheets API.
+        '''
+        url = f'https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values/{sheet_name}!A1:append?valueInputOption=USER_ENTERED&insertDataOption=INSERT_ROWS'
+        data = RowStream({'range': f'{sheet_name}!A1', 'majorDimension': 'ROWS'}, rows)
+
+        response = self.wifi.post(url, data=data, headers=self.get_headers())
+
+        if not response or 'error' in json.loads(response):
+            raise Exception('Failed to append to sheet')
+        return response
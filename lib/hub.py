@@ -0,0 +1,389 @@
+import asyncio
+import errno
+import json
+import time
+from nbsocket import wait, send_all
+from telemetry import Telemetry
+from wifimanager import WiFiManager
+
+# First word of every request, so a stray connection is not mistaken for a leaf
+MAGIC = 'HM1'
+
+# The characters allowed in the name of a node, which ends up in file and tab names
+NAME_CHARS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-'
+
+class HubError(Exception):
+    '''
+    A request refused by the hub, or a broken connection to it.
+    '''
+
+
+class HubClient:
+    '''
+    A client that sends rows to a hub over the local network instead of to the
+    sheet, so a leaf monitor never creates an access token or opens a TLS
+    connection.
+
+    Each send opens a TCP connection, sends a request line followed by the rows
+    as JSON lines, and waits for the hub to reply that it queued them:
+
+        HM1 <node> <tab> <count>     the node, the tab ('-' for the readings) and the number of rows
+        [1718000000, ...]            one JSON encoded row per line
+        OK <accepted>                the reply, with the number of rows that were not duplicates
+
+    A send fails if the hub is unreachable or does not reply, so the rows stay
+    queued on the leaf until the hub is back.
+    '''
+
+    def __init__(self, wifi_manager: WiFiManager, host: str, port: int = 5005, node: str = 'monitor', timeout: int = 5):
+        '''
+        Initializes the HubClient class.
+
+        :param wifi_manager: An instance of the WiFiManager class, whose socket pool is used.
+        :param host: The host name or address of the hub.
+        :param port: The TCP port of the hub.
+        :param node: The name of this monitor, of letters, digits, '_' and '-', e.g. 'greenhouse-2'.
+                     Spaces are replaced with '_'.
+        :param timeout: The socket timeout in seconds.
+        :raises ValueError: If the name has any other character, which the hub would refuse.
+        '''
+        node = node.replace(' ', '_')
+        if not node or any(c not in NAME_CHARS for c in node):
+            raise ValueError(f'Node name {node!r} may only have letters, digits, _ and -')
+        self.wifi_manager = wifi_manager
+        self.host = host
+        self.port = port
+        self.node = node
+        self.timeout = timeout
+        self.buffer = bytearray(64)
+
+    def send(self, tab: str, rows: list, chunk_size: int = 1024) -> int:
+        '''
+        Sends rows and waits for the hub to queue them.
+
+        :param tab: The name of the tab, None for the readings.
+        :param rows: A list of rows, each starting with its timestamp.
+        :param chunk_size: The number of bytes of rows sent at a time.
+        :return: The number of rows the hub accepted, without those it already had.
+        :raises HubError: If the hub refused the rows or closed the connection.
+        '''
+        pool = self.wifi_manager.pool
+        if pool is None:
+            raise RuntimeError('Not connected to WiFi')
+        address = pool.getaddrinfo(self.host, self.port)[0][4]
+        sock = pool.socket(pool.AF_INET, pool.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(address)
+            chunk = [f'{MAGIC} {self.node} {tab or "-"} {len(rows)}\n']
+            size = len(chunk[0])
+            for row in rows:
+                line = json.dumps(row) + '\n'
+                chunk.append(line)
+                size += len(line)
+                if size >= chunk_size:
+                    self._send_all(sock, ''.join(chunk).encode())
+                    chunk = []
+                    size = 0
+            if chunk:
+                self._send_all(sock, ''.join(chunk).encode())
+            reply = self._read_line(sock).split(' ')
+        finally:
+            sock.close()
+        if reply[0] != 'OK' or len(reply) != 2:
+            raise HubError(f'Hub refused the rows: {" ".join(reply)}')
+        return int(reply[1])
+
+    @staticmethod
+    def _send_all(sock, data: bytes) -> None:
+        '''
+        Sends data on a socket, as many sends as it takes.
+
+        :param sock: The connected socket.
+        :param data: The bytes to send.
+        '''
+        view = memoryview(data)
+        while view:
+            sent = sock.send(view)
+            view = view[sent:]
+
+    def _read_line(self, sock) -> str:
+        '''
+        Receives the reply line of the hub.
+
+        :param sock: The connected socket.
+        :return: The line without its line break.
+        :raises HubError: If the hub closed the connection before replying.
+        '''
+        view = memoryview(self.buffer)
+        size = 0
+        while size < len(self.buffer):
+            received = sock.recv_into(view[size:])
+            if not received:
+                break
+            size += received
+            end = self.buffer.find(b'\n', 0, size)
+            if end >= 0:
+                return bytes(self.buffer[:end]).decode()
+        raise HubError('Connection closed by the hub')
+
+
+class HubServer:
+    '''
+    A class to receive rows from leaf monitors (see HubClient) on the local network,
+    so that a single monitor writes the rows of every monitor to the sheet under
+    one access token and over one connection, and the number of requests to the
+    Sheets API does not grow with the number of monitors.
+
+    The rows of each request are passed to the receive function, e.g. to put
+    them in a ReadingQueue that is uploaded with the hub's own rows, and the
+    reply is only sent once it returned. A leaf that did not get the reply sends
+    the rows again, so a row is dropped if it is the same as one of the last
+    rows received from its node and tab. Rows are not compared by their
+    timestamps, since the clock of a leaf may go back. This is kept in memory,
+    so rows may be delivered twice across a restart of the hub; delivery is
+    at-least-once.
+
+    Requests naming a node with characters other than NAME_CHARS, or a tab the
+    hub does not upload, are refused, since both end up in file and tab names.
+
+    The listening socket and the connections are non-blocking and polled from an
+    asyncio task like the LocalServer, and a request is dropped if it takes longer
+    than the timeout. Connections are not authenticated, so the hub should only
+    listen on a trusted network.
+    '''
+
+    def __init__(
+        self,
+        wifi_manager: WiFiManager,
+        receive,
+        port: int = 5005,
+        tabs: tuple = ('alarms', 'diagnostics'),
+        urgent: tuple = ('alarms',),
+        flush=None,
+        telemetry: Telemetry = None,
+        timeout: float = 30,
+        remember: int = 500
+    ):
+        '''
+        Initializes the HubServer class.
+
+        :param wifi_manager: An instance of the WiFiManager class, whose socket pool is used.
+        :param receive: A function taking a node, a tab (None for the readings) and a list of rows
+                        that stores them, raising an exception if they were not stored.
+        :param port: The TCP port to listen on.
+        :param tabs: The tabs rows are accepted for, besides the readings.
+        :param urgent: The tabs whose rows are sent on right away, by calling flush.
+        :param flush: Optional async function taking no arguments called after rows of an urgent
+                      tab were received, e.g. to upload them.
+        :param telemetry: Optional Telemetry to time every request and count received rows in.
+        :param timeout: The time in seconds a request may take in total.
+        :param remember: The number of rows of each node and tab remembered to drop duplicates,
+                         at least as many as a leaf sends at once.
+        '''
+        self.wifi_manager = wifi_manager
+        self.receive = receive
+        self.port = port
+        self.tabs = tabs
+        self.urgent = urgent
+        self.flush = flush
+        self.telemetry = telemetry
+        self.timeout = timeout
+        self.remember = remember
+        self.socket = None
+        # Every row, as a JSON line, must fit in the buffer
+        self.buffer = bytearray(4096)
+        # The start and end of the received bytes not yet read as lines
+        self.start_index = 0
+        self.end_index = 0
+        # The last rows received, as JSON lines, and the same lines as a set, by "<node>/<tab>"
+        self.recent = {}
+
+    def start(self) -> bool:
+        '''
+        Starts listening, once WiFi is connected.
+
+        :return: True if the server is listening, False otherwise.
+        '''
+        if self.socket is not None:
+            return True
+        pool = self.wifi_manager.pool
+        if pool is None or not self.wifi_manager.is_connected():
+            return False
+        sock = pool.socket(pool.AF_INET, pool.SOCK_STREAM)
+        try:
+            sock.setsockopt(pool.SOL_SOCKET, pool.SO_REUSEADDR, 1)
+            sock.bind(('0.0.0.0', self.port))
+            sock.listen(4)
+            sock.setblocking(False)
+        except OSError as e:
+            print('Failed to start the hub:', e)
+            sock.close()
+            return False
+        self.socket = sock
+        print('Receiving rows from other monitors on port', self.port)
+        return True
+
+    def stop(self) -> None:
+        '''
+        Stops listening.
+        '''
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    async def serve(self, poll_interval: float = 0.05) -> None:
+        '''
+        Receives rows forever, e.g. as a Scheduler background job.
+
+        :param poll_interval: The time in seconds between checks for new connections.
+        '''
+        while True:
+            if self.start():
+                await self.poll()
+            await asyncio.sleep(poll_interval)
+
+    async def poll(self, max_connections: int = 4) -> None:
+        '''
+        Receives from the connections that are waiting, without waiting for new ones.
+
+        :param max_connections: The maximum number of connections received from in one call.
+        '''
+        for _ in range(max_connections):
+            try:
+                connection, _ = self.socket.accept()
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    # The network went away, listen again once it is back
+                    print('Hub stopped:', e)
+                    self.stop()
+                return
+            start = self.telemetry.start() if self.telemetry else 0
+            tab = None
+            ok = True
+            try:
+                connection.setblocking(False)
+                tab = await self._handle(connection, time.monotonic() + self.timeout)
+            except Exception as e:
+                ok = False
+                print('Receiving rows failed:', e)
+            finally:
+                connection.close()
+            if self.telemetry:
+                self.telemetry.stop('hub', start, ok)
+            if ok and tab in self.urgent and self.flush:
+                try:
+                    await self.flush()
+                except Exception as e:
+                    # The rows are queued, so the next periodic upload sends them
+                    print('Sending urgent rows failed:', e)
+                    if self.telemetry:
+                        self.telemetry.count('hub_flush_failures')
+
+    async def _read_line(self, connection, deadline: float) -> bytes:
+        '''
+        Receives the next line of a request.
+
+        :param connection: The connected socket.
+        :param deadline: The time.monotonic() by which the request must have been received.
+        :return: The line as bytes without its line break, or None if the connection was closed.
+        :raises ValueError: If a line does not fit in the buffer.
+        '''
+        view = memoryview(self.buffer)
+        while True:
+            start = self.start_index
+            end = self.end_index
+            newline = self.buffer.find(b'\n', start, end)
+            if newline >= 0:
+                self.start_index = newline + 1
+                return bytes(self.buffer[start:newline])
+            if start:
+                # Move the partial line to the start of the buffer
+                self.buffer[:end - start] = self.buffer[start:end]
+                self.end_index = end = end - start
+                self.start_index = 0
+            if end == len(self.buffer):
+                raise ValueError('Line longer than the buffer')
+            received = await wait(lambda: connection.recv_into(view[end:]), deadline)
+            if not received:
+                return None
+            self.end_index += received
+
+    def _remember(self, recent: tuple, lines: list) -> None:
+        '''
+        Records rows as received, forgetting the oldest beyond the number remembered.
+
+        :param recent: The list and set of the last lines of the node and tab, updated in place.
+        :param lines: The lines of the rows that were stored.
+        '''
+        order, seen = recent
+        order.extend(lines)
+        seen.update(lines)
+        excess = len(order) - self.remember
+        if excess > 0:
+            for line in order[:excess]:
+                seen.discard(line)
+            del order[:excess]
+
+    async def _handle(self, connection, deadline: float, batch_size: int = 32) -> str:
+        '''
+        Receives the rows of one request, passes them on and replies.
+
+        :param connection: The connected socket.
+        :param deadline: The time.monotonic() by which the reply must have been sent.
+        :param batch_size: The number of rows passed to the receive function at a time.
+        :return: The tab of the rows, None for the readings.
+        '''
+        self.start_index = 0
+        self.end_index = 0
+        request = (await self._read_line(connection, deadline) or b'').decode().split(' ')
+        if len(request) != 4 or request[0] != MAGIC or not request[3].isdigit():
+            await send_all(connection, b'ERR bad request\n', deadline)
+            raise ValueError('Bad request')
+        node, tab, count = request[1], request[2], int(request[3])
+        if not node or any(c not in NAME_CHARS for c in node):
+            await send_all(connection, b'ERR bad node\n', deadline)
+            raise ValueError(f'Bad node name {node!r}')
+        tab = None if tab == '-' else tab
+        if tab is not None and tab not in self.tabs:
+            await send_all(connection, b'ERR unknown tab\n', deadline)
+            raise ValueError(f'Unknown tab {tab!r}')
+        key = f'{node}/{tab or "-"}'
+        if key not in self.recent:
+            self.recent[key] = ([], set())
+        recent = self.recent[key]
+        accepted = 0
+        duplicates = 0
+        batch = []
+        # Only remember the rows once they were stored, so they are accepted again if that fails
+        lines = []
+        for index in range(count):
+            line = await self._read_line(connection, deadline)
+            if line is None:
+                raise HubError(f'Connection closed after {index} of {count} rows')
+            row = json.loads(line)
+            if not isinstance(row, list) or not row or not isinstance(row[0], int):
+                raise ValueError('Rows must start with their timestamp')
+            if line in recent[1] or line in lines:
+                duplicates += 1
+                continue
+            batch.append(row)
+            lines.append(line)
+            if len(batch) == batch_size:
+                self.receive(node, tab, batch)
+                accepted += len(batch)
+                self._remember(recent, lines)
+                batch = []
+                lines = []
+                # Let the sampling tasks run between batches
+                await asyncio.sleep(0)
+        if batch:
+            self.receive(node, tab, batch)
+            accepted += len(batch)
+            self._remember(recent, lines)
+        await send_all(connection, f'OK {accepted}\n'.encode(), deadline)
+        if self.telemetry:
+            self.telemetry.count('hub_rows_received', accepted)
+            if duplicates:
+                self.telemetry.count('hub_rows_duplicate', duplicates)
+        return tab
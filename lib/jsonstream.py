@@ -0,0 +1,192 @@
+import json
+
+class RowStream:
+    '''
+    A read-only binary file-like object of a JSON document with a "values" array
+    of rows, encoded one row at a time as it is read.
+
+    Passed as the data of a request, the document is sent a piece at a time, so
+    the whole encoded body is never in memory and the peak heap does not grow
+    with the number of rows beyond the rows themselves. The length is found by
+    encoding the rows once more without keeping them, so rows must be a sequence
+    that can be iterated more than once, e.g. a list.
+    '''
+
+    def __init__(self, fields: dict, rows):
+        '''
+        Initializes the RowStream class.
+
+        :param fields: The other fields of the document, e.g. {'range': 'Sheet1!A1'}.
+        :param rows: The rows of the "values" array.
+        '''
+        head = json.dumps(fields)[:-1]
+        self.head = (head + ', "values": [' if fields else '{"values": [').encode()
+        self.rows = rows
+        self.length = None
+        self.position = 0
+        self.pieces = None
+        self.pending = b''
+        self.offset = 0
+        self.seek(0)
+
+    def _pieces(self):
+        '''
+        Encodes the document a piece at a time.
+
+        :return: A generator of bytes.
+        '''
+        yield self.head
+        separator = b''
+        for row in self.rows:
+            yield separator
+            yield json.dumps(row).encode()
+            separator = b', '
+        yield b']}'
+
+    def _length(self) -> int:
+        '''
+        Gets the length of the document, encoding it once without keeping it.
+
+        :return: The length in bytes.
+        '''
+        if self.length is None:
+            self.length = sum(len(piece) for piece in self._pieces())
+        return self.length
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        '''
+        Moves to the start or the end of the document, which is all a request needs
+        to find its length.
+
+        :param offset: The offset, 0 from the start or any offset from the end.
+        :param whence: 0 for the start, 2 for the end.
+        :return: The new position.
+        :raises OSError: For any other position.
+        '''
+        if whence == 0 and offset == 0:
+            self.pieces = self._pieces()
+            self.pending = b''
+            self.offset = 0
+            self.position = 0
+        elif whence == 2:
+            self.pieces = None
+            self.position = self._length() + offset
+        else:
+            raise OSError('RowStream can only seek to the start or the end')
+        return self.position
+
+    def tell(self) -> int:
+        '''
+        Gets the position in the document.
+
+        :return: The number of bytes read since the start.
+        '''
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        '''
+        Reads the next bytes of the document into a buffer.
+
+        :param buffer: A bytearray or memoryview to fill.
+        :return: The number of bytes read, 0 at the end of the document.
+        '''
+        size = 0
+        while size < len(buffer):
+            if self.offset == len(self.pending):
+                if self.pieces is None:
+                    break
+                try:
+                    self.pending = next(self.pieces)
+                except StopIteration:
+                    self.pieces = None
+                    break
+                self.offset = 0
+                continue
+            count = min(len(buffer) - size, len(self.pending) - self.offset)
+            buffer[size:size + count] = self.pending[self.offset:self.offset + count]
+            self.offset += count
+            size += count
+        self.position += size
+        return size
+
+    def read(self, size: int = -1) -> bytes:
+        '''
+        Reads the next bytes of the document.
+
+        :param size: The maximum number of bytes, or -1 for the rest of the document.
+        :return: The bytes read, empty at the end of the document.
+        '''
+        if size < 0:
+            size = self._length() - self.position
+        buffer = bytearray(size)
+        return bytes(memoryview(buffer)[:self.readinto(buffer)])
+
+
+def iter_values(chunks, key: bytes = b'"values"'):
+    '''
+    Parses the rows of the "values" array of a JSON document as it arrives, e.g. the
+    response of a Sheets API read, without holding the whole document in memory.
+
+    Only the row being parsed is kept, so memory use does not grow with the
+    number of rows. The rest of the document is skipped without being checked.
+
+    :param chunks: An iterable of bytes of the document, e.g. a response's iter_content.
+    :param key: The quoted name of the array.
+    :return: A generator of the rows as lists.
+    '''
+    chunks = iter(chunks)
+    head = bytearray()
+    data = None
+    # Skip to the start of the array
+    for chunk in chunks:
+        head.extend(chunk)
+        index = head.find(key)
+        if index < 0:
+            # Keep enough to find a key cut in two by a chunk boundary
+            del head[:-len(key)]
+            continue
+        bracket = head.find(b'[', index)
+        if bracket >= 0:
+            data = bytes(head[bracket + 1:])
+            break
+    if data is None:
+        # A range without any values has no array
+        return
+    del head
+
+    row = bytearray()
+    depth = 0
+    in_string = False
+    escape = False
+    while True:
+        start = 0
+        for index, byte in enumerate(data):
+            if in_string:
+                if escape:
+                    escape = False
+                elif byte == 0x5C:
+                    escape = True
+                elif byte == 0x22:
+                    in_string = False
+            elif byte == 0x22:
+                in_string = True
+            elif byte == 0x5B:
+                if not depth:
+                    start = index
+                depth += 1
+            elif byte == 0x5D:
+                if not depth:
+                    # The end of the array. The rest is read so that a response is complete.
+                    for _ in chunks:
+                        pass
+                    return
+                depth -= 1
+                if not depth:
+                    row.extend(data[start:index + 1])
+                    yield json.loads(row.decode())
+                    row = bytearray()
+        if depth:
+            row.extend(data[start:])
+        data = next(chunks, None)
+        if data is None:
+            return
@@ -0,0 +1,300 @@
+import asyncio
+import errno
+import json
+import time
+from nbsocket import wait, send_all
+from readinghistory import ReadingHistory
+from telemetry import Telemetry
+from wifimanager import WiFiManager
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 503: 'Service Unavailable'}
+
+class LocalServer:
+    '''
+    A class to serve the latest and recent readings over HTTP on the local network,
+    so dashboards can poll the device without going through the sheet.
+
+        GET /latest                      the most recent reading
+        GET /history?start=...&end=...   the readings in a time range, the last hour by default
+
+    Readings come from a ReadingHistory in memory. Older ranges are read from the
+    backfill function, e.g. the record log on the SD card. The listening socket is
+    non-blocking and polled from an asyncio task, so sampling carries on between
+    requests, and a long response gives way to other tasks between chunks.
+    Connections are non-blocking too: a client that is slow to send or receive
+    gives way to other tasks while it is waited for, and is dropped once its
+    request takes longer than timeout seconds.
+    '''
+
+    def __init__(
+        self,
+        wifi_manager: WiFiManager,
+        history: ReadingHistory,
+        channels: list,
+        backfill=None,
+        port: int = 80,
+        max_rows: int = 1000,
+        timeout: float = 30,
+        backfill_rows: int = 64,
+        telemetry: Telemetry = None
+    ):
+        '''
+        Initializes the LocalServer class.
+
+        :param wifi_manager: An instance of the WiFiManager class, whose socket pool is used.
+        :param history: The ReadingHistory to serve readings from.
+        :param channels: The name of each channel of the readings, e.g. ['temperature', 'depth', 'ph'].
+        :param backfill: Optional function taking a start and end time that returns a generator
+                         of readings like those of the history, for ranges older than the history.
+        :param port: The TCP port to listen on.
+        :param max_rows: The maximum number of readings in one response.
+        :param timeout: The longest time in seconds a request may take, from accepting it
+                        to sending the last byte of the response.
+        :param backfill_rows: The number of readings of the backfill read at a time, with
+                              other tasks let run in between.
+        :param telemetry: Optional Telemetry to time every request in.
+        '''
+        self.wifi_manager = wifi_manager
+        self.history = history
+        self.channels = channels
+        self.backfill = backfill
+        self.port = port
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self.backfill_rows = backfill_rows
+        self.telemetry = telemetry
+        self.socket = None
+        self.buffer = bytearray(1024)
+
+    def start(self) -> bool:
+        '''
+        Starts listening, once WiFi is connected.
+
+        :return: True if the server is listening, False otherwise.
+        '''
+        if self.socket is not None:
+            return True
+        pool = self.wifi_manager.pool
+        if pool is None or not self.wifi_manager.is_connected():
+            return False
+        sock = pool.socket(pool.AF_INET, pool.SOCK_STREAM)
+        try:
+            sock.setsockopt(pool.SOL_SOCKET, pool.SO_REUSEADDR, 1)
+            sock.bind(('0.0.0.0', self.port))
+            sock.listen(2)
+            sock.setblocking(False)
+        except OSError as e:
+            print('Failed to start the local server:', e)
+            sock.close()
+            return False
+        self.socket = sock
+        print('Serving readings on port', self.port)
+        return True
+
+    def stop(self) -> None:
+        '''
+        Stops listening.
+        '''
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    async def serve(self, poll_interval: float = 0.05) -> None:
+        '''
+        Answers requests forever, e.g. as a Scheduler background job.
+
+        :param poll_interval: The time in seconds between checks for new connections.
+        '''
+        while True:
+            if self.start():
+                await self.poll()
+            await asyncio.sleep(poll_interval)
+
+    async def poll(self, max_connections: int = 4) -> None:
+        '''
+        Answers the connections that are waiting, without waiting for new ones.
+
+        :param max_connections: The maximum number of connections answered in one call.
+        '''
+        for _ in range(max_connections):
+            try:
+                connection, _ = self.socket.accept()
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    # The network went away, listen again once it is back
+                    print('Local server stopped:', e)
+                    self.stop()
+                return
+            start = self.telemetry.start() if self.telemetry else 0
+            ok = True
+            try:
+                connection.setblocking(False)
+                await self._handle(connection, time.monotonic() + self.timeout)
+            except Exception as e:
+                ok = False
+                print('Local request failed:', e)
+            finally:
+                connection.close()
+            if self.telemetry:
+                self.telemetry.stop('local_http', start, ok)
+
+    async def _read_request(self, connection, deadline: float) -> str:
+        '''
+        Reads the request line and headers of a request.
+
+        :param connection: The connected socket.
+        :param deadline: The time.monotonic() by which the request must have been read.
+        :return: The request line, e.g. 'GET /latest HTTP/1.1'.
+        '''
+        view = memoryview(self.buffer)
+        size = 0
+        while size < len(self.buffer):
+            received = await wait(lambda: connection.recv_into(view[size:]), deadline)
+            if not received:
+                break
+            size += received
+            if b'\r\n\r\n' in self.buffer[:size]:
+                break
+        end = self.buffer.find(b'\r\n', 0, size)
+        return bytes(self.buffer[:end if end >= 0 else size]).decode()
+
+    async def _handle(self, connection, deadline: float) -> None:
+        '''
+        Answers one request.
+
+        :param connection: The connected socket.
+        :param deadline: The time.monotonic() by which the response must have been sent.
+        '''
+        parts = (await self._read_request(connection, deadline)).split(' ')
+        if len(parts) < 2:
+            await self._respond(connection, deadline, 400, {'error': 'bad request'})
+            return
+        method, target = parts[0], parts[1]
+        if method != 'GET':
+            await self._respond(connection, deadline, 405, {'error': 'only GET is supported'})
+            return
+        path, _, query = target.partition('?')
+        params = {}
+        for param in query.split('&'):
+            name, _, value = param.partition('=')
+            if name:
+                params[name] = value
+
+        if path in ('/', '/latest'):
+            reading = self.history.latest()
+            if reading is None:
+                await self._respond(connection, deadline, 503, {'error': 'no readings yet'})
+                return
+            result = {'time': reading[0]}
+            for name, value in zip(self.channels, reading[1:]):
+                result[name] = None if value is None else round(value, 2)
+            await self._respond(connection, deadline, 200, result)
+        elif path == '/history':
+            now = int(time.time())
+            try:
+                start = int(params.get('start', now - 3600))
+                end = int(params.get('end', now))
+            except ValueError:
+                await self._respond(connection, deadline, 400, {'error': 'start and end must be seconds since the epoch'})
+                return
+            await self._stream_history(connection, deadline, start, end)
+        else:
+            await self._respond(connection, deadline, 404, {'error': 'not found'})
+
+    async def _stream_history(self, connection, deadline: float, start: int, end: int) -> None:
+        '''
+        Sends the readings in a time range as JSON, a chunk at a time.
+
+        :param connection: The connected socket.
+        :param deadline: The time.monotonic() by which the response must have been sent.
+        :param start: The start of the range in seconds since the epoch.
+        :param end: The end of the range in seconds since the epoch (inclusive).
+        '''
+        await send_all(connection, (self._head(200) + '{"channels":[' + ','.join(
+            f'"{name}"' for name in self.channels
+        ) + '],"readings":[').encode(), deadline)
+        rows = 0
+        chunk = []
+        truncated = False
+        for reading in self._readings(start, end):
+            if reading is None:
+                # Let the sampling tasks run between windows of the backfill
+                await asyncio.sleep(0)
+                continue
+            if rows == self.max_rows:
+                truncated = True
+                break
+            chunk.append(('[' if not rows else ',[') + ','.join(
+                [str(reading[0])] + ['null' if value is None else f'{value:.2f}' for value in reading[1:]]
+            ) + ']')
+            rows += 1
+            if len(chunk) == 32:
+                await send_all(connection, ''.join(chunk).encode(), deadline)
+                chunk = []
+                # Let the sampling tasks run between chunks
+                await asyncio.sleep(0)
+        chunk.append('],"truncated":' + ('true' if truncated else 'false') + '}')
+        await send_all(connection, ''.join(chunk).encode(), deadline)
+
+    def _readings(self, start: int, end: int):
+        '''
+        Gets the readings in a time range, from the backfill for the part older than the
+        history and from the history for the rest.
+
+        The backfill is read a window of readings at a time, each window starting after
+        the last reading of the one before, so that a long range does not keep reading
+        the SD card without giving way to other tasks.
+
+        :param start: The start of the range in seconds since the epoch.
+        :param end: The end of the range in seconds since the epoch (inclusive).
+        :return: A generator of readings, with None between windows of the backfill.
+        '''
+        oldest = self.history.oldest()
+        if self.backfill and (oldest is None or start < oldest):
+            backfill_end = end if oldest is None else min(end, oldest - 1)
+            window_start = start
+            while window_start <= backfill_end:
+                window = self.backfill(window_start, backfill_end)
+                rows = 0
+                for reading in window:
+                    yield reading
+                    rows += 1
+                    if rows == self.backfill_rows:
+                        break
+                # Closing the window ends its read of the SD card before other tasks run
+                window.close()
+                if rows < self.backfill_rows:
+                    break
+                yield None
+                window_start = reading[0] + 1
+        yield from self.history.query(start, end)
+
+    def _head(self, status: int, length: int = None) -> str:
+        '''
+        Builds the status line and headers of a JSON response.
+
+        :param status: The HTTP status code.
+        :param length: Optional length of the body in bytes.
+        :return: The status line and headers, ending with a blank line.
+        '''
+        head = (
+            f'HTTP/1.1 {status} {_REASONS[status]}\r\n'
+            'Content-Type: application/json\r\n'
+            'Access-Control-Allow-Origin: *\r\n'
+            'Connection: close\r\n'
+        )
+        if length is not None:
+            head += f'Content-Length: {length}\r\n'
+        return head + '\r\n'
+
+    async def _respond(self, connection, deadline: float, status: int, result: dict) -> None:
+        '''
+        Sends a whole JSON response.
+
+        :param connection: The connected socket.
+        :param deadline: The time.monotonic() by which the response must have been sent.
+        :param status: The HTTP status code.
+        :param result: The body, encoded as JSON.
+        '''
+        body = json.dumps(result).encode()
+        await send_all(connection, self._head(status, len(body)).encode() + body, deadline)
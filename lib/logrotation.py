@@ -0,0 +1,247 @@
+import struct
+from array import array
+from sdcard import SDCard
+from telemetry import Telemetry
+
+# Manifest header: number of the oldest segment (uint32), number of segments (uint32)
+MANIFEST_FORMAT = '<II'
+MANIFEST_SIZE = struct.calcsize(MANIFEST_FORMAT)
+
+class LogRotation:
+    '''
+    A class to keep an append-only log on the SD card as numbered segment files of
+    at most segment_size bytes, e.g. "samples_0001.bin", "samples_0002.bin", and so on.
+
+    Once the segments take more than max_bytes, the oldest ones are removed, so
+    the log never fills the card. Closed segments can be compacted, e.g. into
+    rollups once they have been uploaded, to keep more history in the same space.
+
+    A manifest of the segments is kept in memory: the number of the oldest one,
+    and the first key (e.g. the timestamp of the first record), size and
+    compaction state of each. It is saved to "<prefix>manifest.bin" whenever a
+    segment is added, removed or compacted, so rotation and lookups never list
+    or stat the directory and their cost does not grow with the history. The
+    directory is only scanned if the manifest file is missing or damaged. The
+    manifest is saved before a new segment is written to and before old ones are
+    removed, so a reset never leaves it out of date.
+    '''
+
+    def __init__(
+        self,
+        sd_card: SDCard,
+        prefix: str,
+        suffix: str,
+        segment_size: int = 32768,
+        max_bytes: int = 16777216,
+        max_segments: int = 1024,
+        first_key=None,
+        telemetry: Telemetry = None
+    ):
+        '''
+        Initializes the LogRotation class.
+
+        :param sd_card: An instance of the SDCard class.
+        :param prefix: The start of the file names, e.g. 'samples_'.
+        :param suffix: The end of the file names, e.g. '.bin'.
+        :param segment_size: The maximum size of a segment in bytes.
+        :param max_bytes: The maximum size of all segments together in bytes.
+        :param max_segments: The maximum number of segments, which bounds the size of the manifest
+                             in memory when compacted segments are small.
+        :param first_key: Optional function taking a segment path that returns its first key,
+                          used when the directory has to be scanned. Keys are 0 without it.
+        :param telemetry: Optional Telemetry to count removed and compacted segments in.
+        '''
+        self.sd_card = sd_card
+        self.prefix = prefix
+        self.suffix = suffix
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        self.max_segments = max_segments
+        self.first_key = first_key
+        self.telemetry = telemetry
+        self.manifest_file = f'{prefix}manifest.bin'
+        # The manifest: the number of the oldest segment, and the first key, size and
+        # compaction state of each segment from the oldest to the newest
+        self.base = 1
+        self.keys = array('L')
+        self.sizes = array('L')
+        self.compacted = bytearray()
+        self.total = 0
+        # Whether the next append starts a new segment
+        self.full = False
+        if not self._load():
+            self._scan()
+            self._save()
+
+    def path(self, number: int) -> str:
+        '''
+        Gets the file path of a segment.
+
+        :param number: The number of the segment.
+        :return: The file path, e.g. 'samples_0001.bin'.
+        '''
+        return f'{self.prefix}{number:04d}{self.suffix}'
+
+    def _load(self) -> bool:
+        '''
+        Loads the manifest from the SD card. The size of the newest segment is read
+        again, since the manifest is not saved on every append.
+
+        :return: True if the manifest was loaded, False if it is missing or damaged.
+        '''
+        try:
+            data = self.sd_card.read_bytes(self.manifest_file, 0, MANIFEST_SIZE + (self.max_segments + 1) * 9)
+        except OSError:
+            return False
+        if len(data) < MANIFEST_SIZE:
+            return False
+        base, count = struct.unpack_from(MANIFEST_FORMAT, data)
+        if len(data) != MANIFEST_SIZE + count * 9:
+            return False
+        self.base = base
+        self.keys = array('L', struct.unpack_from(f'<{count}I', data, MANIFEST_SIZE))
+        self.sizes = array('L', struct.unpack_from(f'<{count}I', data, MANIFEST_SIZE + count * 4))
+        self.compacted = bytearray(data[MANIFEST_SIZE + count * 8:])
+        if count:
+            self.sizes[-1] = self.sd_card.file_size(self.path(base + count - 1))
+        self.total = sum(self.sizes)
+        return True
+
+    def _scan(self) -> None:
+        '''
+        Rebuilds the manifest from the segments in the directory. Compacted segments
+        are not recognized and may be compacted again.
+        '''
+        numbers = []
+        for name in self.sd_card.list_files('', self.prefix):
+            number = name[len(self.prefix):len(name) - len(self.suffix)]
+            if name.endswith(self.suffix) and number.isdigit():
+                numbers.append(int(number))
+        numbers.sort()
+        # Only the segments after the last gap, which is where a removal was cut short
+        for index in range(len(numbers) - 1, 0, -1):
+            if numbers[index - 1] != numbers[index] - 1:
+                numbers = numbers[index:]
+                break
+        self.base = numbers[0] if numbers else 1
+        self.keys = array('L', [self.first_key(self.path(number)) if self.first_key else 0 for number in numbers])
+        self.sizes = array('L', [self.sd_card.file_size(self.path(number)) for number in numbers])
+        self.compacted = bytearray(len(numbers))
+        self.total = sum(self.sizes)
+
+    def _save(self) -> None:
+        '''
+        Saves the manifest to the SD card.
+        '''
+        count = len(self.sizes)
+        self.sd_card.replace_file(
+            self.manifest_file,
+            struct.pack(MANIFEST_FORMAT, self.base, count)
+            + struct.pack(f'<{count}I', *self.keys)
+            + struct.pack(f'<{count}I', *self.sizes)
+            + bytes(self.compacted)
+        )
+
+    def append(self, data: bytes, key: int = 0) -> None:
+        '''
+        Appends data to the newest segment, starting a new one if the data does not fit.
+        The data is never split between segments.
+
+        :param data: The bytes to append.
+        :param key: The first key of the data, e.g. the timestamp of its first record,
+                    kept as the first key of the segment if a new one is started.
+        '''
+        if not self.sizes or (self.sizes[-1] and (self.full or self.sizes[-1] + len(data) > self.segment_size)):
+            self.full = False
+            self.keys.append(key)
+            self.sizes.append(0)
+            self.compacted.append(0)
+            removed = self._evict()
+            # Save before removing, so that a reset never leaves the manifest listing removed segments
+            self._save()
+            for number in removed:
+                self.sd_card.remove_file(self.path(number))
+        self.sd_card.append_bytes(self.path(self.base + len(self.sizes) - 1), data)
+        self.sizes[-1] += len(data)
+        self.total += len(data)
+
+    def rotate(self) -> None:
+        '''
+        Starts a new segment on the next append, e.g. after a reset left the newest one
+        ending with a partial record.
+        '''
+        self.full = True
+
+    def _evict(self) -> range:
+        '''
+        Drops the oldest segments from the manifest until a full newest segment would
+        fit in max_bytes and there are at most max_segments, always keeping the newest.
+
+        :return: The numbers of the segments to remove.
+        '''
+        removed = 0
+        while (
+            self.total + self.segment_size > self.max_bytes or len(self.sizes) - removed > self.max_segments
+        ) and removed < len(self.sizes) - 1:
+            self.total -= self.sizes[removed]
+            removed += 1
+        if removed:
+            self.keys = self.keys[removed:]
+            self.sizes = self.sizes[removed:]
+            self.compacted = self.compacted[removed:]
+            if self.telemetry:
+                self.telemetry.count('log_segments_removed', removed)
+        self.base += removed
+        return range(self.base - removed, self.base)
+
+    def compact(self, compactor, before: int) -> bool:
+        '''
+        Compacts the oldest closed segment that has not been compacted and whose data
+        is all before a key. One segment at most is compacted per call, so the cost of
+        a call does not grow with the history.
+
+        :param compactor: A function taking a segment path and size that returns the compacted bytes.
+        :param before: The key before which data may be compacted, e.g. the time up to which it was uploaded.
+        :return: True if a segment was compacted, False otherwise.
+        '''
+        # The newest segment is still appended to, and a segment ends where the next begins
+        index = 0
+        while index < len(self.sizes) - 1 and self.compacted[index]:
+            index += 1
+        if index >= len(self.sizes) - 1 or self.keys[index + 1] > before:
+            return False
+        path = self.path(self.base + index)
+        data = compactor(path, self.sizes[index])
+        self.sd_card.replace_file(path, data)
+        self.total += len(data) - self.sizes[index]
+        self.sizes[index] = len(data)
+        self.compacted[index] = 1
+        self._save()
+        if self.telemetry:
+            self.telemetry.count('log_segments_compacted')
+        return True
+
+    def segments(self, key: int = None):
+        '''
+        Gets the segments that may hold data at or after a key, from the oldest to the newest.
+
+        :param key: Optional key, e.g. the start of a time range; every segment if None.
+        :return: A generator of (path, size) tuples.
+        '''
+        index = 0
+        if key is not None:
+            # Binary search for the last segment starting at or before the key
+            low = 0
+            high = len(self.keys)
+            while low < high:
+                middle = (low + high) // 2
+                if self.keys[middle] <= key:
+                    low = middle + 1
+                else:
+                    high = middle
+            index = max(low - 1, 0)
+        # The segments as they are now, even if some are removed while the caller reads
+        base = self.base
+        sizes = self.sizes
+        for index in range(index, len(sizes)):
+            yield self.path(base + index), sizes[index]
@@ -0,0 +1,283 @@
+import struct
+import time
+from wifimanager import WiFiManager
+
+# MQTT 3.1.1 packet types, in the high nibble of the first byte
+CONNECT = 0x10
+CONNACK = 0x20
+PUBLISH = 0x30
+PUBACK = 0x40
+PINGREQ = 0xC0
+PINGRESP = 0xD0
+DISCONNECT = 0xE0
+
+class MqttError(Exception):
+    '''
+    An error reported by the broker or a broken MQTT connection.
+    '''
+
+
+class MqttClient:
+    '''
+    A minimal MQTT 3.1.1 client that publishes over a long-lived connection.
+
+    The connection is opened on the first publish and kept open between
+    publishes, so a message costs a few bytes of framing rather than a TLS
+    handshake and HTTP headers. Messages are published with QoS 1 and a batch
+    is pipelined: every message is sent before waiting for the acknowledgements.
+    Calling ping more often than the keep-alive interval keeps the connection
+    open between publishes. A connection that was idle for longer than the
+    keep-alive interval, or that failed, is opened again on the next publish.
+    '''
+
+    def __init__(
+        self,
+        wifi_manager: WiFiManager,
+        host: str,
+        port: int = 1883,
+        client_id: str = 'hydroponic-monitor',
+        username: str = None,
+        password: str = None,
+        keepalive: int = 600,
+        tls: bool = False,
+        timeout: int = 10
+    ):
+        '''
+        Initializes the MqttClient class.
+
+        :param wifi_manager: An instance of the WiFiManager class, whose socket pool is used.
+        :param host: The host name of the broker.
+        :param port: The port of the broker, usually 1883, or 8883 with TLS.
+        :param client_id: The client identifier sent to the broker.
+        :param username: Optional user name.
+        :param password: Optional password.
+        :param keepalive: The keep-alive interval in seconds sent to the broker, 0 to disable it.
+        :param tls: Whether to connect with TLS.
+        :param timeout: The socket timeout in seconds.
+        '''
+        self.wifi_manager = wifi_manager
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.tls = tls
+        self.timeout = timeout
+        self.socket = None
+        self.last_sent = 0
+        self.packet_id = 0
+
+    @staticmethod
+    def _string(text: str) -> bytes:
+        '''
+        Encodes a string with its two byte length prefix.
+
+        :param text: The string.
+        :return: The encoded string.
+        '''
+        data = text.encode()
+        return struct.pack('!H', len(data)) + data
+
+    @staticmethod
+    def _packet(packet_type: int, body: bytes) -> bytes:
+        '''
+        Builds a packet with its fixed header.
+
+        :param packet_type: The first byte of the fixed header.
+        :param body: The variable header and payload.
+        :return: The packet.
+        '''
+        header = bytearray((packet_type,))
+        length = len(body)
+        # The remaining length is a variable-length integer of 7 bits per byte
+        while True:
+            byte = length & 0x7F
+            length >>= 7
+            header.append(byte | 0x80 if length else byte)
+            if not length:
+                break
+        return bytes(header) + body
+
+    def _send_all(self, data: bytes) -> None:
+        '''
+        Sends data on the socket, as many sends as it takes.
+
+        :param data: The bytes to send, whole packets in a single call so that they
+                     are not held back waiting for an acknowledgement.
+        '''
+        view = memoryview(data)
+        while view:
+            sent = self.socket.send(view)
+            view = view[sent:]
+        self.last_sent = time.monotonic()
+
+    def _receive(self, size: int) -> bytearray:
+        '''
+        Receives exactly size bytes.
+
+        :param size: The number of bytes to receive.
+        :return: The bytes received.
+        :raises MqttError: If the broker closed the connection.
+        '''
+        data = bytearray(size)
+        view = memoryview(data)
+        received = 0
+        while received < size:
+            count = self.socket.recv_into(view[received:])
+            if not count:
+                raise MqttError('Connection closed by the broker')
+            received += count
+        return data
+
+    def _receive_packet(self) -> tuple:
+        '''
+        Receives a packet.
+
+        :return: A tuple of the first byte of the fixed header and the rest of the packet.
+        '''
+        packet_type = self._receive(1)[0]
+        length = 0
+        shift = 0
+        while True:
+            byte = self._receive(1)[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return packet_type, self._receive(length) if length else b''
+
+    def connect(self) -> None:
+        '''
+        Opens the connection to the broker.
+
+        :raises MqttError: If the broker refuses the connection.
+        '''
+        pool = self.wifi_manager.pool
+        if pool is None:
+            raise RuntimeError('Not connected to WiFi')
+        address = pool.getaddrinfo(self.host, self.port)[0][4]
+        sock = pool.socket(pool.AF_INET, pool.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        if self.tls:
+            sock = self.wifi_manager.ssl_context.wrap_socket(sock, server_hostname=self.host)
+        self.socket = sock
+        try:
+            sock.connect(address)
+            # Clean session, with the user name and password flags if they are set
+            flags = 0x02
+            payload = self._string(self.client_id)
+            if self.username:
+                flags |= 0x80
+                payload += self._string(self.username)
+                if self.password:
+                    flags |= 0x40
+                    payload += self._string(self.password)
+            self._send_all(self._packet(
+                CONNECT, self._string('MQTT') + struct.pack('!BBH', 4, flags, self.keepalive) + payload
+            ))
+            packet_type, body = self._receive_packet()
+            if packet_type != CONNACK or len(body) != 2:
+                raise MqttError('Expected CONNACK')
+            if body[1]:
+                raise MqttError(f'Connection refused with code {body[1]}')
+        except Exception:
+            self._drop()
+            raise
+
+    def is_connected(self) -> bool:
+        '''
+        Checks if the connection is open and has not been idle past its keep-alive interval,
+        after which the broker drops it. Without a keep-alive interval the broker never
+        drops an idle connection.
+
+        :return: True if connected, False otherwise.
+        '''
+        if self.socket is None:
+            return False
+        return not self.keepalive or time.monotonic() - self.last_sent < self.keepalive
+
+    def publish_many(self, messages: list) -> None:
+        '''
+        Publishes messages with QoS 1, waiting until the broker has acknowledged all of them.
+
+        :param messages: A list of (topic, payload) tuples, with the payload as str or bytes.
+        :raises MqttError: If the connection fails. The connection is dropped first.
+        '''
+        if not self.is_connected():
+            # The broker has dropped an idle connection by now
+            self._drop()
+            self.connect()
+        try:
+            waiting = set()
+            packets = []
+            for topic, payload in messages:
+                self.packet_id = self.packet_id % 65535 + 1
+                if isinstance(payload, str):
+                    payload = payload.encode()
+                packets.append(self._packet(
+                    PUBLISH | 0x02, self._string(topic) + struct.pack('!H', self.packet_id) + payload
+                ))
+                waiting.add(self.packet_id)
+            self._send_all(b''.join(packets))
+            while waiting:
+                packet_type, body = self._receive_packet()
+                if packet_type == PUBACK:
+                    waiting.discard(struct.unpack('!H', body)[0])
+        except Exception as e:
+            self._drop()
+            if isinstance(e, MqttError):
+                raise
+            raise MqttError(f'Publish failed: {e}')
+
+    def ping(self) -> None:
+        '''
+        Pings the broker if the connection is open, so the broker does not drop it while idle.
+
+        :raises MqttError: If the connection fails. The connection is dropped first.
+        '''
+        if not self.is_connected():
+            # Opened again on the next publish
+            self._drop()
+            return
+        try:
+            self._send_all(self._packet(PINGREQ, b''))
+            while self._receive_packet()[0] != PINGRESP:
+                pass
+        except Exception as e:
+            self._drop()
+            if isinstance(e, MqttError):
+                raise
+            raise MqttError(f'Ping failed: {e}')
+
+    def publish(self, topic: str, payload) -> None:
+        '''
+        Publishes a message with QoS 1.
+
+        :param topic: The topic, e.g. 'hydroponics/readings'.
+        :param payload: The payload as str or bytes.
+        '''
+        self.publish_many([(topic, payload)])
+
+    def _drop(self) -> None:
+        '''
+        Closes the socket without telling the broker, e.g. after a failure.
+        '''
+        if self.socket is None:
+            return
+        try:
+            self.socket.close()
+        except OSError:
+            pass
+        self.socket = None
+
+    def close(self) -> None:
+        '''
+        Disconnects from the broker.
+        '''
+        if self.is_connected():
+            try:
+                self._send_all(self._packet(DISCONNECT, b''))
+            except OSError:
+                pass
+        self._drop()
@@ -0,0 +1,41 @@
+import asyncio
+import errno
+import time
+
+# Time in seconds between attempts of a call that would block, a short real sleep
+# rather than sleep(0), which would spin until the deadline
+RETRY_DELAY = 0.01
+
+async def wait(call, deadline: float):
+    '''
+    Calls a socket method of a non-blocking connection until it does not have to
+    wait, letting other tasks run in between.
+
+    :param call: A function taking no arguments that calls the socket method.
+    :param deadline: The time.monotonic() by which the call must have succeeded.
+    :return: The result of the call.
+    :raises OSError: If the deadline passed.
+    '''
+    while True:
+        try:
+            return call()
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+        if time.monotonic() > deadline:
+            raise OSError(errno.ETIMEDOUT, 'Request timed out')
+        await asyncio.sleep(RETRY_DELAY)
+
+
+async def send_all(connection, data: bytes, deadline: float) -> None:
+    '''
+    Sends data on a non-blocking connection, as many sends as it takes.
+
+    :param connection: The connected socket.
+    :param data: The bytes to send.
+    :param deadline: The time.monotonic() by which the data must have been sent.
+    '''
+    view = memoryview(data)
+    while view:
+        sent = await wait(lambda: connection.send(view), deadline)
+        view = view[sent:]
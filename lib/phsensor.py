@@ -1,26 +1,55 @@
 import json
+from array import array
 import analogio
 import board
 import time
 from sdcard import SDCard
+from adcsampler import AdcSampler
+from calibration import Calibration
 
 class PhSensor:
     '''
     A class to access the pH value from an Atlas Scientific analog pH sensor.
     '''
 
-    def __init__(self, pin: board.Pin, sd_card: SDCard, calibration_file: str):
+    def __init__(
+        self,
+        pin: board.Pin,
+        sd_card: SDCard,
+        calibration_file: str,
+        samples: int = 16,
+        method: str = 'median',
+        calibration_data: dict = None,
+        reference_values: tuple = (4.00, 7.00, 10.00)
+    ):
         '''
         Initializes the PHSensor class.
 
         :param pin: The pin to which the pH sensor is connected.
         :param sd_card: An instance of the SDCard class.
         :param calibration_file: The file path to save/load the calibration data.
+        :param samples: The number of ADC samples taken for each reading.
+        :param method: The AdcSampler filter used to reduce the samples.
+        :param calibration_data: Optional calibration data to use instead of loading it from the SD card.
+        :param reference_values: The pH of each buffer solution used by calibrate.
         '''
         self.pin = analogio.AnalogIn(pin)
+        self.sampler = AdcSampler(self.pin, samples, method)
+        self.last_counts = None
         self.sd_card = sd_card
         self.calibration_file = calibration_file
-        self.calibration_data = self.load_calibration_data()
+        self.reference_values = reference_values
+        self.calibration_data = calibration_data or self.load_calibration_data()
+        self.calibration = self.build_calibration(self.calibration_data)
+
+    def read_counts(self) -> int:
+        '''
+        Reads the filtered raw value from the pH sensor.
+
+        :return: The filtered value in raw ADC counts (0-65535).
+        '''
+        self.last_counts = self.sampler.read()
+        return self.last_counts
 
     def read_voltage(self) -> float:
         '''
@@ -28,7 +57,7 @@ class PhSensor:
 
         :return: The voltage in volts.
         '''
-        return (self.pin.value * 3.3) / 65536
+        return (self.read_counts() * 3.3) / 65536
 
     def read_ph(self) -> float:
         '''
@@ -36,60 +65,57 @@ class PhSensor:
 
         :return: The pH value.
         '''
-        voltage = self.read_voltage()
-        if voltage > self.calibration_data['voltage_7']:
-            slope = self.calibration_data['slope_4_7']
-            intercept = self.calibration_data['intercept_4_7']
-        else:
-            slope = self.calibration_data['slope_7_10']
-            intercept = self.calibration_data['intercept_7_10']
-        ph_value = slope * voltage + intercept
-        return ph_value
+        return self.calibration.convert(self.read_voltage())
 
-    def calibrate(self):
+    def convert_counts(self, counts, out: array = None) -> array:
         '''
-        Calibrates the pH sensor using pH values of 4.00, 7.00, and 10.00.
-        '''
-        print('Calibrating pH sensor...')
+        Converts a sequence of raw ADC counts, e.g. a burst or a backfill, to pH values.
 
-        # Read voltage for pH 4.00
-        input('Place the sensor in pH 4.00 solution and press Enter...')
-        voltage_4 = self.read_voltage()
-        print(f'Voltage at pH 4.00: {voltage_4:.3f} V')
+        :param counts: A sequence of raw ADC counts.
+        :param out: Optional array('f') of the same length to write the values to.
+        :return: An array('f') of pH values.
+        '''
+        return self.calibration.convert_counts(counts, out)
 
-        # Read voltage for pH 7.00
-        input('Place the sensor in pH 7.00 solution and press Enter...')
-        voltage_7 = self.read_voltage()
-        print(f'Voltage at pH 7.00: {voltage_7:.3f} V')
+    def build_calibration(self, calibration_data: dict) -> Calibration:
+        '''
+        Builds the calibration table from saved calibration data.
 
-        # Read voltage for pH 10.00
-        input('Place the sensor in pH 10.00 solution and press Enter...')
-        voltage_10 = self.read_voltage()
-        print(f'Voltage at pH 10.00: {voltage_10:.3f} V')
+        :param calibration_data: The calibration data, either a list of (voltage, pH)
+                                 points or the original three-point format.
+        :return: The calibration table.
+        '''
+        if 'points' in calibration_data:
+            return Calibration.from_points(calibration_data['points'])
+        # Calibration data saved before N-point calibration was supported
+        return Calibration(
+            [calibration_data['voltage_7']],
+            [calibration_data['slope_7_10'], calibration_data['slope_4_7']],
+            [calibration_data['intercept_7_10'], calibration_data['intercept_4_7']]
+        )
 
-        # Calculate linear regression for pH 4.00 to 7.00
-        slope_4_7 = (7.00 - 4.00) / (voltage_7 - voltage_4)
-        intercept_4_7 = 7.00 - slope_4_7 * voltage_7
+    def calibrate(self):
+        '''
+        Calibrates the pH sensor using a buffer solution for each reference pH value.
+        '''
+        print('Calibrating pH sensor...')
 
-        # Calculate linear regression for pH 7.00 to 10.00
-        slope_7_10 = (10.00 - 7.00) / (voltage_10 - voltage_7)
-        intercept_7_10 = 10.00 - slope_7_10 * voltage_10
+        points = []
+        for ph_value in self.reference_values:
+            input(f'Place the sensor in pH {ph_value:.2f} solution and press Enter...')
+            self.sampler.reset()
+            voltage = self.read_voltage()
+            print(f'Voltage at pH {ph_value:.2f}: {voltage:.3f} V')
+            points.append([voltage, ph_value])
 
         # Save calibration data to file
-        self.calibration_data = {
-            'voltage_7': voltage_7,
-            'slope_4_7': slope_4_7,
-            'intercept_4_7': intercept_4_7,
-            'slope_7_10': slope_7_10,
-            'intercept_7_10': intercept_7_10
-        }
+        self.calibration = Calibration.from_points(points)
+        self.calibration_data = {'points': points}
         self.save_calibration_data()
 
         print('Calibration complete.')
-        print(f'Slope (4.00 to 7.00): {slope_4_7:.3f}')
-        print(f'Intercept (4.00 to 7.00): {intercept_4_7:.3f}')
-        print(f'Slope (7.00 to 10.00): {slope_7_10:.3f}')
-        print(f'Intercept (7.00 to 10.00): {intercept_7_10:.3f}')
+        for slope, intercept in zip(self.calibration.slopes, self.calibration.intercepts):
+            print(f'Slope: {slope:.3f}, Intercept: {intercept:.3f}')
 
     def save_calibration_data(self):
         '''
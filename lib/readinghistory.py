@@ -0,0 +1,92 @@
+from array import array
+
+class ReadingHistory:
+    '''
+    A class to keep the most recent readings in memory, e.g. to answer local
+    requests without reading the SD card or the sheet.
+
+    Readings are kept in fixed-size arrays used as a ring buffer, so the oldest
+    reading is overwritten once it is full and memory use does not grow.
+    Missing values are kept as NaN.
+    '''
+
+    def __init__(self, size: int, channels: int):
+        '''
+        Initializes the ReadingHistory class.
+
+        :param size: The number of readings kept.
+        :param channels: The number of values in each reading.
+        '''
+        self.size = size
+        self.channels = channels
+        self.times = array('L', [0] * size)
+        self.values = array('f', [0.0] * (size * channels))
+        self.next = 0
+        self.count = 0
+
+    def add(self, timestamp: int, values: list) -> None:
+        '''
+        Adds a reading, overwriting the oldest reading when the history is full.
+
+        :param timestamp: The time of the reading in seconds since the epoch.
+        :param values: The value of each channel. Channels that are None are kept as missing.
+        '''
+        index = self.next
+        self.times[index] = int(timestamp)
+        offset = index * self.channels
+        for channel in range(self.channels):
+            value = values[channel]
+            self.values[offset + channel] = float('nan') if value is None else value
+        self.next = (index + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def _reading(self, index: int) -> list:
+        '''
+        Gets a reading from the ring buffer.
+
+        :param index: The position of the reading in the ring buffer.
+        :return: A list of the timestamp and the value of each channel (None if missing).
+        '''
+        reading = [self.times[index]]
+        offset = index * self.channels
+        for channel in range(self.channels):
+            value = self.values[offset + channel]
+            reading.append(None if value != value else value)
+        return reading
+
+    def latest(self) -> list:
+        '''
+        Gets the most recent reading.
+
+        :return: A list of the timestamp and the value of each channel, or None if empty.
+        '''
+        if not self.count:
+            return None
+        return self._reading((self.next - 1) % self.size)
+
+    def oldest(self) -> int:
+        '''
+        Gets the time of the oldest reading kept.
+
+        :return: The time in seconds since the epoch, or None if empty.
+        '''
+        if not self.count:
+            return None
+        return self.times[(self.next - self.count) % self.size]
+
+    def query(self, start: int, end: int):
+        '''
+        Reads the readings within a time range, oldest first.
+
+        :param start: The start of the range in seconds since the epoch.
+        :param end: The end of the range in seconds since the epoch (inclusive).
+        :return: A generator of lists of the timestamp and the value of each channel.
+        '''
+        for offset in range(self.count):
+            index = (self.next - self.count + offset) % self.size
+            timestamp = self.times[index]
+            if timestamp > end:
+                return
+            if timestamp >= start:
+                yield self._reading(index)
@@ -0,0 +1,191 @@
+import json
+from sdcard import SDCard
+
+class ReadingQueue:
+    '''
+    A durable store-and-forward queue of sensor readings kept on the SD card.
+
+    Each reading is appended to the queue file as one JSON encoded line. A cursor
+    file records the byte offset of the first reading that has not been sent yet,
+    so pending readings survive network outages and restarts. Consumers that
+    are drained separately, e.g. several sinks, each keep their own offset past
+    the cursor. Delivery is at-least-once: a reset between a successful send and
+    the cursor update will send the same rows again.
+    '''
+
+    def __init__(self, sd_card: SDCard, queue_file: str, cursor_file: str, state: list = None):
+        '''
+        Initializes the ReadingQueue class.
+
+        :param sd_card: An instance of the SDCard class.
+        :param queue_file: The file path of the queue on the SD card.
+        :param cursor_file: The file path to save/load the send cursor.
+        :param state: Optional state returned by state to use instead of loading the cursor from the SD card.
+        '''
+        self.sd_card = sd_card
+        self.queue_file = queue_file
+        self.cursor_file = cursor_file
+        # Offsets of the consumers that have sent readings past the cursor, by name
+        self.offsets = {}
+        # The contents of the cursor file, None if it has not been read or written
+        self.saved = None
+        if state is None:
+            self.load_cursor()
+        else:
+            self.cursor = state[0]
+            self.offsets = dict(state[1])
+
+    def load_cursor(self) -> None:
+        '''
+        Loads the send cursor, and the offsets of the consumers that are ahead of
+        it, from the SD card.
+        '''
+        self.cursor = 0
+        self.offsets = {}
+        self.saved = None
+        try:
+            self.saved = self.sd_card.read_file(self.cursor_file)
+            fields = self.saved.split()
+            cursor = int(fields[0])
+            offsets = {}
+            for field in fields[1:]:
+                name, offset = field.split('=')
+                offsets[name] = int(offset)
+        except (OSError, ValueError, IndexError):
+            return
+        self.cursor = cursor
+        self.offsets = offsets
+
+    def save_cursor(self) -> None:
+        '''
+        Saves the send cursor, and the offsets of the consumers that are ahead of
+        it, to the SD card, e.g. '120 sheets=340'. Nothing is written if they have
+        not changed since they were last saved.
+        '''
+        fields = [str(self.cursor)]
+        fields.extend(f'{name}={offset}' for name, offset in self.offsets.items())
+        text = ' '.join(fields)
+        if text != self.saved:
+            self.sd_card.write_file(self.cursor_file, text)
+            self.saved = text
+
+    def state(self) -> list:
+        '''
+        Gets the send cursor and the offsets of the consumers, e.g. to keep them through deep sleep.
+
+        :return: A list of the cursor and a dictionary of the offsets by consumer.
+        '''
+        return [self.cursor, self.offsets]
+
+    def put(self, row: list) -> None:
+        '''
+        Adds a reading to the end of the queue.
+
+        :param row: The row of values to queue.
+        '''
+        self.sd_card.append_file(self.queue_file, json.dumps(row) + '\n')
+
+    def pending(self) -> int:
+        '''
+        Gets the amount of data waiting to be sent.
+
+        :return: The number of unsent bytes in the queue.
+        '''
+        return max(self.sd_card.file_size(self.queue_file) - self.cursor, 0)
+
+    def read_batch(self, max_rows: int, max_bytes: int, offset: int = None) -> tuple:
+        '''
+        Reads the next batch of unsent readings without removing them.
+
+        :param max_rows: The maximum number of rows to read.
+        :param max_bytes: The maximum number of bytes to read from the queue file.
+        :param offset: Optional byte offset to read from instead of the cursor.
+        :return: A tuple of the rows read and the number of bytes they occupy.
+        '''
+        if offset is None:
+            offset = self.cursor
+        block = self.sd_card.read_bytes(self.queue_file, offset, max_bytes)
+        rows = []
+        used = 0
+        while len(rows) < max_rows:
+            end = block.find(b'\n', used)
+            if end < 0:
+                break
+            line = block[used:end]
+            used = end + 1
+            if line:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    print('Skipping corrupt queue entry:', line)
+        if not used and len(block) == max_bytes:
+            raise ValueError('Queue entry larger than max_bytes')
+        return rows, used
+
+    def drain(self, send, max_rows: int = 500, max_bytes: int = 16384, consumer: str = None) -> int:
+        '''
+        Sends all pending readings in as few batches as possible.
+
+        The cursor is only advanced after send returns, so an exception from send
+        leaves the unsent readings in the queue for the next attempt.
+
+        With a consumer, e.g. one of several sinks, the readings are sent from the
+        offset of that consumer and only its offset is advanced, so a consumer that
+        failed does not make the others send the same readings again. Call release
+        once every consumer has been drained.
+
+        :param send: A function that takes a list of rows and raises on failure.
+        :param max_rows: The maximum number of rows to send in one batch.
+        :param max_bytes: The maximum number of queue bytes to send in one batch.
+        :param consumer: Optional name of the consumer the readings are sent to.
+        :return: The number of rows sent.
+        '''
+        sent = 0
+        offset = self.cursor if consumer is None else self.offsets.get(consumer, self.cursor)
+        end = self.sd_card.file_size(self.queue_file)
+        while offset < end:
+            rows, used = self.read_batch(max_rows, max_bytes, offset)
+            if not used:
+                break
+            if rows:
+                send(rows)
+                sent += len(rows)
+            offset += used
+            if consumer is None:
+                self.cursor = offset
+            else:
+                self.offsets[consumer] = offset
+            if offset < end:
+                self.save_cursor()
+        if consumer is None and self.cursor and not self.pending():
+            self.clear()
+        return sent
+
+    def release(self, consumers: list) -> None:
+        '''
+        Advances the cursor past the readings that every consumer has sent, and
+        removes the queue once they have all been sent. With no consumers nothing is
+        waiting to be sent, so the queue is removed.
+
+        :param consumers: The names of every consumer of the queue.
+        '''
+        if not consumers:
+            self.clear()
+            return
+        cursor = min(self.offsets.get(name, self.cursor) for name in consumers)
+        self.offsets = {name: offset for name, offset in self.offsets.items() if name in consumers and offset > cursor}
+        self.cursor = cursor
+        if self.cursor and not self.pending():
+            self.clear()
+        elif self.cursor or self.offsets or self.saved is not None:
+            self.save_cursor()
+
+    def clear(self) -> None:
+        '''
+        Removes the queue and cursor files once everything has been sent.
+        '''
+        self.sd_card.remove_file(self.queue_file)
+        self.sd_card.remove_file(self.cursor_file)
+        self.cursor = 0
+        self.offsets = {}
+        self.saved = None
@@ -0,0 +1,258 @@
+import struct
+from logrotation import LogRotation
+from sdcard import SDCard
+from telemetry import Telemetry
+
+# Record layout: timestamp (uint32), pH counts (uint16), depth counts (uint16),
+# temperature in hundredths of a degree Celsius (int16), flags (uint8), padding
+RECORD_FORMAT = '<IHHhBx'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+# Flags marking which values of a record are present
+FLAG_PH = 0x01
+FLAG_DEPTH = 0x02
+FLAG_TEMPERATURE = 0x04
+
+class RecordLog:
+    '''
+    A class to log readings on the SD card as fixed-size binary records.
+
+    Records hold the raw ADC counts of the analog sensors, so past data can be
+    recalibrated, and are written in blocks of several records at a time. The
+    log is kept in segments by a LogRotation, which removes the oldest segments
+    once the log reaches max_bytes. The first timestamp of every segment is in
+    its manifest, and the records of a segment are binary searched, so the start
+    of a time range is found without reading the whole log. Timestamps are
+    expected to increase.
+
+    Segments whose readings have been uploaded can be compacted: the records of
+    every compact_bucket seconds are replaced by one record of their mean counts
+    and temperature, so the same space holds far more history.
+    '''
+
+    def __init__(
+        self,
+        sd_card: SDCard,
+        prefix: str = 'samples_',
+        segment_size: int = 32768,
+        max_bytes: int = 16777216,
+        compact_bucket: int = 3600,
+        buffer_records: int = 16,
+        telemetry: Telemetry = None
+    ):
+        '''
+        Initializes the RecordLog class.
+
+        :param sd_card: An instance of the SDCard class.
+        :param prefix: The start of the file names of the segments on the SD card.
+        :param segment_size: The maximum size of a segment in bytes.
+        :param max_bytes: The maximum size of the log in bytes.
+        :param compact_bucket: The seconds of records compacted into one record, 0 to keep every record.
+        :param buffer_records: The number of records kept in memory between writes.
+                               Buffered records are lost if power fails before a flush.
+        :param telemetry: Optional Telemetry to count removed and compacted segments in.
+        '''
+        self.sd_card = sd_card
+        self.compact_bucket = compact_bucket
+        self.buffer = bytearray(RECORD_SIZE * buffer_records)
+        self.buffered = 0
+        self.rotation = LogRotation(
+            sd_card, prefix, '.bin', segment_size, max_bytes, first_key=self._first_timestamp, telemetry=telemetry
+        )
+        # A record cut short by a reset stays at the end of its segment, where queries
+        # ignore it, and the records after it start a new segment so they stay aligned
+        if self.rotation.sizes and self.rotation.sizes[-1] % RECORD_SIZE:
+            self.rotation.rotate()
+
+    def _first_timestamp(self, path: str) -> int:
+        '''
+        Reads the timestamp of the first record of a segment.
+
+        :param path: The file path of the segment.
+        :return: The timestamp, or 0 if the segment is empty.
+        '''
+        block = self.sd_card.read_bytes(path, 0, 4)
+        return struct.unpack('<I', block)[0] if len(block) == 4 else 0
+
+    def append(
+        self,
+        timestamp: int,
+        ph_counts: int = None,
+        depth_counts: int = None,
+        temperature: float = None
+    ) -> None:
+        '''
+        Adds a record to the log. Values that are None are marked as missing.
+
+        :param timestamp: The time of the reading in seconds since the epoch.
+        :param ph_counts: The raw ADC counts of the pH sensor.
+        :param depth_counts: The raw ADC counts of the water depth sensor.
+        :param temperature: The temperature in Celsius.
+        '''
+        flags = 0
+        if ph_counts is None:
+            ph_counts = 0
+        else:
+            flags |= FLAG_PH
+        if depth_counts is None:
+            depth_counts = 0
+        else:
+            flags |= FLAG_DEPTH
+        if temperature is None:
+            centidegrees = 0
+        else:
+            flags |= FLAG_TEMPERATURE
+            centidegrees = int(round(temperature * 100))
+
+        struct.pack_into(
+            RECORD_FORMAT,
+            self.buffer,
+            self.buffered * RECORD_SIZE,
+            int(timestamp),
+            ph_counts,
+            depth_counts,
+            centidegrees,
+            flags
+        )
+        self.buffered += 1
+        if self.buffered * RECORD_SIZE >= len(self.buffer):
+            self.flush()
+
+    def flush(self) -> None:
+        '''
+        Writes the buffered records to the SD card.
+        '''
+        if self.buffered:
+            self.rotation.append(
+                self.buffer[:self.buffered * RECORD_SIZE], struct.unpack_from('<I', self.buffer)[0]
+            )
+            self.buffered = 0
+
+    def _find(self, path: str, count: int, timestamp: int) -> int:
+        '''
+        Finds the first record of a segment at or after a time.
+
+        :param path: The file path of the segment.
+        :param count: The number of records in the segment.
+        :param timestamp: The time in seconds since the epoch.
+        :return: The number of the record in the segment, count if every record is earlier.
+        '''
+        low = 0
+        high = count
+        while low < high:
+            middle = (low + high) // 2
+            if struct.unpack('<I', self.sd_card.read_bytes(path, middle * RECORD_SIZE, 4))[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def query(self, start: int, end: int, block_records: int = 42):
+        '''
+        Reads the records logged within a time range.
+
+        :param start: The start of the range in seconds since the epoch.
+        :param end: The end of the range in seconds since the epoch (inclusive).
+        :param block_records: The number of records read from the SD card at a time.
+        :return: A generator of (timestamp, ph_counts, depth_counts, temperature, flags)
+                 tuples with the temperature in Celsius.
+        '''
+        self.flush()
+        for path, size in self.rotation.segments(start):
+            count = size // RECORD_SIZE
+            try:
+                number = self._find(path, count, start)
+                while number < count:
+                    block = self.sd_card.read_bytes(
+                        path, number * RECORD_SIZE, min(block_records, count - number) * RECORD_SIZE
+                    )
+                    if not block:
+                        break
+                    for offset in range(0, len(block) - RECORD_SIZE + 1, RECORD_SIZE):
+                        timestamp, ph_counts, depth_counts, centidegrees, flags = struct.unpack_from(
+                            RECORD_FORMAT, block, offset
+                        )
+                        if not flags:
+                            continue
+                        if timestamp > end:
+                            return
+                        if timestamp >= start:
+                            yield timestamp, ph_counts, depth_counts, centidegrees / 100, flags
+                    number += len(block) // RECORD_SIZE
+            except OSError:
+                # The segment was removed while it was being read
+                continue
+
+    def compact(self, before: int) -> bool:
+        '''
+        Compacts the oldest segment that has not been compacted, if all of its records
+        are before a time, e.g. the time up to which readings have been uploaded.
+
+        :param before: The time in seconds since the epoch.
+        :return: True if a segment was compacted, False otherwise.
+        '''
+        if not self.compact_bucket:
+            return False
+        return self.rotation.compact(self._compact_segment, before)
+
+    def _compact_segment(self, path: str, size: int, block_records: int = 42) -> bytes:
+        '''
+        Replaces the records of every bucket of compact_bucket seconds with one record at
+        the time of the first, with the mean of each value that is present.
+
+        :param path: The file path of the segment.
+        :param size: The size of the segment in bytes.
+        :param block_records: The number of records read from the SD card at a time.
+        :return: The compacted records.
+        '''
+        compacted = bytearray()
+        bucket = None
+        # The time of the first record of the bucket, the flags present, and the sum and
+        # number of the pH counts, depth counts and temperatures
+        first = 0
+        present = 0
+        sums = [0, 0, 0]
+        counts = [0, 0, 0]
+        count = size // RECORD_SIZE
+        number = 0
+        while number < count:
+            block = self.sd_card.read_bytes(
+                path, number * RECORD_SIZE, min(block_records, count - number) * RECORD_SIZE
+            )
+            if not block:
+                break
+            for offset in range(0, len(block) - RECORD_SIZE + 1, RECORD_SIZE):
+                record = struct.unpack_from(RECORD_FORMAT, block, offset)
+                if not record[4]:
+                    continue
+                if record[0] // self.compact_bucket != bucket:
+                    if bucket is not None:
+                        compacted.extend(self._mean_record(first, present, sums, counts))
+                    bucket = record[0] // self.compact_bucket
+                    first = record[0]
+                    present = 0
+                    sums = [0, 0, 0]
+                    counts = [0, 0, 0]
+                present |= record[4]
+                for index, flag in enumerate((FLAG_PH, FLAG_DEPTH, FLAG_TEMPERATURE)):
+                    if record[4] & flag:
+                        sums[index] += record[index + 1]
+                        counts[index] += 1
+            number += len(block) // RECORD_SIZE
+        if bucket is not None:
+            compacted.extend(self._mean_record(first, present, sums, counts))
+        return bytes(compacted)
+
+    @staticmethod
+    def _mean_record(timestamp: int, flags: int, sums: list, counts: list) -> bytes:
+        '''
+        Builds a record of the mean values of a bucket.
+
+        :param timestamp: The time of the record.
+        :param flags: The flags of the values present.
+        :param sums: The sums of the pH counts, depth counts and temperatures.
+        :param counts: The number of values in each sum.
+        :return: The record.
+        '''
+        means = [int(round(total / count)) if count else 0 for total, count in zip(sums, counts)]
+        return struct.pack(RECORD_FORMAT, timestamp, means[0], means[1], means[2], flags)
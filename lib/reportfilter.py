@@ -0,0 +1,103 @@
+class ReportFilter:
+    '''
+    A class to decide which readings are worth sending, so that rows are only
+    uploaded when something changed.
+
+    A reading is reported when any channel moved past its deadband since the
+    last reported reading, or when nothing was reported for the heartbeat
+    interval, so the sheet still shows that the device is alive. A move past
+    the larger excursion limit of a channel is significant enough to be sent
+    right away, without waiting for the next scheduled reading or upload.
+    '''
+
+    def __init__(self, deadbands: list, heartbeat: int, excursions: list = None):
+        '''
+        Initializes the ReportFilter class.
+
+        :param deadbands: The smallest change of each channel that is reported, or None
+                          for a channel whose changes alone are never reported.
+        :param heartbeat: The longest time in seconds between reported readings.
+        :param excursions: Optional change of each channel that is reported immediately,
+                           or None for a channel without one.
+        '''
+        self.deadbands = deadbands
+        self.heartbeat = heartbeat
+        self.excursions = excursions or [None] * len(deadbands)
+        self.last_time = None
+        self.last_values = None
+
+    def _moved(self, values: list, limits: list) -> bool:
+        '''
+        Checks whether any channel moved past its limit since the last reported reading.
+
+        :param values: The value of each channel.
+        :param limits: The limit of each channel, None for no limit.
+        :return: True if a channel moved past its limit.
+        '''
+        for value, last, limit in zip(values, self.last_values, limits):
+            if limit is None or value is None:
+                continue
+            if last is None or abs(value - last) >= limit:
+                return True
+        return False
+
+    def check(self, timestamp: int, values: list, excursions_only: bool = False) -> str:
+        '''
+        Checks whether a reading should be reported, remembering it as the last
+        reported reading if so.
+
+        :param timestamp: The time of the reading in seconds since the epoch.
+        :param values: The value of each channel.
+        :param excursions_only: Whether to report only excursions, e.g. when checking
+                                every sample between scheduled readings.
+        :return: 'excursion', 'change' or 'heartbeat' for the reason the reading is
+                 reported, or None if it is not.
+        '''
+        if self.last_values is None:
+            reason = None if excursions_only else 'heartbeat'
+        elif self._moved(values, self.excursions):
+            reason = 'excursion'
+        elif excursions_only:
+            reason = None
+        elif self._moved(values, self.deadbands):
+            reason = 'change'
+        elif timestamp - self.last_time >= self.heartbeat:
+            reason = 'heartbeat'
+        else:
+            reason = None
+        if reason:
+            self.last_time = timestamp
+            self.last_values = list(values)
+        return reason
+
+    def state(self) -> list:
+        '''
+        Gets the last reported reading, e.g. to keep it through deep sleep.
+
+        :return: A list of the time and values of the last reported reading.
+        '''
+        return [self.last_time, self.last_values]
+
+    def restore(self, state: list) -> None:
+        '''
+        Continues from a last reported reading saved with state.
+
+        :param state: A list returned by state.
+        '''
+        self.last_time, self.last_values = state
+
+
+def parse_limits(text: str, channels: list) -> list:
+    '''
+    Parses per-channel limits given as 'name=value,...', e.g. 'temperature=0.2,ph=0.05'.
+
+    :param text: The limits.
+    :param channels: The names of the channels in order.
+    :return: The limit of each channel, None for channels that are not given.
+    '''
+    limits = [None] * len(channels)
+    for limit in text.split(','):
+        if limit:
+            name, value = limit.split('=')
+            limits[channels.index(name.strip())] = float(value)
+    return limits
@@ -0,0 +1,188 @@
+import math
+from array import array
+
+class _MonotonicQueue:
+    '''
+    The positions of the window's candidates for its minimum or maximum, in a ring
+    buffer. Every position is added and removed at most once, so keeping the
+    extreme of a sliding window costs O(1) per value on average.
+    '''
+
+    def __init__(self, size: int, largest: bool):
+        '''
+        Initializes the _MonotonicQueue class.
+
+        :param size: The size of the window.
+        :param largest: True to keep the maximum, False for the minimum.
+        '''
+        self.size = size
+        self.largest = largest
+        self.positions = array('L', [0] * size)
+        self.head = 0
+        self.length = 0
+
+    def push(self, position: int, values: array) -> None:
+        '''
+        Adds the newest value of the window, dropping the values it outranks and the
+        value that left the window.
+
+        :param position: The sequence number of the value.
+        :param values: The ring buffer of the window's values.
+        '''
+        value = values[position % self.size]
+        while self.length:
+            last = values[self.positions[(self.head + self.length - 1) % self.size] % self.size]
+            if (last > value) if self.largest else (last < value):
+                break
+            self.length -= 1
+        if self.length and self.positions[self.head] + self.size <= position:
+            self.head = (self.head + 1) % self.size
+            self.length -= 1
+        self.positions[(self.head + self.length) % self.size] = position
+        self.length += 1
+
+    def value(self, values: array) -> float:
+        '''
+        Gets the extreme of the window.
+
+        :param values: The ring buffer of the window's values.
+        :return: The minimum or maximum, or None if the window is empty.
+        '''
+        return values[self.positions[self.head] % self.size] if self.length else None
+
+
+class RollingStats:
+    '''
+    A class to keep statistics of the last size values of a channel: the mean and
+    variance, updated with Welford's method as values enter and leave the window,
+    and the minimum and maximum, kept with monotonic queues.
+
+    Values and their timestamps are kept in fixed-size arrays, so an update costs
+    O(1) and allocates nothing. The mean and variance are recomputed from the
+    window once per size updates so that rounding errors of single-precision
+    floats do not build up.
+    '''
+
+    def __init__(self, size: int):
+        '''
+        Initializes the RollingStats class.
+
+        :param size: The number of values in the window.
+        '''
+        self.size = size
+        self.times = array('L', [0] * size)
+        self.values = array('f', [0.0] * size)
+        # The number of values added since the start, the position of the next value
+        self.added = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = _MonotonicQueue(size, False)
+        self.maximum = _MonotonicQueue(size, True)
+
+    def count(self) -> int:
+        '''
+        Gets the number of values in the window.
+
+        :return: The number of values, at most size.
+        '''
+        return min(self.added, self.size)
+
+    def add(self, timestamp: int, value: float) -> None:
+        '''
+        Adds a value, dropping the oldest one once the window is full.
+
+        :param timestamp: The time of the value in seconds since the epoch.
+        :param value: The value.
+        '''
+        index = self.added % self.size
+        if self.added >= self.size:
+            # Welford's update for a value replacing the oldest one
+            old = self.values[index]
+            mean = self.mean + (value - old) / self.size
+            self.m2 = max(self.m2 + (value - old) * (value - mean + old - self.mean), 0.0)
+            self.mean = mean
+        else:
+            delta = value - self.mean
+            self.mean += delta / (self.added + 1)
+            self.m2 += delta * (value - self.mean)
+        self.times[index] = int(timestamp)
+        self.values[index] = value
+        self.minimum.push(self.added, self.values)
+        self.maximum.push(self.added, self.values)
+        self.added += 1
+        if self.added % self.size == 0:
+            self._recompute()
+
+    def _recompute(self) -> None:
+        '''
+        Computes the mean and variance of the window again from its values.
+        '''
+        count = self.count()
+        mean = sum(self.values[index] for index in range(count)) / count
+        self.mean = mean
+        self.m2 = sum((self.values[index] - mean) ** 2 for index in range(count))
+
+    def variance(self) -> float:
+        '''
+        Gets the sample variance of the window.
+
+        :return: The variance, or 0 with fewer than two values.
+        '''
+        count = self.count()
+        return self.m2 / (count - 1) if count > 1 else 0.0
+
+    def std(self) -> float:
+        '''
+        Gets the sample standard deviation of the window.
+
+        :return: The standard deviation, or 0 with fewer than two values.
+        '''
+        return math.sqrt(self.variance())
+
+    def low(self) -> float:
+        '''
+        Gets the minimum of the window.
+
+        :return: The minimum, or None if the window is empty.
+        '''
+        return self.minimum.value(self.values)
+
+    def high(self) -> float:
+        '''
+        Gets the maximum of the window.
+
+        :return: The maximum, or None if the window is empty.
+        '''
+        return self.maximum.value(self.values)
+
+    def oldest(self) -> tuple:
+        '''
+        Gets the oldest value of the window.
+
+        :return: A tuple of its time and value, or None if the window is empty.
+        '''
+        if not self.added:
+            return None
+        index = self.added % self.size if self.added >= self.size else 0
+        return self.times[index], self.values[index]
+
+    def state(self) -> list:
+        '''
+        Gets the values of the window, e.g. to keep them through deep sleep.
+
+        :return: A list of [time, value] pairs from the oldest to the newest.
+        '''
+        start = self.added - self.count()
+        return [
+            [self.times[position % self.size], round(self.values[position % self.size], 3)]
+            for position in range(start, self.added)
+        ]
+
+    def restore(self, state: list) -> None:
+        '''
+        Continues from values saved with state.
+
+        :param state: A list returned by state.
+        '''
+        for timestamp, value in state:
+            self.add(timestamp, value)
@@ -0,0 +1,153 @@
+class RollupTier:
+    '''
+    A class to keep the running minimum, maximum, mean and count of several
+    channels over fixed time buckets, e.g. every 5 minutes or every hour.
+
+    Only the bucket in progress is kept, so memory use does not grow with the
+    number of samples. The bucket in progress is lost on a restart unless it
+    is saved with state and continued with restore.
+    '''
+
+    def __init__(self, name: str, bucket_seconds: int, channels: int):
+        '''
+        Initializes the RollupTier class.
+
+        :param name: The name of the tier, e.g. '1h'.
+        :param bucket_seconds: The length of a bucket in seconds.
+        :param channels: The number of values in each sample.
+        '''
+        self.name = name
+        self.bucket_seconds = bucket_seconds
+        self.bucket_start = None
+        self.counts = [0] * channels
+        self.minimums = [0.0] * channels
+        self.maximums = [0.0] * channels
+        self.sums = [0.0] * channels
+
+    def reset(self, bucket_start: int) -> None:
+        '''
+        Starts a new, empty bucket.
+
+        :param bucket_start: The start time of the bucket in seconds since the epoch.
+        '''
+        self.bucket_start = bucket_start
+        for channel in range(len(self.counts)):
+            self.counts[channel] = 0
+            self.sums[channel] = 0.0
+
+    def add(self, timestamp: int, values: list) -> list:
+        '''
+        Adds a sample to its bucket, finishing the current bucket if the sample
+        belongs to a later one.
+
+        :param timestamp: The time of the sample in seconds since the epoch.
+        :param values: The value of each channel. Channels that are None are skipped.
+        :return: The row of the finished bucket (see row), or None if no bucket finished.
+        '''
+        bucket_start = int(timestamp) - int(timestamp) % self.bucket_seconds
+        finished = None
+        if bucket_start != self.bucket_start:
+            if self.bucket_start is not None and max(self.counts):
+                finished = self.row()
+            self.reset(bucket_start)
+
+        for channel, value in enumerate(values):
+            if value is None:
+                continue
+            if self.counts[channel]:
+                if value < self.minimums[channel]:
+                    self.minimums[channel] = value
+                if value > self.maximums[channel]:
+                    self.maximums[channel] = value
+            else:
+                self.minimums[channel] = value
+                self.maximums[channel] = value
+            self.sums[channel] += value
+            self.counts[channel] += 1
+        return finished
+
+    def state(self) -> list:
+        '''
+        Gets the bucket in progress, e.g. to keep it through deep sleep.
+
+        :return: A list of the bucket start time and the per-channel counts,
+                 minimums, maximums and sums.
+        '''
+        return [self.bucket_start, self.counts, self.minimums, self.maximums, self.sums]
+
+    def restore(self, state: list) -> None:
+        '''
+        Continues a bucket saved with state.
+
+        :param state: A list returned by state.
+        '''
+        self.bucket_start, counts, minimums, maximums, sums = state
+        if len(counts) == len(self.counts):
+            self.counts, self.minimums, self.maximums, self.sums = counts, minimums, maximums, sums
+
+    def row(self) -> list:
+        '''
+        Gets the statistics of the current bucket.
+
+        :return: A list of the bucket start time and the number of samples, followed
+                 by the minimum, maximum and mean of each channel (None if empty).
+        '''
+        row = [self.bucket_start, max(self.counts)]
+        for channel, count in enumerate(self.counts):
+            if count:
+                row.extend((
+                    self.minimums[channel],
+                    self.maximums[channel],
+                    self.sums[channel] / count
+                ))
+            else:
+                row.extend((None, None, None))
+        return row
+
+
+class Rollup:
+    '''
+    A class to feed samples into several rollup tiers at once.
+    '''
+
+    def __init__(self, tiers: list, channels: int):
+        '''
+        Initializes the Rollup class.
+
+        :param tiers: A list of (name, bucket_seconds) tuples, one for each tier.
+        :param channels: The number of values in each sample.
+        '''
+        self.tiers = [RollupTier(name, seconds, channels) for name, seconds in tiers]
+
+    def add(self, timestamp: int, values: list) -> list:
+        '''
+        Adds a sample to every tier.
+
+        :param timestamp: The time of the sample in seconds since the epoch.
+        :param values: The value of each channel. Channels that are None are skipped.
+        :return: A list of (tier_name, row) tuples for the buckets that finished.
+        '''
+        finished = []
+        for tier in self.tiers:
+            row = tier.add(timestamp, values)
+            if row:
+                finished.append((tier.name, row))
+        return finished
+
+    def state(self) -> dict:
+        '''
+        Gets the bucket in progress of every tier, e.g. to keep them through deep sleep.
+
+        :return: A dictionary of the state of each tier by name.
+        '''
+        return {tier.name: tier.state() for tier in self.tiers}
+
+    def restore(self, state: dict) -> None:
+        '''
+        Continues the buckets saved with state. Tiers missing from the state start empty.
+
+        :param state: A dictionary returned by state.
+        '''
+        for tier in self.tiers:
+            if tier.name in state:
+                tier.restore(state[tier.name])
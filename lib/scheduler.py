@@ -0,0 +1,147 @@
+import asyncio
+import time
+from telemetry import Telemetry
+
+class Scheduler:
+    '''
+    A class to run periodic jobs as cooperative asyncio tasks.
+
+    Each job runs in its own task on a fixed schedule, so a slow job only delays
+    itself and the jobs that are due while it holds the processor. A job that
+    raises an exception is logged and runs again at its next scheduled time,
+    and a background job that raises one is logged and started again after a
+    delay, so neither stops the other jobs.
+    '''
+
+    def __init__(self, telemetry: Telemetry = None):
+        '''
+        Initializes the Scheduler class.
+
+        :param telemetry: Optional Telemetry to time every job run in.
+        '''
+        self.jobs = []
+        self.background_jobs = []
+        self.telemetry = telemetry
+
+    def every(self, interval: float, job, name: str = None, delay: float = 0) -> None:
+        '''
+        Adds a job that runs at a fixed interval.
+
+        :param interval: The time between runs in seconds.
+        :param job: An async function taking no arguments.
+        :param name: Optional name of the job used in log messages.
+        :param delay: Optional time in seconds before the first run.
+        '''
+        self.jobs.append((name or job.__name__, interval, job, delay))
+
+    def background(self, job, name: str = None, restart_delay: float = 10) -> None:
+        '''
+        Adds a job that runs for as long as the scheduler, e.g. a server loop. It is
+        not timed, and it does not run in run_due.
+
+        :param job: An async function taking no arguments that runs forever.
+        :param name: Optional name of the job used in log messages and telemetry.
+        :param restart_delay: The time in seconds before the job is started again if it stops.
+        '''
+        self.background_jobs.append((name or job.__name__, job, restart_delay))
+
+    async def _call(self, name: str, job) -> None:
+        '''
+        Runs a job once, logging any exception it raises.
+
+        :param name: The name of the job used in log messages.
+        :param job: An async function taking no arguments.
+        '''
+        start = self.telemetry.start() if self.telemetry else 0
+        ok = True
+        try:
+            await job()
+        except Exception as e:
+            ok = False
+            print(f'{name} failed:', e)
+        if self.telemetry:
+            self.telemetry.stop(name, start, ok)
+
+    async def _run_job(self, name: str, interval: float, job, delay: float) -> None:
+        '''
+        Runs a job forever on its schedule.
+
+        :param name: The name of the job used in log messages.
+        :param interval: The time between runs in seconds.
+        :param job: An async function taking no arguments.
+        :param delay: The time in seconds before the first run.
+        '''
+        next_run = time.monotonic() + delay
+        while True:
+            await asyncio.sleep(max(next_run - time.monotonic(), 0))
+            await self._call(name, job)
+            next_run += interval
+            # Skip runs that were missed rather than running them back to back
+            now = time.monotonic()
+            if next_run < now:
+                next_run = now
+
+    async def _run_background(self, name: str, job, restart_delay: float) -> None:
+        '''
+        Runs a background job forever, starting it again whenever it stops.
+
+        :param name: The name of the job used in log messages and telemetry.
+        :param job: An async function taking no arguments.
+        :param restart_delay: The time in seconds before the job is started again.
+        '''
+        while True:
+            try:
+                await job()
+            except Exception as e:
+                print(f'{name} failed:', e)
+            if self.telemetry:
+                self.telemetry.count(f'{name}_restarts')
+            await asyncio.sleep(restart_delay)
+
+    async def main(self) -> None:
+        '''
+        Starts a task for every job and waits for them forever.
+        '''
+        tasks = [
+            asyncio.create_task(self._run_job(name, interval, job, delay))
+            for name, interval, job, delay in self.jobs
+        ]
+        tasks.extend(
+            asyncio.create_task(self._run_background(name, job, restart_delay))
+            for name, job, restart_delay in self.background_jobs
+        )
+        await asyncio.gather(*tasks)
+
+    async def run_due(self, last_runs: dict) -> None:
+        '''
+        Runs every job that is due once, in the order the jobs were added, e.g. in a
+        single wake from deep sleep. Jobs that have never run are due immediately.
+
+        :param last_runs: A dictionary of the time.time() each job last ran by name,
+                          updated as the jobs run.
+        '''
+        for name, interval, job, _ in self.jobs:
+            now = time.time()
+            if name in last_runs and now - last_runs[name] < interval:
+                continue
+            last_runs[name] = now
+            await self._call(name, job)
+
+    def next_due(self, last_runs: dict) -> float:
+        '''
+        Gets the time until the next job is due.
+
+        :param last_runs: A dictionary of the time.time() each job last ran by name.
+        :return: The time in seconds until the next job is due.
+        '''
+        now = time.time()
+        return max(
+            min(last_runs.get(name, now) + interval - now for name, interval, _, _ in self.jobs),
+            0
+        )
+
+    def run(self) -> None:
+        '''
+        Runs the scheduler until the program is stopped.
+        '''
+        asyncio.run(self.main())
@@ -1,30 +1,98 @@
 import os
+import time
 import storage
 import adafruit_sdcard
 import busio
 import digitalio
 import board
+from telemetry import Telemetry
+
+class _AppendFile:
+    '''
+    A file kept open for appending, with the appended data not yet written.
+    '''
+
+    def __init__(self, file, position: int):
+        '''
+        Initializes the _AppendFile class.
+
+        :param file: The open file.
+        :param position: The size of the file when it was opened.
+        '''
+        self.file = file
+        self.position = position
+        self.buffer = bytearray()
+        # Monotonic time of the oldest data that has not been synced, None if there is none
+        self.since = None
+
 
 class SDCard:
     '''
     A class to manage file operations on an SD card using the adafruit_sdcard library.
+
+    Appends are buffered. A file that is appended to is kept open, and small
+    appends are combined in memory and written in whole blocks of block_size
+    bytes that end on a block boundary of the file, so the card writes each
+    sector once rather than once per append. The data of a file is written and
+    synced, updating the FAT, once its oldest data is max_age seconds old, on
+    flush, and before the file is read, rewritten or removed.
+
+    Appended data is only safe from a reset or power failure once it is synced:
+    up to max_age seconds of appends can be lost, so call flush or close before
+    deep sleep. write_file is synced before it returns.
     '''
 
-    def __init__(self, spi, cs_pin, mount_point: str):
+    def __init__(
+        self,
+        spi,
+        cs_pin,
+        mount_point: str,
+        telemetry: Telemetry = None,
+        block_size: int = 512,
+        max_age: float = 60,
+        max_open: int = 4
+    ):
         '''
         Initializes the SDCard class.
 
         :param spi: The SPI bus.
         :param cs_pin: The chip select pin for the SD card.
         :param mount_point: The mount point of the SD card.
+        :param telemetry: Optional Telemetry to time every write and count the bytes written and syncs in.
+        :param block_size: The size of the blocks appended data is written in, the sector size of the card.
+        :param max_age: The time in seconds appended data may wait before it is synced, 0 to sync every append.
+        :param max_open: The maximum number of files kept open for appending.
         '''
         self.spi = spi
         self.cs = digitalio.DigitalInOut(cs_pin)
         self.sdcard = adafruit_sdcard.SDCard(self.spi, self.cs)
         self.mount_point = mount_point
+        self.telemetry = telemetry
+        self.block_size = block_size
+        self.max_age = max_age
+        self.max_open = max_open
+        # Files open for appending by path, and their paths from the least to the most recently used
+        self.appends = {}
+        self.append_order = []
+        self.bytes_written = 0
+        self.flushes = 0
         self.vfs = storage.VfsFat(self.sdcard)
         storage.mount(self.vfs, self.mount_point)
 
+    def stats(self) -> dict:
+        '''
+        Gets the write statistics.
+
+        :return: A dictionary with the number of bytes written, syncs, files open for
+                 appending and bytes waiting to be written.
+        '''
+        return {
+            'bytes_written': self.bytes_written,
+            'flushes': self.flushes,
+            'open_files': len(self.append_order),
+            'buffered': sum(len(entry.buffer) for entry in self.appends.values())
+        }
+
     def file_exists(self, file_path: str) -> bool:
         '''
         Checks if a file exists on the SD card.
@@ -32,6 +100,8 @@ class SDCard:
         :param file_path: The path to the file to check.
         :return: True if the file exists, False otherwise.
         '''
+        if file_path in self.appends:
+            return True
         full_path = f'{self.mount_point}/{file_path}'
         try:
             os.stat(full_path)
@@ -48,9 +118,12 @@ class SDCard:
         :raises FileNotFoundError: If the file does not exist.
         '''
         full_path = f'{self.mount_point}/{file_path}'
-        if not self.file_exists(file_path):
+        self._close(file_path)
+        try:
+            file = open(full_path, 'r')
+        except OSError:
             raise OSError(f'File {full_path} does not exist.')
-        with open(full_path, 'r') as file:
+        with file:
             return file.read()
 
     def write_file(self, file_path: str, data: str) -> None:
@@ -61,20 +134,197 @@ class SDCard:
         :param data: The data to write to the file.
         '''
         full_path = f'{self.mount_point}/{file_path}'
+        self._close(file_path)
+        start = self.telemetry.start() if self.telemetry else 0
         with open(full_path, 'w') as file:
             file.write(data)
+        self.bytes_written += len(data)
+        if self.telemetry:
+            self.telemetry.stop('sd_write', start)
+            self.telemetry.count('sd_bytes_written', len(data))
 
     def append_file(self, file_path: str, data: str) -> None:
         '''
-        Appends data to a file on the SD card.
+        Appends data to a file on the SD card. The data may be buffered, see flush.
 
         :param file_path: The path to the file to append to.
         :param data: The data to append to the file.
         '''
+        self._append(file_path, data.encode())
+
+    def append_bytes(self, file_path: str, data: bytes) -> None:
+        '''
+        Appends binary data to a file on the SD card. The data may be buffered, see flush.
+
+        :param file_path: The path to the file to append to.
+        :param data: The bytes to append to the file.
+        '''
+        self._append(file_path, data)
+
+    def _append(self, file_path: str, data: bytes) -> None:
+        '''
+        Buffers data appended to a file, writing the whole blocks and syncing data
+        that is older than max_age.
+
+        :param file_path: The path to the file to append to.
+        :param data: The bytes to append to the file.
+        '''
+        entry = self.appends.get(file_path)
+        if entry is None:
+            entry = self._open_append(file_path)
+        elif self.append_order[-1] != file_path:
+            self.append_order.remove(file_path)
+            self.append_order.append(file_path)
+        if entry.since is None:
+            entry.since = time.monotonic()
+        entry.buffer.extend(data)
+        # Write up to the last block boundary of the file, keeping the rest for later appends
+        size = (entry.position + len(entry.buffer)) // self.block_size * self.block_size - entry.position
+        if size > 0:
+            self._write(entry, size)
+        if time.monotonic() - entry.since >= self.max_age:
+            self._sync(entry)
+
+    def _open_append(self, file_path: str) -> _AppendFile:
+        '''
+        Opens a file for appending, closing the least recently used file if too many are open.
+
+        :param file_path: The path to the file.
+        :return: The open file.
+        '''
+        if len(self.append_order) >= self.max_open:
+            self._close(self.append_order[0])
+        full_path = f'{self.mount_point}/{file_path}'
+        file = open(full_path, 'ab')
+        try:
+            position = os.stat(full_path)[6]
+        except OSError:
+            file.close()
+            raise
+        entry = _AppendFile(file, position)
+        self.appends[file_path] = entry
+        self.append_order.append(file_path)
+        return entry
+
+    def _write(self, entry: _AppendFile, size: int) -> None:
+        '''
+        Writes the start of the buffered data of a file, without syncing it.
+
+        :param entry: The open file.
+        :param size: The number of bytes to write.
+        '''
+        start = self.telemetry.start() if self.telemetry else 0
+        entry.file.write(entry.buffer if size == len(entry.buffer) else entry.buffer[:size])
+        entry.buffer = entry.buffer[size:]
+        entry.position += size
+        self.bytes_written += size
+        if self.telemetry:
+            self.telemetry.stop('sd_write', start)
+            self.telemetry.count('sd_bytes_written', size)
+
+    def _sync(self, entry: _AppendFile) -> None:
+        '''
+        Writes the buffered data of a file and syncs it, so that it survives a reset.
+
+        :param entry: The open file.
+        '''
+        if entry.since is None:
+            return
+        if entry.buffer:
+            self._write(entry, len(entry.buffer))
+        entry.file.flush()
+        entry.since = None
+        self.flushes += 1
+        if self.telemetry:
+            self.telemetry.count('sd_flushes')
+
+    def _close(self, file_path: str) -> None:
+        '''
+        Syncs and closes a file open for appending, if it is open.
+
+        :param file_path: The path to the file.
+        '''
+        entry = self.appends.get(file_path)
+        if entry is None:
+            return
+        self._sync(entry)
+        del self.appends[file_path]
+        self.append_order.remove(file_path)
+        entry.file.close()
+
+    def flush(self, max_age: float = None) -> None:
+        '''
+        Writes and syncs the appended data of every file, e.g. from a periodic job.
+
+        :param max_age: Optional age in seconds; only data at least this old is synced.
+        '''
+        now = time.monotonic()
+        for entry in self.appends.values():
+            if entry.since is not None and (max_age is None or now - entry.since >= max_age):
+                self._sync(entry)
+
+    def close(self) -> None:
+        '''
+        Syncs and closes every file open for appending, e.g. before deep sleep.
+        '''
+        while self.append_order:
+            self._close(self.append_order[0])
+
+    def replace_file(self, file_path: str, data: bytes) -> None:
+        '''
+        Replaces the contents of a file on the SD card with binary data. The data is
+        written to a temporary file that is then renamed, so a reset never leaves a
+        partly written file under the name.
+
+        :param file_path: The path to the file to replace.
+        :param data: The bytes to write to the file.
+        '''
         full_path = f'{self.mount_point}/{file_path}'
-        with open(full_path, 'a') as file:
+        self._close(file_path)
+        start = self.telemetry.start() if self.telemetry else 0
+        with open(full_path + '.tmp', 'wb') as file:
             file.write(data)
-    
+        try:
+            os.remove(full_path)
+        except OSError:
+            pass
+        os.rename(full_path + '.tmp', full_path)
+        self.bytes_written += len(data)
+        if self.telemetry:
+            self.telemetry.stop('sd_write', start)
+            self.telemetry.count('sd_bytes_written', len(data))
+
+    def file_size(self, file_path: str) -> int:
+        '''
+        Gets the size of a file on the SD card.
+
+        :param file_path: The path to the file.
+        :return: The size of the file in bytes, or 0 if the file does not exist.
+        '''
+        entry = self.appends.get(file_path)
+        if entry is not None:
+            return entry.position + len(entry.buffer)
+        full_path = f'{self.mount_point}/{file_path}'
+        try:
+            return os.stat(full_path)[6]
+        except OSError:
+            return 0
+
+    def read_bytes(self, file_path: str, offset: int, size: int) -> bytes:
+        '''
+        Reads a block of bytes from a file on the SD card.
+
+        :param file_path: The path to the file to read.
+        :param offset: The byte offset to start reading from.
+        :param size: The maximum number of bytes to read.
+        :return: The bytes read, which may be shorter than size at the end of the file.
+        '''
+        full_path = f'{self.mount_point}/{file_path}'
+        self._close(file_path)
+        with open(full_path, 'rb') as file:
+            file.seek(offset)
+            return file.read(size)
+
     def remove_file(self, file_path: str) -> None:
         """
         Removes a file from the SD card.
@@ -83,8 +333,23 @@ class SDCard:
         :raises FileNotFoundError: If the file does not exist.
         """
         full_path = f"{self.mount_point}/{file_path}"
-        if self.file_exists(file_path):
+        self._close(file_path)
+        try:
             os.remove(full_path)
+        except OSError:
+            pass
+
+    def list_files(self, dir_path: str, prefix: str = '') -> list:
+        '''
+        Lists the names of the files in a directory on the SD card, without reading their sizes.
+
+        :param dir_path: The path to the directory to list, '' for the root.
+        :param prefix: Optional start of the names to list, e.g. 'samples_'.
+        :return: A list of the names.
+        :raises OSError: If the directory does not exist.
+        '''
+        full_path = f'{self.mount_point}/{dir_path}'.rstrip('/')
+        return [name for name in os.listdir(full_path) if name.startswith(prefix)]
 
     def list_directory(self, dir_path: str) -> list:
         '''
@@ -95,6 +360,8 @@ class SDCard:
         :raises OSError: If the directory does not exist.
         '''
         full_path = f'{self.mount_point}/{dir_path}'
+        # Sync the appended data so that the sizes are up to date
+        self.flush()
         try:
             contents = os.listdir(full_path)
         except OSError:
@@ -0,0 +1,145 @@
+import time
+from googlesheetsmanager import GoogleSheetsManager
+from telemetry import Telemetry
+
+class SheetCache:
+    '''
+    A class to cache reads from Google Sheets in memory, e.g. of setpoints that
+    are read every cycle but rarely change.
+
+    Ranges are cached by spreadsheet, tab and range for ttl seconds. The cache
+    holds at most max_cells cells, evicting the least recently used ranges first,
+    so its memory use is bounded. read_appended reads a growing table
+    incrementally, asking only for the rows appended since the last call.
+    '''
+
+    def __init__(
+        self,
+        gsm: GoogleSheetsManager,
+        ttl: int = 300,
+        max_cells: int = 2000,
+        telemetry: Telemetry = None
+    ):
+        '''
+        Initializes the SheetCache class.
+
+        :param gsm: An instance of the GoogleSheetsManager class.
+        :param ttl: The default time in seconds a cached range is used before it is read again.
+        :param max_cells: The maximum number of cells kept in the cache.
+        :param telemetry: Optional Telemetry to count hits and misses in.
+        '''
+        self.gsm = gsm
+        self.ttl = ttl
+        self.max_cells = max_cells
+        self.telemetry = telemetry
+        # Cached ranges by key: the time they were read, their number of cells and their rows
+        self.entries = {}
+        # Keys from the least to the most recently used
+        self.order = []
+        self.cells = 0
+        # The next row of each table read with read_appended
+        self.next_rows = {}
+
+    def read(self, spreadsheet_id: str, sheet_name: str, range_name: str, ttl: int = None) -> list:
+        '''
+        Reads a range, from the cache if it was read less than ttl seconds ago.
+
+        :param spreadsheet_id: The ID of the Google Sheet.
+        :param sheet_name: The name of the sheet in the Google Sheet.
+        :param range_name: The range in the sheet to read, e.g. 'A1:B10'.
+        :param ttl: Optional time in seconds a cached range is used, instead of the default.
+        :return: The rows of the range. The list is shared with the cache and must not be changed.
+        :raises Exception: If the range is not cached and the read fails.
+        '''
+        key = (spreadsheet_id, sheet_name, range_name)
+        entry = self.entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] < (self.ttl if ttl is None else ttl):
+            self.order.remove(key)
+            self.order.append(key)
+            if self.telemetry:
+                self.telemetry.count('sheet_cache_hits')
+            return entry[2]
+
+        if self.telemetry:
+            self.telemetry.count('sheet_cache_misses')
+        rows = list(self.gsm.read_from_sheet(spreadsheet_id, sheet_name, range_name))
+        self._store(key, rows)
+        return rows
+
+    def _store(self, key: tuple, rows: list) -> None:
+        '''
+        Adds a range to the cache, evicting the least recently used ranges to make room.
+        A range larger than the whole cache is not kept.
+
+        :param key: The (spreadsheet_id, sheet_name, range_name) tuple of the range.
+        :param rows: The rows of the range.
+        '''
+        self._remove(key)
+        cells = sum(len(row) for row in rows)
+        if cells > self.max_cells:
+            return
+        while self.order and self.cells + cells > self.max_cells:
+            self._remove(self.order[0])
+        self.entries[key] = (time.monotonic(), cells, rows)
+        self.order.append(key)
+        self.cells += cells
+
+    def _remove(self, key: tuple) -> None:
+        '''
+        Removes a range from the cache, if it is cached.
+
+        :param key: The (spreadsheet_id, sheet_name, range_name) tuple of the range.
+        '''
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.order.remove(key)
+            self.cells -= entry[1]
+
+    def invalidate(self, spreadsheet_id: str, sheet_name: str = None) -> None:
+        '''
+        Removes the cached ranges of a spreadsheet or one of its tabs, e.g. after writing to it.
+
+        :param spreadsheet_id: The ID of the Google Sheet.
+        :param sheet_name: Optional name of the sheet, every sheet if None.
+        '''
+        for key in [key for key in self.order if key[0] == spreadsheet_id and sheet_name in (None, key[1])]:
+            self._remove(key)
+
+    def read_appended(self, spreadsheet_id: str, sheet_name: str, columns: str = 'A:Z', first_row: int = 1) -> list:
+        '''
+        Reads the rows appended to a table since the last call. The first call reads
+        the whole table from first_row.
+
+        :param spreadsheet_id: The ID of the Google Sheet.
+        :param sheet_name: The name of the sheet in the Google Sheet.
+        :param columns: The columns of the table, e.g. 'A:E'.
+        :param first_row: The number of the first row of the table, e.g. 2 to skip a header.
+        :return: The new rows, empty if there are none.
+        :raises Exception: If the read fails. The next call asks for the same rows again.
+        '''
+        key = (spreadsheet_id, sheet_name, columns)
+        next_row = self.next_rows.get(key, first_row)
+        first_column, _, last_column = columns.partition(':')
+        rows = list(self.gsm.read_from_sheet(
+            spreadsheet_id, sheet_name, f'{first_column}{next_row}:{last_column or first_column}'
+        ))
+        self.next_rows[key] = next_row + len(rows)
+        return rows
+
+    def state(self) -> dict:
+        '''
+        Gets the next row of every table read with read_appended, e.g. to keep them through deep sleep.
+
+        :return: A dictionary of the next row by 'spreadsheet_id!sheet_name!columns'.
+        '''
+        return {'!'.join(key): next_row for key, next_row in self.next_rows.items()}
+
+    def restore(self, state: dict) -> None:
+        '''
+        Continues the tables saved with state.
+
+        :param state: A dictionary returned by state.
+        '''
+        for name, next_row in state.items():
+            spreadsheet_id, sheet_name, columns = name.split('!')
+            self.next_rows[(spreadsheet_id, sheet_name, columns)] = next_row
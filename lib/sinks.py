@@ -0,0 +1,314 @@
+from googlesheetsmanager import GoogleSheetsManager
+from logrotation import LogRotation
+from readingqueue import ReadingQueue
+from sdcard import SDCard
+from telemetry import Telemetry
+
+class Sink:
+    '''
+    A destination for rows of readings, e.g. a sheet, a broker or a file.
+
+    Rows are written to a named tab: None for the readings, or e.g. '5m' or
+    'diagnostics' for the rollup and diagnostics rows. Subclasses implement
+    write, which raises an exception if the rows were not delivered so that
+    they stay queued for the next attempt.
+    '''
+
+    def __init__(self, name: str):
+        '''
+        Initializes the Sink class.
+
+        :param name: The name of the sink, used in log messages and telemetry.
+        '''
+        self.name = name
+
+    def write(self, tab: str, rows: list) -> None:
+        '''
+        Writes rows.
+
+        :param tab: The name of the tab, None for the readings.
+        :param rows: A list of rows.
+        :raises Exception: If the rows were not delivered.
+        '''
+        raise NotImplementedError
+
+    def keep_alive(self) -> None:
+        '''
+        Keeps any connection the sink keeps open from being dropped while it is idle.
+        '''
+        pass
+
+    def close(self) -> None:
+        '''
+        Releases any connection or file the sink keeps open.
+        '''
+        pass
+
+
+class SheetsSink(Sink):
+    '''
+    A sink that appends rows to a Google Sheet, the readings to the tab tab_id and
+    every other tab to the tab "<tab_id>_<tab>".
+    '''
+
+    def __init__(self, gsm: GoogleSheetsManager, spreadsheet_id: str, tab_id: str):
+        '''
+        Initializes the SheetsSink class.
+
+        :param gsm: An instance of the GoogleSheetsManager class.
+        :param spreadsheet_id: The ID of the spreadsheet.
+        :param tab_id: The name of the tab of the readings.
+        '''
+        super().__init__('sheets')
+        self.gsm = gsm
+        self.spreadsheet_id = spreadsheet_id
+        self.tab_id = tab_id
+
+    def write(self, tab: str, rows: list) -> None:
+        '''
+        Appends rows to the tab.
+
+        :param tab: The name of the tab, None for the readings.
+        :param rows: A list of rows.
+        '''
+        self.gsm.append_rows(self.spreadsheet_id, self.tab_id if tab is None else f'{self.tab_id}_{tab}', rows)
+
+
+def compact(row: list) -> str:
+    '''
+    Encodes a row as comma-separated values, leaving out the formulas that are only
+    meaningful in a sheet, e.g. '=EPOCHTODATE(...)'.
+
+    :param row: The row.
+    :return: The encoded row, e.g. '1718000000,21.50,8.00,6.20'.
+    '''
+    return ','.join(
+        '' if value is None else str(value)
+        for value in row
+        if not (isinstance(value, str) and value.startswith('='))
+    )
+
+
+class MqttSink(Sink):
+    '''
+    A sink that publishes every row as a compact message (see compact) to the
+    topic "<topic>/<tab>", with "readings" for the readings.
+    '''
+
+    def __init__(self, client: 'MqttClient', topic: str):
+        '''
+        Initializes the MqttSink class.
+
+        :param client: An instance of the MqttClient class.
+        :param topic: The topic prefix, e.g. 'hydroponics'.
+        '''
+        super().__init__('mqtt')
+        self.client = client
+        self.topic = topic
+
+    def write(self, tab: str, rows: list) -> None:
+        '''
+        Publishes each row as a message, waiting for the broker to acknowledge them.
+
+        :param tab: The name of the tab, None for the readings.
+        :param rows: A list of rows.
+        '''
+        topic = f'{self.topic}/{tab or "readings"}'
+        self.client.publish_many([(topic, compact(row)) for row in rows])
+
+    def keep_alive(self) -> None:
+        '''
+        Pings the broker, so it does not drop the connection between uploads.
+        '''
+        self.client.ping()
+
+    def close(self) -> None:
+        '''
+        Disconnects from the broker.
+        '''
+        self.client.close()
+
+
+class HubSink(Sink):
+    '''
+    A sink that sends rows to a hub monitor on the local network (see HubClient),
+    which writes them to the sheet together with the rows of other monitors.
+    '''
+
+    def __init__(self, client: 'HubClient'):
+        '''
+        Initializes the HubSink class.
+
+        :param client: An instance of the HubClient class.
+        '''
+        super().__init__('hub')
+        self.client = client
+
+    def write(self, tab: str, rows: list) -> None:
+        '''
+        Sends rows to the hub, waiting for it to queue them.
+
+        :param tab: The name of the tab, None for the readings.
+        :param rows: A list of rows.
+        '''
+        self.client.send(tab, rows)
+
+
+class FileSink(Sink):
+    '''
+    A sink that appends rows as comma-separated lines (see compact) to files on the
+    SD card for each tab, in segments rotated by a LogRotation, e.g.
+    "out_readings_0001.csv" and "out_5m_0001.csv". The oldest segments of a tab
+    are removed once the tab takes more than max_bytes.
+    '''
+
+    def __init__(
+        self,
+        sd_card: SDCard,
+        prefix: str = 'out_',
+        segment_size: int = 32768,
+        max_bytes: int = 4194304,
+        telemetry: Telemetry = None
+    ):
+        '''
+        Initializes the FileSink class.
+
+        :param sd_card: An instance of the SDCard class.
+        :param prefix: The start of the file names.
+        :param segment_size: The maximum size of a segment in bytes.
+        :param max_bytes: The maximum size of the segments of each tab in bytes.
+        :param telemetry: Optional Telemetry to count removed segments in.
+        '''
+        super().__init__('file')
+        self.sd_card = sd_card
+        self.prefix = prefix
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        self.telemetry = telemetry
+        # The segments of each tab written to since the start
+        self.logs = {}
+
+    def write(self, tab: str, rows: list) -> None:
+        '''
+        Appends rows to the file of the tab.
+
+        :param tab: The name of the tab, None for the readings.
+        :param rows: A list of rows.
+        '''
+        name = tab or 'readings'
+        log = self.logs.get(name)
+        if log is None:
+            log = LogRotation(
+                self.sd_card, f'{self.prefix}{name}_', '.csv', self.segment_size, self.max_bytes,
+                telemetry=self.telemetry
+            )
+            self.logs[name] = log
+        # Rows start with their timestamp, kept in the manifest as the first key of a segment
+        key = rows[0][0] if rows and isinstance(rows[0][0], int) else 0
+        log.append(''.join(compact(row) + '\n' for row in rows).encode(), key)
+
+
+class SinkGroup(Sink):
+    '''
+    A sink that writes rows to several sinks.
+
+    The rows are written to every sink even if one fails. A write only fails if
+    a required sink failed, so the rows stay queued for the next attempt. When a
+    queue is drained, every sink sends from its own offset in the queue, so only
+    the sinks that failed are sent the rows again; delivery is at-least-once.
+    The failures of sinks that are not required are logged and counted, and
+    their rows are dropped.
+    '''
+
+    def __init__(self, sinks: list, required: list = None, telemetry: Telemetry = None):
+        '''
+        Initializes the SinkGroup class.
+
+        :param sinks: A list of sinks.
+        :param required: Optional names of the sinks whose failure fails the write, every sink by default.
+        :param telemetry: Optional Telemetry to time every write of every sink in.
+        '''
+        super().__init__('group')
+        self.sinks = sinks
+        self.required = [sink.name for sink in sinks] if required is None else required
+        self.telemetry = telemetry
+
+    def _write(self, sink: Sink, tab: str, rows: list) -> None:
+        '''
+        Writes rows to one sink, dropping them if the sink failed and is not required.
+
+        :param sink: The sink.
+        :param tab: The name of the tab, None for the readings.
+        :param rows: A list of rows.
+        :raises Exception: If a required sink failed.
+        '''
+        start = self.telemetry.start() if self.telemetry else 0
+        try:
+            sink.write(tab, rows)
+        except Exception as e:
+            print(f'Writing to {sink.name} failed:', e)
+            if self.telemetry:
+                self.telemetry.stop(f'sink_{sink.name}', start, False)
+            if sink.name in self.required:
+                raise
+            if self.telemetry:
+                self.telemetry.count(f'{sink.name}_dropped', len(rows))
+            return
+        if self.telemetry:
+            self.telemetry.stop(f'sink_{sink.name}', start)
+
+    def write(self, tab: str, rows: list) -> None:
+        '''
+        Writes rows to every sink.
+
+        :param tab: The name of the tab, None for the readings.
+        :param rows: A list of rows.
+        :raises Exception: The last error of a required sink, if any failed.
+        '''
+        error = None
+        for sink in self.sinks:
+            try:
+                self._write(sink, tab, rows)
+            except Exception as e:
+                error = e
+        if error is not None:
+            raise error
+
+    def drain(self, queue: ReadingQueue, tab: str) -> int:
+        '''
+        Sends the pending rows of a queue to every sink, each from its own offset in
+        the queue, so a sink is not sent rows it has already taken.
+
+        :param queue: The queue of rows.
+        :param tab: The name of the tab, None for the readings.
+        :return: The largest number of rows sent to a sink.
+        :raises Exception: The last error of a required sink, if any failed.
+        '''
+        error = None
+        sent = 0
+        for sink in self.sinks:
+            try:
+                sent = max(sent, queue.drain(lambda rows: self._write(sink, tab, rows), consumer=sink.name))
+            except Exception as e:
+                error = e
+        queue.release([sink.name for sink in self.sinks])
+        if error is not None:
+            raise error
+        return sent
+
+    def keep_alive(self) -> None:
+        '''
+        Keeps the connections of every sink alive, logging failures.
+        '''
+        for sink in self.sinks:
+            try:
+                sink.keep_alive()
+            except Exception as e:
+                print(f'Keeping {sink.name} alive failed:', e)
+
+    def close(self) -> None:
+        '''
+        Closes every sink.
+        '''
+        for sink in self.sinks:
+            sink.close()
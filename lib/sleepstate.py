@@ -0,0 +1,100 @@
+import json
+import struct
+import alarm
+from tokencache import TokenCache
+
+# Header layout: magic (4 bytes), length of the JSON data that follows (uint16)
+HEADER_FORMAT = '<4sH'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b'HMS1'
+
+class SleepState:
+    '''
+    A class to keep a dictionary of state in alarm.sleep_memory, which survives
+    deep sleep but not a power loss or a reset.
+    '''
+
+    def __init__(self, memory=None):
+        '''
+        Initializes the SleepState class.
+
+        :param memory: Optional buffer to use instead of alarm.sleep_memory.
+        '''
+        self.memory = alarm.sleep_memory if memory is None else memory
+
+    def load(self) -> dict:
+        '''
+        Loads the state saved before the last deep sleep.
+
+        :return: The saved state, or an empty dictionary if nothing valid was saved.
+        '''
+        if len(self.memory) < HEADER_SIZE:
+            return {}
+        magic, length = struct.unpack_from(HEADER_FORMAT, self.memory, 0)
+        if magic != MAGIC or HEADER_SIZE + length > len(self.memory):
+            return {}
+        try:
+            return json.loads(bytes(self.memory[HEADER_SIZE:HEADER_SIZE + length]))
+        except ValueError:
+            return {}
+
+    def save(self, state: dict) -> None:
+        '''
+        Saves the state to keep through the next deep sleep.
+
+        :param state: A dictionary of JSON serializable values.
+        :raises ValueError: If the state does not fit in the sleep memory.
+        '''
+        data = json.dumps(state).encode()
+        if HEADER_SIZE + len(data) > len(self.memory):
+            raise ValueError(f'State of {len(data)} bytes does not fit in sleep memory')
+        self.memory[0:HEADER_SIZE] = struct.pack(HEADER_FORMAT, MAGIC, len(data))
+        self.memory[HEADER_SIZE:HEADER_SIZE + len(data)] = data
+
+    def clear(self) -> None:
+        '''
+        Invalidates the saved state.
+        '''
+        self.memory[0:HEADER_SIZE] = bytes(HEADER_SIZE)
+
+
+class SleepTokenCache:
+    '''
+    A token cache that keeps the access token in a sleep state dictionary, so a
+    wake from deep sleep reuses it without reading the SD card. New tokens are
+    also saved to an optional TokenCache for cold boots.
+    '''
+
+    def __init__(self, state: dict, fallback: TokenCache = None):
+        '''
+        Initializes the SleepTokenCache class.
+
+        :param state: The dictionary saved with SleepState before deep sleep.
+        :param fallback: Optional TokenCache used when the state has no token.
+        '''
+        self.state = state
+        self.fallback = fallback
+
+    def load(self) -> tuple:
+        '''
+        Loads the access token.
+
+        :return: A tuple of the access token and its expiry time, or (None, None).
+        '''
+        if self.state.get('token'):
+            return self.state['token'], self.state.get('exp')
+        if self.fallback:
+            return self.fallback.load()
+        return None, None
+
+    def save(self, token: str, exp: int) -> None:
+        '''
+        Saves the access token.
+
+        :param token: The access token.
+        :param exp: The expiry time of the access token in seconds since the epoch.
+        '''
+        self.state['token'] = token
+        self.state['exp'] = exp
+        if self.fallback:
+            self.fallback.save(token, exp)
@@ -0,0 +1,237 @@
+import gc
+import time
+from array import array
+
+class _Timer:
+    '''
+    A context manager that times one run of a stage.
+    '''
+
+    def __init__(self, telemetry: 'Telemetry', name: str):
+        '''
+        Initializes the _Timer class.
+
+        :param telemetry: The Telemetry to record the time in.
+        :param name: The name of the stage.
+        '''
+        self.telemetry = telemetry
+        self.name = name
+        self.start = 0
+
+    def __enter__(self) -> '_Timer':
+        self.start = time.monotonic_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.telemetry.stop(self.name, self.start, exc_type is None)
+
+
+class Telemetry:
+    '''
+    A class to count events and time the stages of the cycle on the device, e.g.
+    sensor reads, HTTP requests and SD writes.
+
+    Each stage keeps its number of runs, failures, total and maximum time, and
+    the most recent runs are kept in a fixed-size ring buffer, so memory use
+    does not grow while the device runs. The free heap is sampled after every
+    stage to find its low-water mark. When a stage starts failing, the recent
+    runs can be saved with on_failure to see what led up to it.
+    '''
+
+    def __init__(self, size: int = 64, on_failure=None):
+        '''
+        Initializes the Telemetry class.
+
+        :param size: The number of recent stage runs kept in the ring buffer.
+        :param on_failure: Optional function called with the name of a stage when it fails
+                           after a run that succeeded, e.g. to save the recent runs. It is
+                           not called again until the stage has succeeded, so a stage
+                           that keeps failing, e.g. during an outage, calls it once.
+        '''
+        self.on_failure = on_failure
+        # The stages whose last run failed
+        self.failing = []
+        self.size = size
+        self.names = []
+        self.counters = {}
+        self.timers = {}
+        self.mem_low = None
+        # Monotonic, since the clock may be set during the period
+        self.since = time.monotonic()
+        # Ring buffer of recent runs: time, stage index and duration in ms (-1 if failed)
+        self.ring_times = array('L', [0] * size)
+        self.ring_stages = array('B', [0] * size)
+        self.ring_ms = array('l', [0] * size)
+        self.ring_next = 0
+        self.ring_count = 0
+
+    def count(self, name: str, amount: int = 1) -> None:
+        '''
+        Adds to a counter.
+
+        :param name: The name of the counter, e.g. 'wifi_reconnects'.
+        :param amount: The amount to add.
+        '''
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def measure(self, name: str) -> _Timer:
+        '''
+        Times a stage, used as `with telemetry.measure('name'):`. A stage that
+        raises an exception is counted as failed.
+
+        :param name: The name of the stage.
+        :return: A context manager that records the stage when it exits.
+        '''
+        return _Timer(self, name)
+
+    def start(self) -> int:
+        '''
+        Starts timing a stage, for code that cannot use measure.
+
+        :return: The start time to pass to stop.
+        '''
+        return time.monotonic_ns()
+
+    def stop(self, name: str, start: int, ok: bool = True) -> int:
+        '''
+        Records a run of a stage started with start.
+
+        :param name: The name of the stage.
+        :param start: The value returned by start.
+        :param ok: Whether the stage succeeded.
+        :return: The duration in milliseconds.
+        '''
+        elapsed_ms = (time.monotonic_ns() - start) // 1000000
+        timer = self.timers.get(name)
+        if timer is None:
+            # Runs, failures, total ms and maximum ms
+            timer = self.timers[name] = [0, 0, 0, 0]
+        timer[0] += 1
+        timer[2] += elapsed_ms
+        if elapsed_ms > timer[3]:
+            timer[3] = elapsed_ms
+        if not ok:
+            timer[1] += 1
+        self._remember(name, elapsed_ms if ok else -1)
+        self.check_heap()
+        if ok:
+            if name in self.failing:
+                self.failing.remove(name)
+        elif name not in self.failing:
+            self.failing.append(name)
+            if self.on_failure:
+                self._report_failure(name)
+        return elapsed_ms
+
+    def _report_failure(self, name: str) -> None:
+        '''
+        Calls on_failure for a failed stage. A stage that fails inside on_failure
+        does not call it again.
+
+        :param name: The name of the stage.
+        '''
+        on_failure, self.on_failure = self.on_failure, None
+        try:
+            on_failure(name)
+        except Exception as e:
+            print('Failed to report a failed stage:', e)
+        finally:
+            self.on_failure = on_failure
+
+    def _remember(self, name: str, elapsed_ms: int) -> None:
+        '''
+        Adds a run to the ring buffer, overwriting the oldest run when it is full.
+
+        :param name: The name of the stage.
+        :param elapsed_ms: The duration in milliseconds, -1 if it failed.
+        '''
+        if name in self.names:
+            stage = self.names.index(name)
+        elif len(self.names) < 256:
+            stage = len(self.names)
+            self.names.append(name)
+        else:
+            return
+        index = self.ring_next
+        self.ring_times[index] = time.time()
+        self.ring_stages[index] = stage
+        self.ring_ms[index] = elapsed_ms
+        self.ring_next = (index + 1) % self.size
+        if self.ring_count < self.size:
+            self.ring_count += 1
+
+    def check_heap(self) -> int:
+        '''
+        Samples the free heap and updates its low-water mark.
+
+        :return: The free heap in bytes.
+        '''
+        free = gc.mem_free()
+        if self.mem_low is None or free < self.mem_low:
+            self.mem_low = free
+        return free
+
+    def recent(self) -> list:
+        '''
+        Gets the runs in the ring buffer.
+
+        :return: A list of (timestamp, stage, elapsed_ms) tuples, oldest first.
+                 elapsed_ms is -1 for a failed run.
+        '''
+        runs = []
+        for offset in range(self.ring_count):
+            index = (self.ring_next - self.ring_count + offset) % self.size
+            runs.append((self.ring_times[index], self.names[self.ring_stages[index]], self.ring_ms[index]))
+        return runs
+
+    def row(self, timestamp: int) -> list:
+        '''
+        Summarizes the counters and stages since the last reset as a compact sheet row.
+
+        :param timestamp: The time of the summary in seconds since the epoch.
+        :return: A list of the timestamp, its date formula, the seconds awake in the period, the
+                 free heap and its low-water mark, the counters as 'name=count ...'
+                 and the stages as 'name=runs/failures/mean_ms/max_ms ...'.
+        '''
+        free = self.check_heap()
+        counters = ' '.join(f'{name}={count}' for name, count in sorted(self.counters.items()))
+        stages = ' '.join(
+            f'{name}={runs}/{failures}/{total // runs}/{maximum}'
+            for name, (runs, failures, total, maximum) in sorted(self.timers.items())
+        )
+        return [
+            timestamp,
+            f'=EPOCHTODATE({timestamp} - 28800)',
+            int(time.monotonic() - self.since),
+            free,
+            self.mem_low,
+            counters,
+            stages
+        ]
+
+    def reset(self) -> None:
+        '''
+        Starts a new summary period. The ring buffer is kept.
+        '''
+        self.counters = {}
+        self.timers = {}
+        self.mem_low = None
+        self.since = time.monotonic()
+
+    def state(self) -> list:
+        '''
+        Gets the counters and stages of the current period, e.g. to keep them through deep sleep.
+
+        :return: A list of the seconds awake so far in the period, the counters, the
+                 stages, the heap low-water mark and the stages whose last run failed.
+        '''
+        return [time.monotonic() - self.since, self.counters, self.timers, self.mem_low, self.failing]
+
+    def restore(self, state: list) -> None:
+        '''
+        Continues a period saved with state.
+
+        :param state: A list returned by state.
+        '''
+        elapsed, self.counters, self.timers, self.mem_low, self.failing = state
+        self.since = time.monotonic() - elapsed
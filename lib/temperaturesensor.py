@@ -1,43 +1,119 @@
+import asyncio
+import time
 import board
 import busio
 import adafruit_ds18x20
 import adafruit_onewire.bus
 
+# Maximum conversion time in seconds of a DS18X20 at each resolution in bits
+CONVERSION_DELAY = {9: 0.09375, 10: 0.1875, 11: 0.375, 12: 0.750}
+
 class TemperatureSensor:
     """
-    A class to access a temperature sensor.
+    A class to access the DS18X20 temperature probes on a OneWire bus.
+
+    All probes on the bus convert at the same time, so reading several probes
+    takes no longer than reading the slowest one.
     """
 
-    def __init__(self, port: board.Pin):
+    def __init__(self, port: board.Pin, resolution=12):
         """
         Initializes the TemperatureSensor class.
 
-        :param port: The port to which the temperature sensor is connected.
+        :param port: The port to which the temperature sensors are connected.
+        :param resolution: The resolution in bits (9-12) of every probe, or a list
+                           with the resolution of each probe in bus scan order.
         """
         self.port = port
-        self.sensor = self._initialize_sensor()
+        self.bus = None
+        self.sensors = self._initialize_sensors()
+        self.sensor = self.sensors[0]
+        self.resolutions = [12] * len(self.sensors)
+        self.ready_at = None
+        if isinstance(resolution, int):
+            resolution = [resolution] * len(self.sensors)
+        for index, bits in enumerate(resolution[:len(self.sensors)]):
+            self.set_resolution(index, bits)
 
-    def _initialize_sensor(self):
+    def _initialize_sensors(self) -> list:
         """
-        Initializes the temperature sensor.
+        Initializes every temperature sensor found on the bus.
 
-        :return: The initialized temperature sensor.
+        :return: The initialized temperature sensors in bus scan order.
         """
         try:
-            onewire_bus = adafruit_onewire.bus.OneWireBus(self.port)
+            self.bus = adafruit_onewire.bus.OneWireBus(self.port)
         except ValueError:
             raise ValueError("Unsupported port")
 
-        devices = onewire_bus.scan()
+        devices = self.bus.scan()
         if not devices:
             raise RuntimeError("No temperature sensors found")
 
-        return adafruit_ds18x20.DS18X20(onewire_bus, devices[0])
+        return [adafruit_ds18x20.DS18X20(self.bus, device) for device in devices]
+
+    def set_resolution(self, index: int, bits: int) -> None:
+        """
+        Sets the resolution of one probe. Lower resolutions convert faster.
+
+        :param index: The index of the probe in bus scan order.
+        :param bits: The resolution in bits, from 9 to 12.
+        :raises ValueError: If the resolution is not supported.
+        """
+        if bits not in CONVERSION_DELAY:
+            raise ValueError("Resolution must be 9, 10, 11 or 12 bits")
+        self.sensors[index].resolution = bits
+        self.resolutions[index] = bits
+
+    def start_conversion(self) -> float:
+        """
+        Starts a temperature conversion on every probe at once and returns immediately.
+
+        :return: The time in seconds until all conversions are complete.
+        """
+        # Skip ROM (0xCC) addresses every device, Convert T (0x44) starts the conversion
+        self.bus.reset()
+        self.bus.write(b"\xcc\x44")
+        delay = max(CONVERSION_DELAY[bits] for bits in self.resolutions)
+        self.ready_at = time.monotonic() + delay
+        return delay
+
+    def collect(self) -> list:
+        """
+        Reads the results of the last conversion, waiting for it to finish if needed.
+
+        :return: The temperature of each probe in Celsius.
+        """
+        if self.ready_at is None:
+            self.start_conversion()
+        remaining = self.ready_at - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        self.ready_at = None
+        return [sensor.read_temperature() for sensor in self.sensors]
+
+    async def read_temperatures_async(self) -> list:
+        """
+        Reads every probe, letting other tasks run during the conversion.
+
+        :return: The temperature of each probe in Celsius.
+        """
+        await asyncio.sleep(self.start_conversion())
+        return self.collect()
+
+    def read_temperatures(self) -> list:
+        """
+        Reads every probe.
+
+        :return: The temperature of each probe in Celsius.
+        """
+        self.start_conversion()
+        return self.collect()
 
     def read_temperature(self) -> float:
         """
-        Reads the temperature from the sensor.
+        Reads the temperature from the first sensor.
 
         :return: The temperature in Celsius.
         """
-        return self.sensor.temperature
\ No newline at end of file
+        return self.read_temperatures()[0]
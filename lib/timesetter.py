@@ -1,6 +1,5 @@
 import time
 import rtc
-import adafruit_ntp
 from wifimanager import WiFiManager
 
 class TimeSetter:
@@ -15,17 +14,37 @@ class TimeSetter:
         :param wifi: An instance of the WiFiManager class to handle the network connection.
         """
         self.wifi = wifi
-        self.pool = self.wifi.pool
-        self.ntp = adafruit_ntp.NTP(self.pool, tz_offset=tz_offset, server="pool.ntp.org")
+        self.tz_offset = tz_offset
+        self.ntp = None
         self.rtc = rtc.RTC()
+        self.last_sync = None
 
-    def set_time(self) -> None:
+    def set_time(self) -> bool:
         """
         Gets the current time from an NTP server and sets the system time.
+
+        :return: True if the time was set, False otherwise.
         """
         try:
+            # The NTP client is created on first use, once the WiFi socket pool exists
+            if self.ntp is None:
+                import adafruit_ntp
+                self.ntp = adafruit_ntp.NTP(self.wifi.pool, tz_offset=self.tz_offset, server="pool.ntp.org")
             current_time = self.ntp.datetime
             self.rtc.datetime = current_time
+            self.last_sync = time.time()
             print("Time set successfully:", current_time)
+            return True
         except Exception as e:
             print("Failed to set time:", e)
+            return False
+
+    def restore_time(self, timestamp: int) -> None:
+        """
+        Sets the system time from a saved timestamp if the clock is behind it,
+        e.g. after the real-time clock was reset during deep sleep.
+
+        :param timestamp: The earliest plausible current time in seconds since the epoch.
+        """
+        if time.time() < timestamp:
+            self.rtc.datetime = time.localtime(timestamp)
@@ -0,0 +1,46 @@
+import json
+from sdcard import SDCard
+
+class TokenCache:
+    '''
+    A class to keep the Google Sheets access token and its expiry on the SD card,
+    so a restart can reuse a token that is still valid instead of signing a new one.
+    '''
+
+    def __init__(self, sd_card: SDCard, token_file: str):
+        '''
+        Initializes the TokenCache class.
+
+        :param sd_card: An instance of the SDCard class.
+        :param token_file: The file path to save/load the access token.
+        '''
+        self.sd_card = sd_card
+        self.token_file = token_file
+
+    def load(self) -> tuple:
+        '''
+        Loads the access token from the SD card.
+
+        :return: A tuple of the access token and its expiry time, or (None, None) if
+                 no token has been saved.
+        '''
+        try:
+            data = json.loads(self.sd_card.read_file(self.token_file))
+            return data['token'], int(data['exp'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None, None
+
+    def save(self, token: str, exp: int) -> None:
+        '''
+        Saves the access token to the SD card.
+
+        :param token: The access token.
+        :param exp: The expiry time of the access token in seconds since the epoch.
+        '''
+        self.sd_card.write_file(self.token_file, json.dumps({'token': token, 'exp': exp}))
+
+    def clear(self) -> None:
+        '''
+        Removes the saved access token from the SD card.
+        '''
+        self.sd_card.remove_file(self.token_file)
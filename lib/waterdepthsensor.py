@@ -1,25 +1,54 @@
 import json
+from array import array
 import analogio
 import board
 from sdcard import SDCard
+from adcsampler import AdcSampler
+from calibration import Calibration
 
 class WaterDepthSensor:
     """
     A class to convert analog input to water depth.
     """
 
-    def __init__(self, pin: board.Pin, sd_card: SDCard, calibration_file: str):
+    def __init__(
+        self,
+        pin: board.Pin,
+        sd_card: SDCard,
+        calibration_file: str,
+        samples: int = 16,
+        method: str = "median",
+        calibration_data: dict = None,
+        reference_values: tuple = (1.0, 6.0, 12.0)
+    ):
         """
         Initializes the WaterDepthSensor class.
 
         :param pin: The pin to which the water depth sensor is connected.
         :param sd_card: An instance of the SDCard class.
         :param calibration_file: The file path to save/load the calibration data.
+        :param samples: The number of ADC samples taken for each reading.
+        :param method: The AdcSampler filter used to reduce the samples.
+        :param calibration_data: Optional calibration data to use instead of loading it from the SD card.
+        :param reference_values: The water depths in inches used by calibrate.
         """
         self.pin = analogio.AnalogIn(pin)
+        self.sampler = AdcSampler(self.pin, samples, method)
+        self.last_counts = None
         self.sd_card = sd_card
         self.calibration_file = calibration_file
-        self.calibration_data = self.load_calibration_data()
+        self.reference_values = reference_values
+        self.calibration_data = calibration_data or self.load_calibration_data()
+        self.calibration = self.build_calibration(self.calibration_data)
+
+    def read_counts(self) -> int:
+        """
+        Reads the filtered raw value from the water depth sensor.
+
+        :return: The filtered value in raw ADC counts (0-65535).
+        """
+        self.last_counts = self.sampler.read()
+        return self.last_counts
 
     def read_voltage(self) -> float:
         """
@@ -27,7 +56,7 @@ class WaterDepthSensor:
 
         :return: The voltage in volts.
         """
-        return (self.pin.value * 3.3) / 65536
+        return (self.read_counts() * 3.3) / 65536
 
     def read_depth(self) -> float:
         """
@@ -35,60 +64,57 @@ class WaterDepthSensor:
 
         :return: The water depth in inches.
         """
-        voltage = self.read_voltage()
-        if voltage > self.calibration_data['voltage_6']:
-            slope = self.calibration_data['slope_1_6']
-            intercept = self.calibration_data['intercept_1_6']
-        else:
-            slope = self.calibration_data['slope_6_12']
-            intercept = self.calibration_data['intercept_6_12']
-        depth = slope * voltage + intercept
-        return depth
+        return self.calibration.convert(self.read_voltage())
 
-    def calibrate(self):
+    def convert_counts(self, counts, out: array = None) -> array:
         """
-        Calibrates the water depth sensor using depths of 1 inch, 6 inches, and 12 inches.
-        """
-        print("Calibrating water depth sensor...")
+        Converts a sequence of raw ADC counts, e.g. a burst or a backfill, to water depths.
 
-        # Read voltage for 1 inch
-        input("Place the sensor in 1 inch of water and press Enter...")
-        voltage_1 = self.read_voltage()
-        print(f"Voltage at 1 inch: {voltage_1:.3f} V")
+        :param counts: A sequence of raw ADC counts.
+        :param out: Optional array('f') of the same length to write the values to.
+        :return: An array('f') of water depths in inches.
+        """
+        return self.calibration.convert_counts(counts, out)
 
-        # Read voltage for 6 inches
-        input("Place the sensor in 6 inches of water and press Enter...")
-        voltage_6 = self.read_voltage()
-        print(f"Voltage at 6 inches: {voltage_6:.3f} V")
+    def build_calibration(self, calibration_data: dict) -> Calibration:
+        """
+        Builds the calibration table from saved calibration data.
 
-        # Read voltage for 12 inches
-        input("Place the sensor in 12 inches of water and press Enter...")
-        voltage_12 = self.read_voltage()
-        print(f"Voltage at 12 inches: {voltage_12:.3f} V")
+        :param calibration_data: The calibration data, either a list of (voltage, depth)
+                                 points or the original three-point format.
+        :return: The calibration table.
+        """
+        if "points" in calibration_data:
+            return Calibration.from_points(calibration_data["points"])
+        # Calibration data saved before N-point calibration was supported
+        return Calibration(
+            [calibration_data["voltage_6"]],
+            [calibration_data["slope_6_12"], calibration_data["slope_1_6"]],
+            [calibration_data["intercept_6_12"], calibration_data["intercept_1_6"]]
+        )
 
-        # Calculate linear regression for 1 inch to 6 inches
-        slope_1_6 = (6.00 - 1.00) / (voltage_6 - voltage_1)
-        intercept_1_6 = 6.00 - slope_1_6 * voltage_6
+    def calibrate(self):
+        """
+        Calibrates the water depth sensor at each reference depth.
+        """
+        print("Calibrating water depth sensor...")
 
-        # Calculate linear regression for 6 inches to 12 inches
-        slope_6_12 = (12.00 - 6.00) / (voltage_12 - voltage_6)
-        intercept_6_12 = 12.00 - slope_6_12 * voltage_12
+        points = []
+        for depth in self.reference_values:
+            input(f"Place the sensor in {depth:g} inches of water and press Enter...")
+            self.sampler.reset()
+            voltage = self.read_voltage()
+            print(f"Voltage at {depth:g} inches: {voltage:.3f} V")
+            points.append([voltage, depth])
 
         # Save calibration data to file
-        self.calibration_data = {
-            "voltage_6": voltage_6,
-            "slope_1_6": slope_1_6,
-            "intercept_1_6": intercept_1_6,
-            "slope_6_12": slope_6_12,
-            "intercept_6_12": intercept_6_12
-        }
+        self.calibration = Calibration.from_points(points)
+        self.calibration_data = {"points": points}
         self.save_calibration_data()
 
         print("Calibration complete.")
-        print(f"Slope (1 inch to 6 inches): {slope_1_6:.3f}")
-        print(f"Intercept (1 inch to 6 inches): {intercept_1_6:.3f}")
-        print(f"Slope (6 inches to 12 inches): {slope_6_12:.3f}")
-        print(f"Intercept (6 inches to 12 inches): {intercept_6_12:.3f}")
+        for slope, intercept in zip(self.calibration.slopes, self.calibration.intercepts):
+            print(f"Slope: {slope:.3f}, Intercept: {intercept:.3f}")
 
     def save_calibration_data(self):
         """
@@ -1,19 +1,57 @@
 import wifi
 import socketpool
-import ssl
-import adafruit_requests
+from telemetry import Telemetry
+
+class _CountingSSLContext:
+    """
+    A wrapper around an SSL context that counts the TLS connections it opens.
+    """
+
+    def __init__(self, context):
+        """
+        Initializes the _CountingSSLContext class.
+
+        :param context: The SSL context to wrap.
+        """
+        self.context = context
+        self.handshakes = 0
+
+    def wrap_socket(self, sock, server_hostname: str = None):
+        """
+        Wraps a socket for TLS, counting the handshake it will perform.
+
+        :param sock: The socket to wrap.
+        :param server_hostname: The host name of the server.
+        :return: The wrapped socket.
+        """
+        self.handshakes += 1
+        return self.context.wrap_socket(sock, server_hostname=server_hostname)
+
 
 class WiFiManager:
     """
     A class to manage WiFi connections and HTTP requests using CircuitPython.
+
+    Connections are kept alive between requests, so consecutive requests to the
+    same host share one socket and one TLS handshake. Every response is read to
+    the end and released, and at most max_sockets sockets are kept open.
     """
 
-    def __init__(self):
+    def __init__(self, max_sockets: int = 2, telemetry: Telemetry = None):
         """
         Initializes the WiFiManager class.
+
+        :param max_sockets: The maximum number of sockets kept open for reuse.
+        :param telemetry: Optional Telemetry to time every request and count reconnects in.
         """
         self.pool: socketpool.SocketPool = None
-        self.requests: adafruit_requests.Session = None
+        self.requests = None
+        self.ssl_context: _CountingSSLContext = None
+        self.max_sockets = max_sockets
+        self.request_count = 0
+        self.reused_count = 0
+        self.failure_count = 0
+        self.telemetry = telemetry
 
     def connect(self, ssid: str, password: str) -> None:
         """
@@ -24,8 +62,14 @@ class WiFiManager:
         """
         try:
             wifi.radio.connect(ssid, password)
-            self.pool = socketpool.SocketPool(wifi.radio)
-            self.requests = adafruit_requests.Session(self.pool, ssl.create_default_context())
+            # The pool and session are reused across reconnects
+            if self.pool is None:
+                # The HTTPS stack is imported on the first connection, not at boot
+                import ssl
+                import adafruit_requests
+                self.pool = socketpool.SocketPool(wifi.radio)
+                self.ssl_context = _CountingSSLContext(ssl.create_default_context())
+                self.requests = adafruit_requests.Session(self.pool, self.ssl_context)
             print("Connected to WiFi")
         except Exception as e:
             print("Failed to connect to WiFi:", e)
@@ -37,6 +81,8 @@ class WiFiManager:
         :param ssid: The SSID of the WiFi network.
         :param password: The password of the WiFi network.
         """
+        if self.telemetry:
+            self.telemetry.count("wifi_reconnects")
         self.disconnect()
         self.connect(ssid, password)
 
@@ -44,12 +90,13 @@ class WiFiManager:
         """
         Disconnects from the WiFi network.
         """
+        self.close_sockets()
         try:
             wifi.radio.disconnect()
             print("Disconnected from WiFi")
         except Exception as e:
             print("Failed to disconnect from WiFi:", e)
-    
+
     def is_connected(self) -> bool:
         """
         Checks if the WiFi is connected.
@@ -58,6 +105,181 @@ class WiFiManager:
         """
         return wifi.radio.connected
 
+    def close_sockets(self) -> None:
+        """
+        Closes every open HTTP socket, e.g. after a failed request or a lost connection.
+        """
+        if self.pool is None:
+            return
+        import adafruit_connection_manager
+        try:
+            adafruit_connection_manager.connection_manager_close_all(self.pool)
+        except RuntimeError:
+            # The pool has not opened any sockets yet
+            pass
+
+    def stats(self) -> dict:
+        """
+        Gets the connection statistics.
+
+        :return: A dictionary with the number of requests, TLS handshakes, requests
+                 that reused an open connection, failed requests and open sockets.
+        """
+        open_sockets = 0
+        if self.pool is not None:
+            import adafruit_connection_manager
+            open_sockets = adafruit_connection_manager.get_connection_manager(
+                self.pool
+            ).managed_socket_count
+        return {
+            "requests": self.request_count,
+            "handshakes": self.ssl_context.handshakes if self.ssl_context else 0,
+            "reused": self.reused_count,
+            "failures": self.failure_count,
+            "open_sockets": open_sockets
+        }
+
+    def _start_request(self, method: str, url: str, data, headers: dict, timeout: int):
+        """
+        Sends a request and reads the status and headers of the response.
+
+        :param method: The HTTP method, e.g. "GET" or "POST".
+        :param url: The URL to send the request to.
+        :param data: Optional data to send as JSON, or a binary file-like object of JSON,
+                     e.g. a RowStream, which is sent a piece at a time.
+        :param headers: Optional headers to include in the request.
+        :param timeout: The timeout for the request in seconds.
+        :return: The response, with the body still to be read.
+        """
+        if self.requests is None:
+            raise RuntimeError("Not connected to WiFi")
+        self.request_count += 1
+        if data is not None and hasattr(data, "read"):
+            headers = dict(headers or {})
+            headers["Content-Type"] = "application/json"
+            return self.requests.request(method, url, data=data, headers=headers, timeout=timeout)
+        return self.requests.request(method, url, json=data, headers=headers, timeout=timeout)
+
+    def _release(self, response, sock, handshakes: int) -> None:
+        """
+        Releases the socket of a response that was read to the end, leaving it open
+        for the next request unless the server closes it.
+
+        :param response: The response.
+        :param sock: The socket of the response, which iter_content has already freed.
+        :param handshakes: The number of TLS handshakes before the request.
+        """
+        import adafruit_connection_manager
+        manager = adafruit_connection_manager.get_connection_manager(self.pool)
+        response.close()
+        if response.headers.get("connection", "").lower() == "close":
+            manager.close_socket(sock)
+        if self.ssl_context.handshakes == handshakes:
+            self.reused_count += 1
+        elif self.telemetry:
+            self.telemetry.count("tls_handshakes")
+        if manager.managed_socket_count > self.max_sockets:
+            self.close_sockets()
+
+    def _fail(self, start: int) -> None:
+        """
+        Counts a failed request and closes every socket, since the failed one may
+        still hold part of the response.
+
+        :param start: The start time of the request from Telemetry.start.
+        """
+        self.failure_count += 1
+        self.close_sockets()
+        if self.telemetry:
+            self.telemetry.stop("http", start, False)
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        data=None,
+        headers: dict = None,
+        timeout: int = 10
+    ) -> str:
+        """
+        Performs an HTTP request on a kept-alive connection.
+
+        :param method: The HTTP method, e.g. "GET" or "POST".
+        :param url: The URL to send the request to.
+        :param data: Optional data to send as JSON in the request body, or a binary
+                     file-like object of JSON, e.g. a RowStream.
+        :param headers: Optional headers to include in the request.
+        :param timeout: Optional timeout for the request in seconds.
+        :return: The response text.
+        :raises Exception: If the request fails. All sockets are closed first.
+        """
+        handshakes = self.ssl_context.handshakes if self.ssl_context else 0
+        start = self.telemetry.start() if self.telemetry else 0
+        try:
+            response = self._start_request(method, url, data, headers, timeout)
+            # Reading the body frees the response's socket, so keep it for the release
+            sock = response.socket
+            # Reading the whole body leaves the socket ready for the next request
+            text = response.text
+            self._release(response, sock, handshakes)
+        except Exception:
+            self._fail(start)
+            raise
+        if self.telemetry:
+            self.telemetry.stop("http", start)
+        return text
+
+    def stream(
+        self,
+        method: str,
+        url: str,
+        data=None,
+        headers: dict = None,
+        timeout: int = 10,
+        chunk_size: int = 256
+    ):
+        """
+        Performs an HTTP request on a kept-alive connection, reading the response a
+        chunk at a time instead of all at once.
+
+        The connection is only released once the response has been read to the end.
+        If the generator is closed before that, every socket is closed.
+
+        :param method: The HTTP method, e.g. "GET" or "POST".
+        :param url: The URL to send the request to.
+        :param data: Optional data to send, as for request.
+        :param headers: Optional headers to include in the request.
+        :param timeout: Optional timeout for the request in seconds.
+        :param chunk_size: The number of bytes read from the socket at a time.
+        :return: A generator of the chunks of the response body as bytes.
+        :raises Exception: If the request fails or the response has an error status.
+        """
+        handshakes = self.ssl_context.handshakes if self.ssl_context else 0
+        start = self.telemetry.start() if self.telemetry else 0
+        error = None
+        try:
+            response = self._start_request(method, url, data, headers, timeout)
+            sock = response.socket
+            if response.status_code >= 400:
+                # The error body is read to the end, so the connection can still be reused
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+            else:
+                for chunk in response.iter_content(chunk_size):
+                    yield chunk
+            self._release(response, sock, handshakes)
+        except GeneratorExit:
+            # The rest of the response is still waiting on the socket
+            response.close()
+            self.close_sockets()
+            raise
+        except Exception:
+            self._fail(start)
+            raise
+        if self.telemetry:
+            self.telemetry.stop("http", start, error is None)
+        if error:
+            raise RuntimeError(error)
+
     def get(self, url: str, headers: dict = None, timeout: int = 10) -> str:
         """
         Performs a GET request.
@@ -68,25 +290,23 @@ class WiFiManager:
         :return: The response text from the GET request.
         """
         try:
-            response = self.requests.get(url, headers=headers, timeout=timeout)
-            return response.text
+            return self.request("GET", url, headers=headers, timeout=timeout)
         except Exception as e:
             print("GET request failed:", e)
             return None
 
-    def post(self, url: str, data: dict, headers: dict = None, timeout: int = 10) -> str:
+    def post(self, url: str, data, headers: dict = None, timeout: int = 10) -> str:
         """
         Performs a POST request.
 
         :param url: The URL to send the POST request to.
-        :param data: The data to send in the POST request.
+        :param data: The data to send in the POST request, as a dict or a RowStream.
         :param headers: Optional headers to include in the POST request.
         :param timeout: Optional timeout for the request in seconds.
         :return: The response text from the POST request.
         """
         try:
-            response = self.requests.post(url, json=data, headers=headers, timeout=timeout)
-            return response.text
+            return self.request("POST", url, data=data, headers=headers, timeout=timeout)
         except Exception as e:
             print("POST request failed:", e)
-            return None
\ No newline at end of file
+            return None
@@ -0,0 +1,36 @@
+'''
+Runs the tests on the host with the emulator's stand-ins for the CircuitPython
+modules, the same way the emulator runs code.py.
+'''
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# python -m pytest puts the working directory on the path, where the firmware's
+# code.py would be imported by pdb in place of the standard library module
+sys.path[:] = [path for path in sys.path if os.path.abspath(path or '.') != ROOT]
+sys.path.insert(0, os.path.join(ROOT, 'emulator'))
+
+# Importing the emulation puts lib/ and the stand-in modules on the path
+import emulation  # noqa: F401
+import hostsim
+
+hostsim.install()
+
+
+@pytest.fixture
+def sd_card(tmp_path):
+    '''
+    An SD card backed by a temporary directory, syncing every append.
+    '''
+    import board
+    from sdcard import SDCard
+
+    hostsim.storage.directory = str(tmp_path)
+    card = SDCard(board.SPI(), board.SD_CS, '/sd', max_age=0)
+    yield card
+    card.close()
+    hostsim.storage.umount('/sd')
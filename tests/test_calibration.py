@@ -0,0 +1,44 @@
+from array import array
+
+import pytest
+
+from calibration import ADC_COUNTS, ADC_VOLTS, Calibration
+
+
+def test_two_points_are_a_line():
+    calibration = Calibration.from_points([(2.0, 7.0), (1.0, 4.0)])
+    assert calibration.convert(1.0) == pytest.approx(4.0)
+    assert calibration.convert(1.5) == pytest.approx(5.5)
+    # Outside the points the line is extrapolated
+    assert calibration.convert(3.0) == pytest.approx(10.0)
+
+
+def test_each_segment_has_its_own_slope():
+    calibration = Calibration.from_points([(1.0, 4.0), (2.0, 7.0), (2.5, 10.0)])
+    assert calibration.convert(1.5) == pytest.approx(5.5)
+    assert calibration.convert(2.25) == pytest.approx(8.5)
+    # A breakpoint uses the lower segment, which meets the upper one there
+    assert calibration.segment(2.0) == 0
+    assert calibration.convert(2.0) == pytest.approx(7.0)
+    assert calibration.convert(3.0) == pytest.approx(13.0)
+
+
+def test_convert_counts_matches_convert():
+    calibration = Calibration.from_points([(0.5, 1.0), (1.2, 6.0), (2.4, 12.0), (3.0, 13.0)])
+    counts = array('H', [0, 5000, 20000, 30000, 47662, 60000, 65535])
+    values = calibration.convert_counts(counts)
+    for count, value in zip(counts, values):
+        assert value == pytest.approx(calibration.convert(count * ADC_VOLTS / ADC_COUNTS), rel=1e-5)
+
+
+def test_convert_counts_writes_into_an_array():
+    calibration = Calibration.from_points([(0.0, 0.0), (3.3, 33.0)])
+    out = array('f', [0.0] * 2)
+    assert calibration.convert_counts(array('H', [0, 32768]), out) is out
+    assert out[1] == pytest.approx(16.5, rel=1e-5)
+
+
+@pytest.mark.parametrize('points', [[(1.0, 4.0)], [(1.0, 4.0), (1.0, 7.0)]])
+def test_bad_points_are_rejected(points):
+    with pytest.raises(ValueError):
+        Calibration.from_points(points)
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from jsonstream import RowStream, iter_values
+
+
+def chunked(data, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 64, 4096])
+def test_iter_values_parses_rows_across_chunks(size):
+    rows = [['a', '1'], ['b "quoted" ]', '[2]'], [], ['\\\\', 'x\\"y']]
+    document = json.dumps({'range': 'Sheet1!A1:B4', 'majorDimension': 'ROWS', 'values': rows}).encode()
+    assert list(iter_values(chunked(document, size))) == rows
+
+
+def test_iter_values_without_values():
+    assert list(iter_values([b'{"range": "Sheet1!A1:B4", "majorDimension": "ROWS"}'])) == []
+
+
+def test_iter_values_reads_the_whole_response():
+    chunks = iter([b'{"values": [["a"]]', b', "more": 1}', b'\n'])
+    assert list(iter_values(chunks)) == [['a']]
+    assert next(chunks, None) is None
+
+
+def test_row_stream_encodes_the_document():
+    rows = [[1, 'a'], [2, 'b']]
+    stream = RowStream({'range': 'Sheet1!A1'}, rows)
+    assert stream.seek(0, 2) == len(json.dumps({'range': 'Sheet1!A1', 'values': rows}))
+    stream.seek(0)
+    data = b''
+    while True:
+        piece = stream.read(5)
+        if not piece:
+            break
+        data += piece
+    assert json.loads(data) == {'range': 'Sheet1!A1', 'values': rows}
@@ -0,0 +1,53 @@
+from logrotation import LogRotation
+
+
+def make_log(sd_card, **kwargs):
+    return LogRotation(sd_card, 'log_', '.bin', segment_size=8, max_bytes=32, **kwargs)
+
+
+def fill(log, keys):
+    for key in keys:
+        log.append(bytes([key % 256]) * 4, key)
+
+
+def test_segments_rotate_and_the_oldest_are_removed(sd_card):
+    log = make_log(sd_card)
+    fill(log, range(1, 13))
+    # Six segments of two appends were written, and a new one is only started while
+    # a full segment still fits
+    assert log.base == 3
+    assert list(log.keys) == [5, 7, 9, 11]
+    assert log.total == 32
+    assert not sd_card.file_exists(log.path(2))
+    assert sd_card.read_bytes(log.path(3), 0, 8) == bytes([5] * 4 + [6] * 4)
+
+
+def test_manifest_survives_a_restart(sd_card):
+    fill(make_log(sd_card), range(1, 8))
+    log = make_log(sd_card)
+    assert list(log.keys) == [1, 3, 5, 7]
+    assert list(log.sizes) == [8, 8, 8, 4]
+    assert [path for path, _ in log.segments(6)] == [log.path(3), log.path(4)]
+
+
+def test_missing_manifest_is_rebuilt_from_the_directory(sd_card):
+    fill(make_log(sd_card), range(1, 6))
+    sd_card.remove_file('log_manifest.bin')
+    log = make_log(sd_card, first_key=lambda path: sd_card.read_bytes(path, 0, 1)[0])
+    assert list(log.keys) == [1, 3, 5]
+    assert list(log.sizes) == [8, 8, 4]
+
+
+def test_compaction_replaces_one_closed_segment_at_a_time(sd_card):
+    log = make_log(sd_card)
+    fill(log, range(1, 6))
+    halve = lambda path, size: sd_card.read_bytes(path, 0, size // 2)
+    # The second segment holds data up to the start of the third, 5
+    assert not log.compact(halve, 2)
+    assert log.compact(halve, 3)
+    assert log.compact(halve, 5)
+    assert list(log.sizes) == [4, 4, 4]
+    assert log.total == 12
+    # The newest segment is still appended to
+    assert not log.compact(halve, 100)
+    assert list(make_log(sd_card).compacted) == [1, 1, 0]
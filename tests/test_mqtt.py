@@ -0,0 +1,20 @@
+import time
+
+from mqtt import MqttClient
+
+
+def test_idle_connection_expires_after_keepalive():
+    client = MqttClient(None, 'mqtt.local', keepalive=60)
+    assert not client.is_connected()
+    client.socket = object()
+    client.last_sent = time.monotonic()
+    assert client.is_connected()
+    client.last_sent = time.monotonic() - 61
+    assert not client.is_connected()
+
+
+def test_connection_without_keepalive_never_expires():
+    client = MqttClient(None, 'mqtt.local', keepalive=0)
+    client.socket = object()
+    client.last_sent = time.monotonic() - 86400
+    assert client.is_connected()
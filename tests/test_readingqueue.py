@@ -0,0 +1,78 @@
+from readingqueue import ReadingQueue
+
+
+def make_queue(sd_card, rows=()):
+    queue = ReadingQueue(sd_card, 'queue.txt', 'queue.cur')
+    for row in rows:
+        queue.put(row)
+    return queue
+
+
+def test_drain_sends_every_row_in_batches(sd_card):
+    queue = make_queue(sd_card, [[ts, ts * 2] for ts in range(10)])
+    batches = []
+    assert queue.drain(batches.append, max_rows=4) == 10
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert [row for batch in batches for row in batch] == [[ts, ts * 2] for ts in range(10)]
+    assert not queue.pending()
+    assert not sd_card.file_exists('queue.txt')
+
+
+def test_failed_send_keeps_the_rows(sd_card):
+    queue = make_queue(sd_card, [[ts] for ts in range(6)])
+    sent = []
+
+    def send(rows):
+        if sent:
+            raise OSError('offline')
+        sent.append(rows)
+
+    try:
+        queue.drain(send, max_rows=3)
+    except OSError:
+        pass
+    assert sent == [[[0], [1], [2]]]
+    # The cursor survives a restart
+    queue = make_queue(sd_card)
+    rows = []
+    assert queue.drain(rows.extend) == 3
+    assert rows == [[3], [4], [5]]
+
+
+def test_consumers_keep_their_own_offsets(sd_card):
+    queue = make_queue(sd_card, [[ts] for ts in range(4)])
+    sheets = []
+    assert queue.drain(sheets.extend, consumer='sheets') == 4
+    try:
+        queue.drain(lambda rows: 1 / 0, consumer='mqtt')
+    except ZeroDivisionError:
+        pass
+    queue.release(['sheets', 'mqtt'])
+    assert queue.pending()
+
+    queue.put([4])
+    queue = ReadingQueue(sd_card, 'queue.txt', 'queue.cur', queue.state())
+    sheets_again = []
+    mqtt = []
+    queue.drain(sheets_again.extend, consumer='sheets')
+    queue.drain(mqtt.extend, consumer='mqtt')
+    queue.release(['sheets', 'mqtt'])
+    assert sheets_again == [[4]]
+    assert mqtt == [[0], [1], [2], [3], [4]]
+    assert not queue.pending()
+
+
+def test_release_without_consumers_clears_the_queue(sd_card):
+    queue = make_queue(sd_card, [[ts] for ts in range(3)])
+    queue.release([])
+    assert not queue.pending()
+    assert not sd_card.file_exists('queue.txt')
+
+
+def test_corrupt_lines_are_skipped(sd_card):
+    queue = make_queue(sd_card, [[1]])
+    sd_card.append_file('queue.txt', '{not json\n')
+    queue.put([2])
+    rows = []
+    assert queue.drain(rows.extend) == 2
+    assert rows == [[1], [2]]
@@ -0,0 +1,53 @@
+from recordlog import FLAG_DEPTH, FLAG_PH, FLAG_TEMPERATURE, RECORD_SIZE, RecordLog
+
+ALL = FLAG_PH | FLAG_DEPTH | FLAG_TEMPERATURE
+
+
+def fill(log, start, count, step=10):
+    for number in range(count):
+        log.append(start + number * step, 1000 + number, 2000 + number, 20 + number / 100)
+    log.flush()
+
+
+def test_query_returns_the_records_in_range(sd_card):
+    log = RecordLog(sd_card, buffer_records=4)
+    fill(log, 1000, 50)
+    records = list(log.query(1100, 1190))
+    assert [record[0] for record in records] == list(range(1100, 1200, 10))
+    assert records[0] == (1100, 1010, 2010, 20.1, ALL)
+
+
+def test_missing_values_are_flagged(sd_card):
+    log = RecordLog(sd_card)
+    log.append(1000, ph_counts=5)
+    log.append(1010, temperature=-1.5)
+    assert list(log.query(0, 2000)) == [(1000, 5, 0, 0, FLAG_PH), (1010, 0, 0, -1.5, FLAG_TEMPERATURE)]
+
+
+def test_query_spans_segments_and_restarts(sd_card):
+    log = RecordLog(sd_card, segment_size=RECORD_SIZE * 8, buffer_records=4)
+    fill(log, 1000, 40)
+    assert len(log.rotation.sizes) == 5
+    log = RecordLog(sd_card, segment_size=RECORD_SIZE * 8, buffer_records=4)
+    assert [record[0] for record in log.query(1075, 1165)] == list(range(1080, 1170, 10))
+
+
+def test_oldest_segments_are_removed_past_max_bytes(sd_card):
+    log = RecordLog(sd_card, segment_size=RECORD_SIZE * 8, max_bytes=RECORD_SIZE * 24, buffer_records=4)
+    fill(log, 1000, 40)
+    timestamps = [record[0] for record in log.query(0, 5000)]
+    assert timestamps == list(range(timestamps[0], 1400, 10))
+    assert log.rotation.total <= RECORD_SIZE * 24
+
+
+def test_compaction_keeps_the_mean_of_each_bucket(sd_card):
+    log = RecordLog(sd_card, segment_size=RECORD_SIZE * 12, compact_bucket=50, buffer_records=4)
+    fill(log, 1200, 24)
+    assert log.compact(1200 + 24 * 10)
+    records = list(log.query(0, 5000))
+    # The first segment of 12 records became 3 records of 5, 5 and 2, the second is untouched
+    assert [record[0] for record in records[:4]] == [1200, 1250, 1300, 1320]
+    assert records[0] == (1200, 1002, 2002, 20.02, ALL)
+    assert len(records) == 15
+    # The newest segment is never compacted
+    assert not log.compact(10000)
@@ -0,0 +1,70 @@
+import random
+import statistics
+
+import pytest
+
+from alarmmonitor import AlarmMonitor
+from rollingstats import RollingStats
+
+
+def test_window_statistics_match_a_full_computation():
+    generator = random.Random(1)
+    stats = RollingStats(8)
+    values = []
+    for timestamp in range(100):
+        value = generator.uniform(5, 7)
+        stats.add(timestamp, value)
+        values.append(value)
+        window = values[-8:]
+        assert stats.count() == len(window)
+        assert stats.mean == pytest.approx(statistics.fmean(window), abs=1e-4)
+        if len(window) > 1:
+            assert stats.variance() == pytest.approx(statistics.variance(window), abs=1e-4)
+        assert stats.low() == pytest.approx(min(window), abs=1e-6)
+        assert stats.high() == pytest.approx(max(window), abs=1e-6)
+
+
+def test_empty_and_single_value_window():
+    stats = RollingStats(4)
+    assert stats.low() is None and stats.high() is None and stats.oldest() is None
+    stats.add(10, 2.5)
+    assert stats.variance() == 0.0
+    assert stats.oldest() == (10, 2.5)
+
+
+def test_state_restores_the_window():
+    stats = RollingStats(4)
+    for timestamp in range(6):
+        stats.add(timestamp, timestamp * 1.5)
+    restored = RollingStats(4)
+    restored.restore(stats.state())
+    assert restored.state() == stats.state() == [[2, 3.0], [3, 4.5], [4, 6.0], [5, 7.5]]
+    assert restored.oldest() == (2, 3.0)
+    assert restored.std() == pytest.approx(stats.std())
+
+
+def test_alarm_is_raised_once_and_cleared_after_clear_samples():
+    monitor = AlarmMonitor(['ph'], window=5, low=[5.0], clear_samples=2)
+    assert monitor.update(0, [6.0]) == []
+    assert monitor.update(60, [4.5]) == [('ph', 'low', True, 4.5, 5.0)]
+    assert monitor.update(120, [4.4]) == []
+    assert monitor.update(180, [6.0]) == []
+    assert monitor.update(240, [6.0]) == [('ph', 'low', False, 6.0, None)]
+
+
+def test_rate_and_zscore_alarms():
+    monitor = AlarmMonitor(['depth'], window=10, rate=[0.1], zscore=4, noise=[0.05])
+    for minute in range(10):
+        assert monitor.update(minute * 60, [8.0]) == []
+    # 2 inches down over the 10 minutes of the window, and 40 noise levels from the mean
+    kinds = {kind for _, kind, raised, _, _ in monitor.update(600, [6.0]) if raised}
+    assert kinds == {'rate', 'zscore'}
+
+
+def test_set_limits_does_not_change_the_callers_lists():
+    low = [5.0, None]
+    monitor = AlarmMonitor(['ph', 'depth'], low=low)
+    monitor.set_limits('ph', 4.0, 8.0)
+    assert low == [5.0, None]
+    assert monitor.update(0, [4.5, 1.0]) == []
+    assert monitor.update(60, [8.5, 1.0]) == [('ph', 'high', True, 8.5, 8.0)]
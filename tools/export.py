@@ -0,0 +1,285 @@
+'''
+Exports the sample log of a monitor's SD card with the raw ADC counts converted
+by the current calibration, so past data can be corrected after a probe is
+recalibrated.
+
+    python tools/export.py /media/SD --output samples.csv
+    python tools/export.py /media/SD --output samples.parquet --start 1717200000
+    python tools/export.py /media/SD --ph-calibration new_ph.json --sheets settings.toml
+
+The segments of the sample log (samples_NNNN.bin) are read into NumPy arrays,
+and every sample is converted at once: the calibration segment of each count is
+found with np.searchsorted over the breakpoints of the piecewise linear
+calibration, the same segments Calibration.convert_counts uses on the board.
+The calibration files are those of the SD card unless others are given.
+
+The result is written as CSV, as Parquet (with pyarrow installed), or appended
+to a tab of the sheet in large batches with the service account of a
+settings.toml.
+
+    pip install -r emulator/requirements.txt numpy pyarrow
+'''
+import argparse
+import json
+import os
+import sys
+import tomllib
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'emulator'))
+
+# Puts lib/ and the stand-ins of the CircuitPython modules it imports on the path, and
+# makes adafruit_jwt hash with adafruit_hashlib as on the board
+import emulation
+from calibration import Calibration
+from recordlog import RECORD_SIZE, FLAG_PH, FLAG_DEPTH, FLAG_TEMPERATURE
+
+# The records of recordlog.RECORD_FORMAT
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<u4'),
+    ('ph_counts', '<u2'),
+    ('depth_counts', '<u2'),
+    ('centidegrees', '<i2'),
+    ('flags', 'u1'),
+    ('padding', 'V1')
+])
+assert RECORD_DTYPE.itemsize == RECORD_SIZE
+
+# The keys of the calibration files saved before N-point calibration was supported:
+# the breakpoint, and the slope and intercept of the segment above and below it
+LEGACY_KEYS = {
+    'ph': ('voltage_7', 'slope_7_10', 'slope_4_7', 'intercept_7_10', 'intercept_4_7'),
+    'depth': ('voltage_6', 'slope_6_12', 'slope_1_6', 'intercept_6_12', 'intercept_1_6')
+}
+
+COLUMNS = ['timestamp', 'temperature', 'depth', 'ph']
+
+
+def read_records(sd_directory: str, prefix: str = 'samples_') -> np.ndarray:
+    '''
+    Reads every record of the sample log.
+
+    :param sd_directory: The directory holding a copy of the SD card.
+    :param prefix: The start of the file names of the segments.
+    :return: A structured array of RECORD_DTYPE in order of time, without empty records.
+    '''
+    numbers = []
+    for name in os.listdir(sd_directory):
+        number = name[len(prefix):-len('.bin')]
+        if name.startswith(prefix) and name.endswith('.bin') and number.isdigit():
+            numbers.append(int(number))
+    blocks = []
+    for number in sorted(numbers):
+        with open(os.path.join(sd_directory, f'{prefix}{number:04d}.bin'), 'rb') as file:
+            data = file.read()
+        # A record cut short by a reset ends its segment
+        blocks.append(np.frombuffer(data, RECORD_DTYPE, len(data) // RECORD_SIZE))
+    records = np.concatenate(blocks) if blocks else np.zeros(0, RECORD_DTYPE)
+    records = records[records['flags'] != 0]
+    if np.any(np.diff(records['timestamp'].astype(np.int64)) < 0):
+        records = records[np.argsort(records['timestamp'], kind='stable')]
+    return records
+
+
+def load_calibration(path: str, sensor: str) -> Calibration:
+    '''
+    Loads a calibration file saved by the PhSensor or WaterDepthSensor class.
+
+    :param path: The path of the calibration file.
+    :param sensor: 'ph' or 'depth', for the keys of calibration files in the original format.
+    :return: The calibration.
+    '''
+    with open(path) as file:
+        data = json.load(file)
+    if 'points' in data:
+        return Calibration.from_points(data['points'])
+    voltage, slope_high, slope_low, intercept_high, intercept_low = (data[key] for key in LEGACY_KEYS[sensor])
+    return Calibration([voltage], [slope_high, slope_low], [intercept_high, intercept_low])
+
+
+def convert_counts(calibration: Calibration, counts: np.ndarray) -> np.ndarray:
+    '''
+    Converts raw ADC counts to calibrated values, like Calibration.convert_counts
+    but for every count at once.
+
+    :param calibration: The calibration.
+    :param counts: An array of raw ADC counts.
+    :return: An array of the calibrated values.
+    '''
+    counts = counts.astype(np.float64)
+    # A count equal to a breakpoint uses the lower segment, as on the board
+    segments = np.searchsorted(np.array(calibration.count_breaks), counts, side='left')
+    return np.array(calibration.count_slopes)[segments] * counts + np.array(calibration.intercepts)[segments]
+
+
+def convert(records: np.ndarray, ph_calibration: Calibration, depth_calibration: Calibration) -> dict:
+    '''
+    Converts records to readings.
+
+    :param records: A structured array of RECORD_DTYPE.
+    :param ph_calibration: The calibration of the pH sensor.
+    :param depth_calibration: The calibration of the water depth sensor.
+    :return: A dictionary of an array for each of COLUMNS, with NaN for missing values.
+    '''
+    flags = records['flags']
+    return {
+        'timestamp': records['timestamp'].astype(np.int64),
+        'temperature': np.where(flags & FLAG_TEMPERATURE, records['centidegrees'] / 100, np.nan),
+        'depth': np.where(flags & FLAG_DEPTH, convert_counts(depth_calibration, records['depth_counts']), np.nan),
+        'ph': np.where(flags & FLAG_PH, convert_counts(ph_calibration, records['ph_counts']), np.nan)
+    }
+
+
+def format_rows(readings: dict, formula: bool = False):
+    '''
+    Formats readings as rows of strings with two decimals, like the rows of the board.
+
+    :param readings: A dictionary returned by convert.
+    :param formula: Whether to add the date formula of the sheet after the timestamp.
+    :return: A generator of rows, with '' for missing values.
+    '''
+    columns = [readings[name].tolist() for name in COLUMNS]
+    for timestamp, *values in zip(*columns):
+        row = [timestamp]
+        if formula:
+            row.append(f'=EPOCHTODATE({timestamp} - 28800)')
+        row.extend('' if value != value else f'{value:.2f}' for value in values)
+        yield row
+
+
+def write_csv(readings: dict, path: str) -> None:
+    '''
+    Writes readings to a CSV file.
+
+    :param readings: A dictionary returned by convert.
+    :param path: The path of the file.
+    '''
+    with open(path, 'w') as file:
+        file.write(','.join(COLUMNS) + '\n')
+        for row in format_rows(readings):
+            file.write(','.join(map(str, row)) + '\n')
+
+
+def write_parquet(readings: dict, path: str) -> None:
+    '''
+    Writes readings to a Parquet file, with nulls for missing values.
+
+    :param readings: A dictionary returned by convert.
+    :param path: The path of the file.
+    '''
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit('Writing Parquet needs pyarrow: pip install pyarrow')
+    pyarrow.parquet.write_table(pyarrow.table({
+        name: pyarrow.array(values, from_pandas=True) for name, values in readings.items()
+    }), path)
+
+
+class HostHttp:
+    '''
+    The requests GoogleSheetsManager makes through WiFiManager, made with urllib
+    on the host.
+    '''
+
+    def post(self, url: str, data, headers: dict = None, timeout: int = 60) -> str:
+        '''
+        Performs a POST request.
+
+        :param url: The URL to send the POST request to.
+        :param data: The data to send, as a dict or a RowStream.
+        :param headers: Optional headers to include in the POST request.
+        :param timeout: Optional timeout for the request in seconds.
+        :return: The response text, or None if the request failed.
+        '''
+        body = data.read() if hasattr(data, 'read') else json.dumps(data).encode()
+        headers = dict(headers or {})
+        headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(url, body, headers, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.read().decode()
+        except urllib.error.HTTPError as e:
+            return e.read().decode()
+        except OSError as e:
+            print('POST request failed:', e)
+            return None
+
+
+def upload(readings: dict, settings_path: str, tab: str = None, batch_size: int = 5000) -> int:
+    '''
+    Appends readings to a tab of the sheet of a settings.toml.
+
+    :param readings: A dictionary returned by convert.
+    :param settings_path: The path of the settings.toml with the sheet and service account.
+    :param tab: The name of the tab, "<GOOGLE_SHEETS_TAB_ID>_backfill" by default.
+    :param batch_size: The number of rows appended with each request.
+    :return: The number of rows appended.
+    '''
+    from googlesheetsmanager import GoogleSheetsManager
+    with open(settings_path, 'rb') as file:
+        settings = tomllib.load(file)
+    gsm = GoogleSheetsManager(
+        HostHttp(),
+        settings['GOOGLE_SERVICE_ACCOUNT_PRIVATE_KEY'],
+        settings['GOOGLE_SERVICE_ACCOUNT_EMAIL'],
+        settings['GOOGLE_SERVICE_ACCOUNT_KID']
+    )
+    tab = tab or f'{settings.get("GOOGLE_SHEETS_TAB_ID", "Sheet1")}_backfill'
+    sent = 0
+    batch = []
+    for row in format_rows(readings, formula=True):
+        batch.append(row)
+        if len(batch) == batch_size:
+            gsm.append_rows(settings['GOOGLE_SHEETS_ID'], tab, batch)
+            sent += len(batch)
+            batch = []
+    if batch:
+        gsm.append_rows(settings['GOOGLE_SHEETS_ID'], tab, batch)
+        sent += len(batch)
+    return sent
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Export the sample log of an SD card with recalibrated values.')
+    parser.add_argument('sd', help='directory holding a copy of the SD card')
+    parser.add_argument('--output', help='CSV or Parquet file to write, by its extension')
+    parser.add_argument('--ph-calibration', help='pH calibration file, ph_calibration.json of the SD card by default')
+    parser.add_argument('--depth-calibration',
+                        help='water depth calibration file, water_depth_calibration.json of the SD card by default')
+    parser.add_argument('--start', type=int, help='first time to export in seconds since the epoch')
+    parser.add_argument('--end', type=int, help='last time to export in seconds since the epoch')
+    parser.add_argument('--sheets', metavar='SETTINGS', help='settings.toml of the sheet to append the readings to')
+    parser.add_argument('--tab', help='tab to append to, <GOOGLE_SHEETS_TAB_ID>_backfill by default')
+    args = parser.parse_args()
+    if not args.output and not args.sheets:
+        parser.error('nothing to do, give --output and/or --sheets')
+
+    records = read_records(args.sd)
+    timestamps = records['timestamp']
+    first = np.searchsorted(timestamps, args.start, side='left') if args.start is not None else 0
+    last = np.searchsorted(timestamps, args.end, side='right') if args.end is not None else len(records)
+    records = records[first:last]
+    readings = convert(
+        records,
+        load_calibration(args.ph_calibration or os.path.join(args.sd, 'ph_calibration.json'), 'ph'),
+        load_calibration(args.depth_calibration or os.path.join(args.sd, 'water_depth_calibration.json'), 'depth')
+    )
+    print(f'{len(records)} samples', file=sys.stderr)
+
+    if args.output:
+        if args.output.endswith('.parquet'):
+            write_parquet(readings, args.output)
+        else:
+            write_csv(readings, args.output)
+        print('Wrote', args.output, file=sys.stderr)
+    if args.sheets:
+        print('Appended', upload(readings, args.sheets, args.tab), 'rows', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()